@@ -0,0 +1,172 @@
+"""
+Codec micro-benchmarks.
+
+Measures the throughput of the engine.io/socket.io packet codecs and of
+`hexiify` on payloads captured from BtleJuice sessions (proxy events with
+20-byte and 244-byte characteristic values, scan results, polling payloads
+batching several packets). Results are written as JSON so that runs from
+different commits can be compared with --compare.
+"""
+import argparse
+import sys
+import timeit
+
+from btlejuice.socketIO_client.parsers import (
+    Buffer, decode_engineIO_content, encode_engineIO_content,
+    format_socketIO_binary_packet_data, get_namespace_path,
+    parse_socketIO_packet_data, _data_is_binary
+)
+from btlejuice.utils import hexiify
+
+from results import compare, write_report
+
+
+VALUE = b'\x01\x10Temperature 21.5C\x00'
+LONG_VALUE = bytes(bytearray(i % 0x60 + 0x20 for i in range(244)))
+
+# socket.io packet data as received from the core (type prefix stripped)
+PROXY_READ = b'2["proxy_read","180f","2a19",0]'
+PROXY_WRITE = (
+    b'2["proxy_write","fff0","fff1",{"_placeholder":true,"num":0},0,false]')
+PERIPHERAL = b'2["peripheral","c0:ff:ee:00:00:2a","BtleJuice Mock",-61]'
+PROFILE = (
+    b'2["profile",{"address":"aa:bb:cc:dd:ee:ff","name":"BtleJuice Mock",'
+    b'"services":[{"uuid":"180f","characteristics":[{"uuid":"2a19",'
+    b'"properties":["read","write","notify"]}]},{"uuid":"fff0",'
+    b'"characteristics":[{"uuid":"fff1","properties":["read","write",'
+    b'"notify"]},{"uuid":"fff4","properties":["read","write","notify"]}]}]}]'
+)
+NAMESPACED = b'/btlejuice,2["proxy_read","180f","2a19",0]'
+
+# Polling payload batching scan results and proxy events
+POLLING_PACKETS = [
+    (4, '2["peripheral","c0:ff:ee:00:00:%02x","device-%d",-6%d]' % (i, i, i % 10))
+    for i in range(8)
+] + [
+    (4, PROXY_READ.decode('utf-8')),
+    (4, PROFILE.decode('utf-8')),
+    (3, ''),
+]
+POLLING_CONTENT = bytes(encode_engineIO_content(POLLING_PACKETS))
+
+DATA_ARGS = ['proxy_data', 'fff0', 'fff4', Buffer(VALUE)]
+LONG_DATA_ARGS = ['proxy_data', 'fff0', 'fff4', Buffer(LONG_VALUE)]
+WRITE_RESP_ARGS = ['proxy_write_resp', 'fff0', 'fff1', None]
+
+
+def _decode(content):
+    for packet in decode_engineIO_content(content):
+        pass
+
+
+# name: (function, argument tuple, bytes processed per call)
+CODECS = {
+    'decode_engineIO_content': (
+        _decode, (POLLING_CONTENT,), len(POLLING_CONTENT)),
+    'encode_engineIO_content': (
+        encode_engineIO_content, (POLLING_PACKETS,), len(POLLING_CONTENT)),
+    'parse_socketIO_packet_data/proxy_read': (
+        parse_socketIO_packet_data, (PROXY_READ[1:],), len(PROXY_READ) - 1),
+    'parse_socketIO_packet_data/proxy_write': (
+        parse_socketIO_packet_data, (PROXY_WRITE[1:],), len(PROXY_WRITE) - 1),
+    'parse_socketIO_packet_data/peripheral': (
+        parse_socketIO_packet_data, (PERIPHERAL[1:],), len(PERIPHERAL) - 1),
+    'parse_socketIO_packet_data/profile': (
+        parse_socketIO_packet_data, (PROFILE[1:],), len(PROFILE) - 1),
+    'format_socketIO_binary_packet_data/20': (
+        format_socketIO_binary_packet_data, ('', None, DATA_ARGS), len(VALUE)),
+    'format_socketIO_binary_packet_data/244': (
+        format_socketIO_binary_packet_data, ('', None, LONG_DATA_ARGS),
+        len(LONG_VALUE)),
+    'get_namespace_path/default': (
+        get_namespace_path, (PROXY_WRITE[1:],), len(PROXY_WRITE) - 1),
+    'get_namespace_path/namespaced': (
+        get_namespace_path, (NAMESPACED,), len(NAMESPACED)),
+    '_data_is_binary/binary': (_data_is_binary, (DATA_ARGS,), 0),
+    '_data_is_binary/text': (_data_is_binary, (WRITE_RESP_ARGS,), 0),
+    'hexiify/20': (hexiify, (VALUE,), len(VALUE)),
+    'hexiify/244': (hexiify, (LONG_VALUE,), len(LONG_VALUE)),
+}
+
+
+def run_codec(name, duration, repeat):
+    """
+    Time a codec and return its result, keeping the best of `repeat` runs
+    of about `duration` seconds each.
+    """
+    function, args, size = CODECS[name]
+    timer = timeit.Timer(lambda: function(*args))
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * duration / elapsed))
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {
+        'codec': name,
+        'calls': number,
+        'ns_per_call': best * 1e9,
+        'ops_per_sec': 1.0 / best,
+        'mb_per_sec': size / best / 1e6,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Codec micro-benchmarks')
+    parser.add_argument(
+        '--codec',
+        type=str,
+        dest='codecs',
+        action='append',
+        choices=sorted(CODECS),
+        help='Codec to run (default: all)'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        dest='duration',
+        default=0.2,
+        help='Duration of each timing run'
+    )
+    parser.add_argument(
+        '--repeat',
+        '-r',
+        type=int,
+        dest='repeat',
+        default=5,
+        help='Timing runs per codec (the best one is kept)'
+    )
+    parser.add_argument(
+        '--output',
+        '-o',
+        type=str,
+        dest='output',
+        default=None,
+        help='Write results to this JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        dest='compare',
+        default=None,
+        help='Compare throughput with a previous JSON results file'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        dest='threshold',
+        default=0.1,
+        help='Throughput drop ratio reported as a regression'
+    )
+    args = parser.parse_args()
+
+    results = []
+    for name in args.codecs or sorted(CODECS):
+        result = run_codec(name, args.duration, args.repeat)
+        results.append(result)
+        print('%-42s %10.0f ns/call %12.0f calls/s %8.2f MB/s' % (
+            name, result['ns_per_call'], result['ops_per_sec'],
+            result['mb_per_sec']))
+
+    if args.output:
+        write_report(args.output, results, duration=args.duration, repeat=args.repeat)
+    if args.compare:
+        if compare(results, args.compare, ('codec',), 'ops_per_sec', args.threshold):
+            sys.exit(1)
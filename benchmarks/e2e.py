@@ -0,0 +1,228 @@
+"""
+End-to-end throughput and latency benchmark.
+
+Runs sniffing and hooking interfaces against a local core stand-in
+(`btlejuice.mockcore`) over each transport, and reports events per second and
+request/response latency percentiles. Results are written as JSON so that runs
+from different commits can be compared with --compare.
+"""
+import argparse
+import sys
+import time
+
+from btlejuice import (
+    BtleJuiceApp, SniffingInterface, HookingInterface, HookModify,
+    HookForceResponse
+)
+from btlejuice.mockcore import MockCore
+from btlejuice.mockcore.core import RESPONSES
+
+from results import compare, write_report
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+TRANSPORTS = {
+    'websocket': ['websocket'],
+    'polling': ['xhr-polling'],
+}
+
+
+class PassThroughSniffer(SniffingInterface):
+    """
+    Sniffing interface forwarding everything.
+    """
+
+    def __init__(self, host, port, target):
+        SniffingInterface.__init__(self, host, port, target)
+        self.ready = False
+        self.devices_found = 0
+
+    def proxy_ready(self):
+        self.ready = True
+
+    def device_found(self, device, name, rssi):
+        self.devices_found += 1
+        SniffingInterface.device_found(self, device, name, rssi)
+
+    def on_data_write(self, service, characteristic, data, offset, withoutResponse):
+        pass
+
+
+class ModifyingHooks(HookingInterface):
+    """
+    Hooking interface modifying read responses and notifications.
+    """
+
+    def __init__(self, host, port, target):
+        HookingInterface.__init__(self, host, port, target)
+        self.ready = False
+
+    def proxy_ready(self):
+        self.ready = True
+
+    def on_after_read(self, service, characteristic, data):
+        raise HookModify(data[::-1])
+
+    def on_before_notification(self, service, characteristic, data):
+        raise HookModify(data[::-1])
+
+
+class ForcingHooks(ModifyingHooks):
+    """
+    Hooking interface answering reads without forwarding them.
+    """
+
+    def on_before_read(self, service, characteristic, offset):
+        raise HookForceResponse(b'\x64')
+
+
+# name: (interface class, generated events, payload size)
+SCENARIOS = {
+    'sniffing': (PassThroughSniffer, ('proxy_read', 'proxy_write', 'data'), 20),
+    'hook_modify': (ModifyingHooks, ('proxy_read', 'data'), 20),
+    'forced_response': (ForcingHooks, ('proxy_read',), 20),
+    'scan_flood': (PassThroughSniffer, ('peripheral',), 20),
+    'binary_notifications': (PassThroughSniffer, ('data',), 244),
+}
+
+
+def wait_for(condition, timeout):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def run_scenario(name, transport, count, rate, timeout):
+    """
+    Run a scenario and return its result.
+    """
+    Interface, events, payload_size = SCENARIOS[name]
+    core = MockCore(port=0, payload_size=payload_size)
+    core.start()
+    interface = Interface('127.0.0.1', core.port, TARGET)
+    app = BtleJuiceApp(interface, transports=TRANSPORTS[transport])
+    app.daemon = True
+    app.start()
+    try:
+        if not wait_for(lambda: interface.ready, timeout):
+            raise RuntimeError('proxy not ready')
+        core.reset_stats()
+        interface.devices_found = 0
+
+        def done():
+            if 'peripheral' in events:
+                return interface.devices_found >= count
+            received = core.stats()['received']
+            return all(
+                received.get(RESPONSES[event], 0) >= count for event in events)
+
+        started = time.time()
+        core.start_load(dict((event, rate) for event in events), count=count)
+        completed = wait_for(done, timeout)
+        elapsed = time.time() - started
+        stats = core.stats()
+    finally:
+        app.cancel()
+        app.join()
+        app.client.disconnect()
+        core.stop()
+    total = count * len(events)
+    return {
+        'scenario': name,
+        'transport': transport,
+        'events': total,
+        'completed': completed,
+        'elapsed': elapsed,
+        'events_per_sec': total / elapsed if elapsed else 0,
+        'latency': stats['latency'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end benchmark')
+    parser.add_argument(
+        '--scenario',
+        type=str,
+        dest='scenarios',
+        action='append',
+        choices=sorted(SCENARIOS),
+        help='Scenario to run (default: all)'
+    )
+    parser.add_argument(
+        '--transport',
+        type=str,
+        dest='transports',
+        action='append',
+        choices=sorted(TRANSPORTS),
+        help='Transport to use (default: all)'
+    )
+    parser.add_argument(
+        '--count',
+        '-n',
+        type=int,
+        dest='count',
+        default=1000,
+        help='Events per event type'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        dest='rate',
+        default=0,
+        help='Events per second per event type (0 for as fast as possible)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        dest='timeout',
+        default=60,
+        help='Maximum duration of a scenario'
+    )
+    parser.add_argument(
+        '--output',
+        '-o',
+        type=str,
+        dest='output',
+        default=None,
+        help='Write results to this JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        dest='compare',
+        default=None,
+        help='Compare throughput with a previous JSON results file'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        dest='threshold',
+        default=0.1,
+        help='Throughput drop ratio reported as a regression'
+    )
+    args = parser.parse_args()
+
+    results = []
+    for transport in args.transports or sorted(TRANSPORTS):
+        for scenario in args.scenarios or sorted(SCENARIOS):
+            result = run_scenario(
+                scenario, transport, args.count, args.rate, args.timeout)
+            results.append(result)
+            latencies = ' '.join(
+                '%s p50=%.2fms p99=%.2fms' % (
+                    event, summary['p50'] / 1e6, summary['p99'] / 1e6)
+                for event, summary in sorted(result['latency'].items())
+            )
+            print('%-22s %-10s %9.0f events/s %s%s' % (
+                scenario, transport, result['events_per_sec'], latencies,
+                '' if result['completed'] else ' (timed out)'))
+
+    if args.output:
+        write_report(args.output, results, count=args.count, rate=args.rate)
+    if args.compare:
+        keys = ('scenario', 'transport')
+        if compare(results, args.compare, keys, 'events_per_sec', args.threshold):
+            sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+Time-to-first-event benchmark.
+
+Measures the time between the creation of a socket.io client and the
+reception of the first event sent by the BtleJuice core, for the default
+polling handshake + websocket upgrade and for the direct websocket connect.
+"""
+import argparse
+import time
+
+from btlejuice.socketIO_client import SocketIO, BaseNamespace
+
+
+class FirstEventNamespace(BaseNamespace):
+    """
+    Records the time the first event is received.
+    """
+
+    def initialize(self):
+        self.received_at = None
+
+    def on_event(self, event, *args):
+        if self.received_at is None:
+            self.received_at = time.time()
+
+
+def measure(host, port, transports, timeout):
+    """
+    Connect, ask the core for its status and return the elapsed time (in
+    seconds) until the first event is received, or None on timeout.
+    """
+    started_at = time.time()
+    client = SocketIO(host, port, FirstEventNamespace, transports=transports)
+    namespace = client.get_namespace()
+    client.emit('status')
+    while namespace.received_at is None:
+        if time.time() - started_at > timeout:
+            break
+        client.wait(seconds=0.01)
+    client.disconnect()
+    if namespace.received_at is None:
+        return None
+    return namespace.received_at - started_at
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time-to-first-event benchmark')
+    parser.add_argument(
+        '--server', '-s',
+        type=str,
+        dest='server',
+        default='localhost',
+        help='Btlejuice server'
+    )
+    parser.add_argument(
+        '--port',
+        '-p',
+        type=int,
+        dest='port',
+        default=8080,
+        help='Btlejuice service port'
+    )
+    parser.add_argument(
+        '--rounds',
+        '-n',
+        type=int,
+        dest='rounds',
+        default=10,
+        help='Number of connections per transport mode'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        dest='timeout',
+        default=5.0,
+        help='Maximum time to wait for the first event'
+    )
+    args = parser.parse_args()
+    modes = [
+        ('polling+upgrade', ['xhr-polling', 'websocket']),
+        ('websocket-only', ['websocket']),
+    ]
+    for name, transports in modes:
+        samples = []
+        for i in range(args.rounds):
+            elapsed = measure(args.server, args.port, transports, args.timeout)
+            if elapsed is not None:
+                samples.append(elapsed)
+        if samples:
+            samples.sort()
+            print('%-16s min=%.2fms median=%.2fms max=%.2fms (%d/%d)' % (
+                name,
+                samples[0] * 1000,
+                samples[len(samples) // 2] * 1000,
+                samples[-1] * 1000,
+                len(samples),
+                args.rounds
+            ))
+        else:
+            print('%-16s no event received' % name)
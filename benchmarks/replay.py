@@ -0,0 +1,138 @@
+"""
+Capture replay benchmark.
+
+Replays a capture (or a synthesized one) as fast as possible through the
+loopback transport into a sniffing or hooking interface, and reports the
+core events dispatched per second. Results are written as JSON so that runs
+from different commits can be compared with --compare.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from btlejuice import BtleJuiceApp, HookingInterface, SniffingInterface
+from btlejuice.capture import CaptureWriter, Replayer
+from btlejuice.socketIO_client import LoopbackTransport
+
+from results import compare, write_report
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+INTERFACES = {
+    'sniffing': SniffingInterface,
+    'hooking': HookingInterface,
+}
+
+
+def synthesize(path, count, size):
+    """
+    Write a capture of `count` reads, writes and notifications.
+    """
+    characteristics = [('fff0', 'fff%d' % i) for i in range(4)]
+    with CaptureWriter(path, buffer_size=1 << 20) as writer:
+        writer.connect('11:22:33:44:55:66', timestamp=1)
+        for i in range(count):
+            service, characteristic = characteristics[i % len(characteristics)]
+            value = os.urandom(size)
+            if i % 3 == 0:
+                writer.read(service, characteristic, value, timestamp=i + 2)
+            elif i % 3 == 1:
+                writer.write(service, characteristic, value, timestamp=i + 2)
+            else:
+                writer.notification(service, characteristic, value, timestamp=i + 2)
+
+
+def run_replay(path, interface, speed):
+    transport = LoopbackTransport()
+    app = BtleJuiceApp(
+        INTERFACES[interface]('localhost', 8080, TARGET), transports=[transport])
+    try:
+        result = Replayer(path, speed).replay(app, transport)
+    finally:
+        app.client.disconnect()
+    result['interface'] = interface
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Capture replay benchmark')
+    parser.add_argument(
+        '--capture',
+        type=str,
+        dest='capture',
+        default=None,
+        help='Capture to replay (default: a synthesized capture)'
+    )
+    parser.add_argument(
+        '--count',
+        '-n',
+        type=int,
+        dest='count',
+        default=100000,
+        help='Records of the synthesized capture'
+    )
+    parser.add_argument(
+        '--size',
+        type=int,
+        dest='size',
+        default=20,
+        help='Payloads size of the synthesized capture'
+    )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        dest='speed',
+        default=0,
+        help='Replay speed (1 for real time, 0 for as fast as possible)'
+    )
+    parser.add_argument(
+        '--interface',
+        type=str,
+        dest='interfaces',
+        action='append',
+        choices=sorted(INTERFACES),
+        help='Interface to replay to (default: all)'
+    )
+    parser.add_argument(
+        '--output',
+        '-o',
+        type=str,
+        dest='output',
+        default=None,
+        help='Write results to this JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        dest='compare',
+        default=None,
+        help='Compare throughput with a previous JSON results file'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        dest='threshold',
+        default=0.1,
+        help='Throughput drop ratio reported as a regression'
+    )
+    args = parser.parse_args()
+
+    path = args.capture
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'replay.bjc')
+        synthesize(path, args.count, args.size)
+
+    results = []
+    for interface in args.interfaces or sorted(INTERFACES):
+        result = run_replay(path, interface, args.speed)
+        results.append(result)
+        print('%-10s %8d records %9d events %8.2f s %10.0f events/s' % (
+            interface, result['records'], result['events'], result['elapsed'],
+            result['events_per_sec']))
+
+    if args.output:
+        write_report(args.output, results, speed=args.speed)
+    if args.compare:
+        if compare(results, args.compare, ('interface',), 'events_per_sec', args.threshold):
+            sys.exit(1)
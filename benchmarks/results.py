@@ -0,0 +1,56 @@
+"""
+Benchmark results helpers.
+
+Results are stored as JSON reports, a list of result dicts plus the
+environment they were measured in, so that commits can be compared.
+"""
+import json
+import platform
+import subprocess
+import time
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path, results, **parameters):
+    report = {
+        'timestamp': time.time(),
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    report.update(parameters)
+    with open(path, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+
+def compare(results, path, keys, metric, threshold):
+    """
+    Print `metric` changes against the report stored in `path` and return
+    the keys of results that dropped by more than `threshold` (ratio).
+    """
+    with open(path) as baseline:
+        previous = dict(
+            (tuple(result[key] for key in keys), result)
+            for result in json.load(baseline)['results']
+        )
+    regressions = []
+    for result in results:
+        key = tuple(result[k] for k in keys)
+        if key not in previous or not previous[key][metric]:
+            continue
+        ratio = result[metric] / previous[key][metric]
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = ' REGRESSION'
+            regressions.append(key)
+        print('%-40s %+.1f%%%s' % (' '.join(key), (ratio - 1) * 100, flag))
+    return regressions
@@ -2,12 +2,19 @@
 BtleJuice Python bindings
 """
 
+import os
+import signal
+import time
 from time import sleep
 from threading import Thread
 
-from btlejuice.socketIO_client import SocketIO, BaseNamespace
+from btlejuice.socketIO_client import SocketIO, BaseNamespace, TRANSPORTS
+from btlejuice.socketIO_client.transports import CONNECT_TIMEOUT
 from btlejuice.socketIO_client.parsers import Buffer
 from btlejuice.interface import BtleJuiceInterface, SniffingInterface, HookingInterface
+from btlejuice.scan import ScanResults, ScanEntry
+from btlejuice.profiling import DispatchProfiler
+from btlejuice.memory import AllocationTracker
 from btlejuice.exceptions import HookForceResponse, HookModify
 from btlejuice.utils import hexiify
 
@@ -21,8 +28,21 @@ class CoreNamespace(BaseNamespace):
 
     def __init__(self, io, path):
         self.interfaces = []
+        # Instruments wrapping event callbacks (profiler, metrics, ...)
+        self.event_wrappers = []
         super(CoreNamespace, self).__init__(io, path)
 
+    def _find_packet_callback(self, event):
+        # The base class renames repeated connections to reconnect
+        if event == 'connect' and hasattr(self, '_was_connected'):
+            callback = super(CoreNamespace, self)._find_packet_callback(event)
+            event = 'reconnect'
+        else:
+            callback = super(CoreNamespace, self)._find_packet_callback(event)
+        for wrapper in self.event_wrappers:
+            callback = wrapper.wrap_event(event, callback)
+        return callback
+
     def on_event(self, event, *args):
         """
         Main event dispatcher.
@@ -93,7 +113,7 @@ class CoreNamespace(BaseNamespace):
 
     def on_ready(self):
         for interface in self.interfaces:
-            interface.proxy_ready()
+            interface.target_ready()
 
     def on_ble_write(self, service, characteristic, data, offset, withoutResponse):
         for interface in self.interfaces:
@@ -128,10 +148,34 @@ class CoreNamespace(BaseNamespace):
             interface.update_profile(profile)
 
 class BtleJuiceApp(Thread):
-    def __init__(self, interface):
+    """
+    BtleJuice application.
+
+    Connects an interface to the BtleJuice core. `transports` selects the
+    socket.io transports to use: pass `['websocket']` to open the session
+    directly over websocket and skip the polling handshake, and `timeout` to
+    the seconds to wait for the session. Any other keyword argument is passed
+    to `SocketIO` (headers, proxies, verify, ...).
+
+    The thread receiving and dispatching core events can be profiled at
+    runtime with `start_profiling`, or by sending a signal once
+    `enable_profiling_signal` has been called. Allocations per event type
+    are tracked with `enable_allocation_tracking`, and session metrics are
+    served in the Prometheus format by `start_metrics_server`.
+    """
+
+    def __init__(self, interface, transports=TRANSPORTS,
+                 timeout=CONNECT_TIMEOUT, **kw):
         Thread.__init__(self)
         # Create client
-        self.client = SocketIO(interface.host, interface.port,CoreNamespace)
+        self.client = SocketIO(
+            interface.host,
+            interface.port,
+            CoreNamespace,
+            transports=transports,
+            timeout=timeout,
+            **kw
+        )
 
         # Save namespace
         self.interface = interface
@@ -142,14 +186,143 @@ class BtleJuiceApp(Thread):
         # Thread is not cancelled by default
         self.canceled = False
 
+        # Profiling is requested by other threads and run by ours
+        self.profiler = None
+        self.last_profile = None
+        self._profile_request = None
+        self._profile_stop = False
+        self.allocation_tracker = None
+        self.metrics = None
+        self.metrics_server = None
+
     def run(self):
         while not self.canceled:
+            self._update_profiler()
             sleep(0.001)
             self.client.wait(seconds=0.1)
+        self._stop_profiler()
 
     def cancel(self):
         self.canceled = True
 
+    def start_profiling(self, path, seconds=10):
+        """
+        Profile the dispatch thread for `seconds` seconds.
+
+        The profile is written to `path` (pstats format) along with a text
+        report attributing time to event types and hooks (`path` + '.txt').
+        """
+        self._profile_stop = False
+        self._profile_request = (path, seconds)
+
+    def stop_profiling(self):
+        """
+        Stop profiling early and write the profile.
+        """
+        self._profile_request = None
+        self._profile_stop = True
+
+    def toggle_profiling(self, directory='.', seconds=10):
+        """
+        Start profiling to a timestamped file in `directory`, or stop the
+        current profile.
+        """
+        if self.profiler is not None or self._profile_request is not None:
+            self.stop_profiling()
+        else:
+            path = os.path.join(directory, 'btlejuice-%s.prof' % (
+                time.strftime('%Y%m%d-%H%M%S')))
+            self.start_profiling(path, seconds)
+
+    def enable_profiling_signal(self, signum=None, directory='.', seconds=10):
+        """
+        Toggle profiling when `signum` (default: SIGUSR1) is received.
+
+        Must be called from the main thread.
+        """
+        if signum is None:
+            signum = signal.SIGUSR1
+        signal.signal(
+            signum, lambda signum, frame: self.toggle_profiling(directory, seconds))
+
+    def enable_allocation_tracking(self, nframes=16):
+        """
+        Track memory allocations per event type and pipeline stage
+        (tracemalloc, `nframes` frames per allocation).
+        """
+        if self.allocation_tracker is not None:
+            return self.allocation_tracker
+        self.allocation_tracker = AllocationTracker(self.client, nframes)
+        self.allocation_tracker.start()
+        self.namespace.event_wrappers.append(self.allocation_tracker)
+        return self.allocation_tracker
+
+    def disable_allocation_tracking(self):
+        if self.allocation_tracker is None:
+            return
+        self.namespace.event_wrappers.remove(self.allocation_tracker)
+        self.allocation_tracker.stop()
+        self.allocation_tracker = None
+
+    def allocation_stats(self):
+        """
+        Return allocations per event type (see `AllocationTracker.stats`).
+        """
+        if self.allocation_tracker is None:
+            return {}
+        return self.allocation_tracker.stats()
+
+    def enable_metrics(self):
+        """
+        Start counting packets, bytes, connections and hook errors.
+        """
+        if self.metrics is None:
+            # Imported on demand, the HTTP server is slow to import
+            from btlejuice.metrics import Metrics
+            self.metrics = Metrics(self)
+            self.metrics.start()
+        return self.metrics
+
+    def start_metrics_server(self, host='127.0.0.1', port=9464):
+        """
+        Serve the session metrics on http://host:port/metrics in the
+        Prometheus text format.
+        """
+        from btlejuice.metrics import MetricsServer
+        self.stop_metrics_server()
+        self.metrics_server = MetricsServer(self.enable_metrics(), host, port)
+        self.metrics_server.start()
+        return self.metrics_server
+
+    def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def _update_profiler(self):
+        if self.profiler is not None:
+            if self._profile_stop or self.profiler.expired:
+                self._profile_stop = False
+                self._stop_profiler()
+        elif self._profile_request is not None:
+            path, seconds = self._profile_request
+            self._profile_request = None
+            self.profiler = DispatchProfiler(path, seconds)
+            self.namespace.event_wrappers.append(self.profiler)
+            self.interface._add_hook_observer(self.profiler.record_hook)
+            self.profiler.start()
+
+    def _stop_profiler(self):
+        profiler = self.profiler
+        if profiler is None:
+            return
+        profiler.stop()
+        self.namespace.event_wrappers.remove(profiler)
+        self.interface._remove_hook_observer(profiler.record_hook)
+        self.profiler = None
+        profiler.save()
+        self.last_profile = profiler.path
+
 # Main exports
 
 __all__ = [
@@ -157,6 +330,8 @@ __all__ = [
     'HookingInterface',
     'BtleJuiceInterface',
     'BtleJuiceApp',
+    'ScanResults',
+    'ScanEntry',
     'HookForceResponse',
     'HookModify',
     'hexiify'
@@ -0,0 +1,20 @@
+"""
+BtleJuice captures
+"""
+from btlejuice.capture.format import (
+    DEFINE, READ, WRITE, NOTIFICATION, SUBSCRIBE, CONNECT, DISCONNECT,
+    OPERATIONS, WITHOUT_RESPONSE, ENABLED, HAS_OFFSET, CaptureFormatError
+)
+from btlejuice.capture.writer import CaptureWriter
+from btlejuice.capture.reader import CaptureReader, CaptureRecord, write_offset
+from btlejuice.capture.chunks import (
+    ChunkedCaptureReader, available_codecs, compress_capture, open_capture)
+from btlejuice.capture.index import CaptureIndex
+from btlejuice.capture.interface import CaptureInterface
+from btlejuice.capture.pcap import PcapWriter, PcapInterface, export_pcap
+from btlejuice.capture.replay import Replayer
+from btlejuice.capture.emulator import EmulatorInterface
+from btlejuice.capture.merge import MergedRecord, merge_captures, write_merged
+from btlejuice.capture.arrays import CaptureArrays, capture_arrays, iter_capture_arrays
+from btlejuice.capture.analytics import (
+    CharacteristicStats, analyze_capture, analyze_shard, capture_shards)
@@ -0,0 +1,264 @@
+import argparse
+import binascii
+import time
+
+from btlejuice.capture import (
+    CaptureIndex, OPERATIONS, WRITE, SUBSCRIBE, WITHOUT_RESPONSE, ENABLED,
+    available_codecs, compress_capture, export_pcap, open_capture,
+    write_offset
+)
+from btlejuice.capture.analytics import analyze_capture
+from btlejuice.capture.arrays import capture_arrays
+from btlejuice.capture.chunks import CODECS
+from btlejuice.capture.merge import merge_captures, write_merged
+from btlejuice.capture.pcap import FORMATS
+
+
+def format_record(record):
+    timestamp = time.strftime(
+        '%Y-%m-%d %H:%M:%S', time.localtime(record.timestamp // 1000000000))
+    timestamp += '.%06d' % (record.timestamp % 1000000000 // 1000)
+    if record.service is None:
+        return '%s %-12s %s' % (
+            timestamp, OPERATIONS[record.operation],
+            bytes(record.data).decode('utf-8', 'replace'))
+    details = ''
+    data = record.data
+    if record.operation == WRITE:
+        offset, data = write_offset(record)
+        if offset:
+            details += ' offset=%d' % offset
+        if record.flags & WITHOUT_RESPONSE:
+            details += ' without-response'
+    elif record.operation == SUBSCRIBE:
+        details = ' enabled' if record.flags & ENABLED else ' disabled'
+    return '%s %-12s %s:%s %s%s' % (
+        timestamp, OPERATIONS[record.operation], record.service,
+        record.characteristic, binascii.hexlify(bytes(data)).decode('ascii'),
+        details)
+
+
+def dump(args):
+    with open_capture(args.capture) as reader:
+        for record in reader:
+            print(format_record(record))
+
+
+def index(args):
+    with CaptureIndex(args.capture, update=False) as capture_index:
+        print('%d records indexed' % capture_index.update())
+
+
+def query(args):
+    operation = None
+    if args.operation is not None:
+        operation = dict(
+            (name, op) for op, name in OPERATIONS.items())[args.operation]
+    start = None if args.start is None else int(args.start * 1000000000)
+    end = None if args.end is None else int(args.end * 1000000000)
+    with CaptureIndex(args.capture) as capture_index:
+        for record in capture_index.query(
+                args.characteristic, operation, start, end, args.service):
+            print(format_record(record))
+
+
+def pcap(args):
+    format = args.format
+    if format is None:
+        format = 'pcap' if args.output.endswith('.pcap') else 'pcapng'
+    print('%d packets written' % export_pcap(args.capture, args.output, format))
+
+
+def compress(args):
+    if args.codec not in available_codecs():
+        raise SystemExit('%s is not available (available: %s)' % (
+            args.codec, ', '.join(available_codecs())))
+    print('%d records written' % compress_capture(
+        args.capture, args.output, args.codec, args.chunk_size))
+
+
+def arrays(args):
+    try:
+        capture = capture_arrays(args.capture)
+    except ImportError as error:
+        raise SystemExit(str(error))
+    capture.save(args.output)
+    print('%d records written' % len(capture))
+
+
+def stats(args):
+    results = analyze_capture(args.capture, args.processes, args.shards)
+    for key in sorted(results, key=lambda key: (key[0] or '', key[1] or '')):
+        summary = results[key].summary()
+        name = 'connections' if key[0] is None else '%s:%s' % key
+        print('%s: %d records, %d bytes, %d%s unique values, %.3f s' % (
+            name, summary['count'], summary['bytes'], summary['unique'],
+            '+' if summary['truncated'] else '',
+            (summary['last'] - summary['first']) / 1e9))
+        print('    %s' % ', '.join(
+            '%s=%d' % item for item in sorted(summary['operations'].items())))
+        interval = summary['interval']
+        print('    interval mean=%.3f ms p50=%.3f ms p99=%.3f ms max=%.3f ms' % (
+            interval['mean'] / 1e6, interval['p50'] / 1e6, interval['p99'] / 1e6,
+            interval['max'] / 1e6))
+
+
+def merge(args):
+    offsets = [int(offset * 1000000000) for offset in args.offsets]
+    sources = args.sources or None
+    if sources is not None and len(sources) != len(args.captures):
+        raise SystemExit('one source name per capture is required')
+    if args.output is not None:
+        print('%d records written' % write_merged(
+            args.captures, args.output, offsets, sources, args.tag))
+        return
+    for source, record in merge_captures(args.captures, offsets, sources):
+        print('%s %s' % (source, format_record(record)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BtleJuice capture tools')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    dump_parser = commands.add_parser('dump', help='Print the records of a capture')
+    dump_parser.add_argument('capture', type=str, help='Capture file')
+    dump_parser.set_defaults(function=dump)
+    index_parser = commands.add_parser('index', help='Index a capture')
+    index_parser.add_argument('capture', type=str, help='Capture file')
+    index_parser.set_defaults(function=index)
+    query_parser = commands.add_parser(
+        'query', help='Print the records matching a query (indexes the capture)')
+    query_parser.add_argument('capture', type=str, help='Capture file')
+    query_parser.add_argument(
+        '--service',
+        type=str,
+        dest='service',
+        default=None,
+        help='Service UUID'
+    )
+    query_parser.add_argument(
+        '--characteristic',
+        '-c',
+        type=str,
+        dest='characteristic',
+        default=None,
+        help='Characteristic UUID'
+    )
+    query_parser.add_argument(
+        '--operation',
+        '-o',
+        type=str,
+        dest='operation',
+        choices=sorted(name for name in OPERATIONS.values() if name != 'define'),
+        default=None,
+        help='Operation'
+    )
+    query_parser.add_argument(
+        '--start',
+        type=float,
+        dest='start',
+        default=None,
+        help='Start time (seconds since the epoch, inclusive)'
+    )
+    query_parser.add_argument(
+        '--end',
+        type=float,
+        dest='end',
+        default=None,
+        help='End time (seconds since the epoch, exclusive)'
+    )
+    query_parser.set_defaults(function=query)
+    pcap_parser = commands.add_parser(
+        'pcap', help='Convert a capture to PCAP or PCAPNG')
+    pcap_parser.add_argument('capture', type=str, help='Capture file')
+    pcap_parser.add_argument('output', type=str, help='Output file')
+    pcap_parser.add_argument(
+        '--format',
+        '-f',
+        type=str,
+        dest='format',
+        choices=FORMATS,
+        default=None,
+        help='Output format (default: from the output file extension, pcapng otherwise)'
+    )
+    pcap_parser.set_defaults(function=pcap)
+    compress_parser = commands.add_parser(
+        'compress', help='Write a compressed copy of a capture')
+    compress_parser.add_argument('capture', type=str, help='Capture file')
+    compress_parser.add_argument('output', type=str, help='Output file')
+    compress_parser.add_argument(
+        '--codec',
+        type=str,
+        dest='codec',
+        choices=sorted(CODECS),
+        default='zlib',
+        help='Compression codec (lz4 and zstd require the lz4 and zstandard packages)'
+    )
+    compress_parser.add_argument(
+        '--chunk-size',
+        type=int,
+        dest='chunk_size',
+        default=1 << 20,
+        help='Uncompressed chunk size (bytes)'
+    )
+    compress_parser.set_defaults(function=compress)
+    arrays_parser = commands.add_parser(
+        'arrays', help='Export a capture to NumPy arrays (.npz, requires numpy)')
+    arrays_parser.add_argument('capture', type=str, help='Capture file')
+    arrays_parser.add_argument('output', type=str, help='Output file')
+    arrays_parser.set_defaults(function=arrays)
+    stats_parser = commands.add_parser(
+        'stats', help='Print per-characteristic statistics of a capture')
+    stats_parser.add_argument('capture', type=str, help='Capture file')
+    stats_parser.add_argument(
+        '--processes',
+        '-j',
+        type=int,
+        dest='processes',
+        default=None,
+        help='Worker processes (default: one per CPU)'
+    )
+    stats_parser.add_argument(
+        '--shards',
+        type=int,
+        dest='shards',
+        default=None,
+        help='Capture shards (default: 4 per process)'
+    )
+    stats_parser.set_defaults(function=stats)
+    merge_parser = commands.add_parser(
+        'merge', help='Merge captures by timestamp')
+    merge_parser.add_argument('captures', type=str, nargs='+', help='Capture files')
+    merge_parser.add_argument(
+        '--output',
+        '-o',
+        type=str,
+        dest='output',
+        default=None,
+        help='Write the merged records to this capture (default: print them)'
+    )
+    merge_parser.add_argument(
+        '--offset',
+        type=float,
+        dest='offsets',
+        action='append',
+        default=[],
+        help='Clock correction added to the timestamps of each capture, in order (seconds)'
+    )
+    merge_parser.add_argument(
+        '--source',
+        type=str,
+        dest='sources',
+        action='append',
+        default=[],
+        help='Source name of each capture, in order (default: file names)'
+    )
+    merge_parser.add_argument(
+        '--tag',
+        action='store_true',
+        dest='tag',
+        help='Prefix services and client addresses with their source in the merged capture'
+    )
+    merge_parser.set_defaults(function=merge)
+    args = parser.parse_args()
+    args.function(args)
@@ -0,0 +1,182 @@
+"""
+BtleJuice capture analytics
+"""
+import multiprocessing
+import os
+
+from btlejuice.capture.chunks import open_capture
+from btlejuice.capture.format import (
+    HEADER, RECORD, DEFINE, OPERATIONS, decode_name
+)
+from btlejuice.stats import LatencyHistogram
+
+
+class CharacteristicStats(object):
+    """
+    Records of a characteristic: count and payload bytes, count per
+    operation, histogram of the intervals between records (nanoseconds),
+    unique values (at most `max_values` are kept) and timestamps of the
+    first and last records.
+    """
+
+    def __init__(self, max_values=65536):
+        self.count = 0
+        self.bytes = 0
+        self.operations = {}
+        self.first = None
+        self.last = None
+        self.intervals = LatencyHistogram()
+        self.values = set()
+        self.max_values = max_values
+        self.values_truncated = False
+
+    def add(self, timestamp, operation, data):
+        self.count += 1
+        self.bytes += len(data)
+        self.operations[operation] = self.operations.get(operation, 0) + 1
+        if self.last is None:
+            self.first = timestamp
+        else:
+            self.intervals.record(timestamp - self.last)
+        self.last = timestamp
+        if not self.values_truncated:
+            self.values.add(data)
+            if len(self.values) > self.max_values:
+                self.values.discard(data)
+                self.values_truncated = True
+
+    def merge(self, other):
+        """
+        Add the stats of the records following these ones.
+        """
+        if other.count == 0:
+            return
+        if self.last is None:
+            self.first = other.first
+        else:
+            self.intervals.record(other.first - self.last)
+        self.last = other.last
+        self.count += other.count
+        self.bytes += other.bytes
+        for operation, count in other.operations.items():
+            self.operations[operation] = self.operations.get(operation, 0) + count
+        self.intervals.merge(other.intervals)
+        if not self.values_truncated:
+            for value in other.values:
+                if len(self.values) >= self.max_values and value not in self.values:
+                    self.values_truncated = True
+                    break
+                self.values.add(value)
+        self.values_truncated |= other.values_truncated
+
+    def summary(self):
+        """
+        Return count, bytes, count per operation name, unique values (a
+        lower bound when `truncated`), first and last timestamps and the
+        summary of the intervals between records.
+        """
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'operations': dict(
+                (OPERATIONS[operation], count)
+                for operation, count in self.operations.items()),
+            'unique': len(self.values),
+            'truncated': self.values_truncated,
+            'first': self.first,
+            'last': self.last,
+            'interval': self.intervals.summary(),
+        }
+
+
+def capture_shards(reader, count):
+    """
+    Return (start, stop) record offsets splitting a capture into at most
+    `count` shards of similar size. Compressed captures are split at chunk
+    boundaries; uncompressed captures at record boundaries, found by
+    walking the record headers. The walk also loads the characteristic
+    definitions and stops at the end of the capture, so that the reader
+    can be opened without scanning the capture (see `analyze_capture`).
+    """
+    if reader.codec is not None:
+        offsets = [chunk[2] for chunk in reader.chunks]
+        boundaries = sorted(set(
+            offsets[i * len(offsets) // count] for i in range(count)
+        )) if offsets else [HEADER.size]
+        end = reader.end
+    else:
+        size = reader.end - HEADER.size
+        boundaries = [HEADER.size]
+        target = HEADER.size + size // count
+        end = HEADER.size
+        for position, header in reader.headers(None, reader.end):
+            if position >= target and len(boundaries) < count:
+                boundaries.append(position)
+                target = HEADER.size + size * len(boundaries) // count
+            if header[1] == DEFINE:
+                reader.characteristics[header[3]] = decode_name(
+                    reader.payload(position, header[4]))
+            end = position + RECORD.size + header[4]
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def analyze_shard(path, start, stop, characteristics=None, end=None,
+                  max_values=65536):
+    """
+    Return the `CharacteristicStats` of the records of a capture from
+    offset `start` to `stop`, by (service, characteristic). Records not
+    related to a characteristic (connections) are under (None, None).
+    """
+    stats = {}
+    with open_capture(path, characteristics, end) as reader:
+        for record in reader.records(start, stop):
+            key = (record.service, record.characteristic)
+            characteristic = stats.get(key)
+            if characteristic is None:
+                characteristic = stats[key] = CharacteristicStats(max_values)
+            characteristic.add(
+                record.timestamp, record.operation, bytes(record.data))
+    return stats
+
+
+def _analyze_shard(arguments):
+    return analyze_shard(*arguments)
+
+
+def analyze_capture(path, processes=None, shards=None, max_values=65536):
+    """
+    Return the `CharacteristicStats` of a capture by (service,
+    characteristic), see `analyze_shard`.
+
+    The capture is split into `shards` shards (by default 4 per process,
+    see `capture_shards`) analyzed by a pool of `processes` worker
+    processes (by default one per CPU), whose results are then merged.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # Uncompressed captures are walked once, by capture_shards
+    with open_capture(path, {}, os.path.getsize(path)) as reader:
+        shards = capture_shards(reader, shards or 4 * processes)
+        characteristics = dict(reader.characteristics)
+        end = shards[-1][1]
+        tasks = [
+            (path, start, stop, characteristics, end, max_values)
+            for start, stop in shards]
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_analyze_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_analyze_shard(task) for task in tasks]
+    stats = {}
+    for result in results:
+        for key, characteristic in result.items():
+            if key in stats:
+                stats[key].merge(characteristic)
+            else:
+                stats[key] = characteristic
+    return stats
@@ -0,0 +1,242 @@
+"""
+BtleJuice capture export to NumPy arrays
+
+Records are exported as a structured array (timestamp, operation, flags,
+characteristic ID, payload length and offset) and their payloads packed in
+a byte array. Record headers and payloads are gathered from the capture
+with NumPy, a batch of records at a time, without creating Python objects
+per record. Record positions are read from the capture index when it is up
+to date; otherwise they are found by walking the record headers in Python,
+which takes most of the export time. The index is not created or updated.
+Delta encoded values are decoded in Python. Requires numpy.
+"""
+import os
+from array import array
+
+from btlejuice.capture.chunks import open_capture
+from btlejuice.capture.format import HEADER, RECORD, DEFINE, DELTA, decode_name
+from btlejuice.capture.index import CaptureIndex
+
+try:
+    array('Q')
+    POSITIONS = 'Q'
+except ValueError:  # Python 2
+    POSITIONS = 'L'
+
+
+HEADER_FIELDS = [
+    ('timestamp', '<u8'),
+    ('operation', 'u1'),
+    ('flags', 'u1'),
+    ('characteristic', '<u2'),
+    ('length', '<u2'),
+]
+RECORD_FIELDS = HEADER_FIELDS + [('offset', '<u8')]
+ENTRY_FIELDS = [
+    ('characteristic', '<u2'),
+    ('operation', 'u1'),
+    ('timestamp', '<u8'),
+    ('position', '<u8'),
+]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('capture arrays require numpy')
+    return numpy
+
+
+class CaptureArrays(object):
+    """
+    Records of a capture as NumPy arrays.
+
+    `records` is a structured array with `timestamp`, `operation`, `flags`,
+    `characteristic` (ID), `length` and `offset` fields, `payloads` a uint8
+    array holding the payload of record i at `offset` (write offsets are
+    left in the payloads, see `write_offset`), and `characteristics` maps
+    IDs to (service, characteristic) tuples.
+    """
+
+    def __init__(self, records, payloads, characteristics):
+        self.records = records
+        self.payloads = payloads
+        self.characteristics = characteristics
+
+    def __len__(self):
+        return len(self.records)
+
+    def value(self, i):
+        """
+        Return the payload of the record at `i` as bytes.
+        """
+        offset = int(self.records['offset'][i])
+        return self.payloads[offset:offset + int(self.records['length'][i])].tobytes()
+
+    def characteristic_id(self, service, characteristic):
+        """
+        Return the ID of a characteristic in `records`, or None.
+        """
+        for id, name in self.characteristics.items():
+            if name == (service, characteristic):
+                return id
+        return None
+
+    def save(self, path):
+        """
+        Save the arrays to a .npz file (characteristics as `names`, an
+        array of "service:characteristic" strings indexed by ID).
+        """
+        numpy = _numpy()
+        names = numpy.array([
+            '%s:%s' % self.characteristics[id] if id in self.characteristics else ''
+            for id in range(max(self.characteristics) + 1 if self.characteristics else 0)
+        ])
+        numpy.savez(
+            path, records=self.records, payloads=self.payloads, names=names)
+
+
+def iter_capture_arrays(path, batch_size=1 << 16):
+    """
+    Iterate over the records of a capture as `CaptureArrays` of at most
+    `batch_size` records, in capture order. Payload offsets are relative to
+    each batch.
+    """
+    numpy = _numpy()
+    header_dtype = numpy.dtype(HEADER_FIELDS)
+    record_dtype = numpy.dtype(RECORD_FIELDS)
+    index = None
+    if os.path.exists(path + '.idx'):
+        index = CaptureIndex(path, update=False)
+        if not index.current():
+            index.close()
+            index = None
+    if index is not None:
+        reader = index.reader
+        positions = _index_positions(numpy, index)
+    else:
+        # Characteristics are defined while walking the headers
+        reader = open_capture(path, {}, os.path.getsize(path))
+        positions = None
+    try:
+        header = numpy.arange(RECORD.size)
+        for base, block in reader.blocks():
+            data = numpy.frombuffer(block, numpy.uint8)
+            if positions is None:
+                block_positions = _walk(numpy, reader, base, block)
+            else:
+                first, last = numpy.searchsorted(
+                    positions, [base, base + len(data)])
+                block_positions = positions[first:last]
+            characteristics = dict(reader.characteristics)
+            for start in range(0, len(block_positions), batch_size):
+                batch = block_positions[start:start + batch_size]
+                relative = (batch - base).astype(numpy.intp)
+                headers = numpy.ascontiguousarray(
+                    data[relative[:, None] + header]).view(header_dtype)[:, 0]
+                records = numpy.empty(len(batch), record_dtype)
+                for name, type in HEADER_FIELDS:
+                    records[name] = headers[name]
+                lengths = headers['length'].astype(numpy.intp)
+                payloads = data[_ragged(numpy, relative + RECORD.size, lengths)]
+                records['offset'] = _offsets(numpy, lengths)
+                deltas = numpy.nonzero(headers['flags'] & DELTA)[0]
+                if len(deltas):
+                    payloads = _decode_deltas(
+                        numpy, reader, batch, records, payloads, deltas)
+                yield CaptureArrays(records, payloads, characteristics)
+    finally:
+        (index or reader).close()
+
+
+def capture_arrays(path, batch_size=1 << 16):
+    """
+    Return the records of a capture as `CaptureArrays` (see
+    `iter_capture_arrays`).
+    """
+    numpy = _numpy()
+    records = []
+    payloads = []
+    characteristics = {}
+    size = 0
+    for arrays in iter_capture_arrays(path, batch_size):
+        arrays.records['offset'] += size
+        size += len(arrays.payloads)
+        records.append(arrays.records)
+        payloads.append(arrays.payloads)
+        characteristics = arrays.characteristics
+    if not records:
+        return CaptureArrays(
+            numpy.empty(0, numpy.dtype(RECORD_FIELDS)),
+            numpy.empty(0, numpy.uint8), characteristics)
+    return CaptureArrays(
+        numpy.concatenate(records), numpy.concatenate(payloads),
+        characteristics)
+
+
+def _index_positions(numpy, index):
+    # Sorted record positions of an index
+    entry_dtype = numpy.dtype(ENTRY_FIELDS)
+    positions = [
+        numpy.frombuffer(buffer, entry_dtype, count, offset)['position']
+        for buffer, offset, count in index.segments() if count]
+    if not positions:
+        return numpy.empty(0, numpy.uint64)
+    return numpy.sort(numpy.concatenate(positions))
+
+
+def _walk(numpy, reader, base, block):
+    # Positions of the records of a block, loading characteristic definitions
+    positions = array(POSITIONS)
+    position = max(HEADER.size - base, 0)
+    size = len(block)
+    unpack_from = RECORD.unpack_from
+    while position + RECORD.size <= size:
+        header = unpack_from(block, position)
+        end = position + RECORD.size + header[4]
+        if end > size:
+            break
+        if header[1] == DEFINE:
+            reader.characteristics[header[3]] = decode_name(
+                block[position + RECORD.size:end])
+        else:
+            positions.append(base + position)
+        position = end
+    return numpy.frombuffer(positions, 'u%d' % positions.itemsize) \
+        if positions else numpy.empty(0, numpy.uint64)
+
+
+def _offsets(numpy, lengths):
+    # Offsets of values of `lengths` packed together
+    offsets = numpy.zeros(len(lengths), numpy.intp)
+    numpy.cumsum(lengths[:-1], out=offsets[1:])
+    return offsets
+
+
+def _ragged(numpy, starts, lengths):
+    # Indexes of the values of `lengths` at `starts`, packed together
+    return numpy.repeat(starts - _offsets(numpy, lengths), lengths) + \
+        numpy.arange(int(lengths.sum()))
+
+
+def _decode_deltas(numpy, reader, positions, records, payloads, deltas):
+    # Replace the delta payloads of a batch with the decoded values
+    values = [
+        numpy.frombuffer(
+            reader.record_at(int(positions[i])).data, numpy.uint8)
+        for i in deltas]
+    offsets = records['offset'].astype(numpy.intp)
+    lengths = records['length'].astype(numpy.intp)
+    plain = numpy.ones(len(records), bool)
+    plain[deltas] = False
+    records['length'][deltas] = [len(value) for value in values]
+    records['offset'] = _offsets(numpy, records['length'].astype(numpy.intp))
+    records['flags'] &= ~DELTA & 0xff
+    decoded = numpy.empty(int(records['length'].sum()), numpy.uint8)
+    decoded[_ragged(numpy, records['offset'][plain].astype(numpy.intp), lengths[plain])] = \
+        payloads[_ragged(numpy, offsets[plain], lengths[plain])]
+    for i, value in zip(deltas, values):
+        offset = int(records['offset'][i])
+        decoded[offset:offset + len(value)] = value
+    return decoded
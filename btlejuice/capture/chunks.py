@@ -0,0 +1,400 @@
+"""
+BtleJuice chunked compressed captures
+
+A compressed capture stores the records of a capture in independently
+compressed chunks of about `chunk_size` bytes, cut at record boundaries.
+It starts with an 8-byte header (magic, version, capture flags, codec).
+Each chunk is a header (compressed length, length, offset of its first
+record in the equivalent uncompressed capture, timestamp of its first
+record) followed by the compressed records. Delta encoded values never
+refer to a previous chunk. A trailer, written on close, lists the chunks
+(first timestamp, file offset, offset) and the characteristic definitions,
+and ends with a footer (trailer offset, number of chunks and definitions,
+magic). Captures that were not closed are read by scanning their chunks.
+
+Record offsets are the same as in an uncompressed capture, so captures can
+be indexed (see `CaptureIndex`) the same way.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+from btlejuice.capture.format import (
+    MAGIC, HEADER, RECORD, DEFINE, DELTA_ENCODED, FLAGS_OFFSET,
+    CaptureFormatError, encode_name, decode_name
+)
+from btlejuice.capture.reader import CaptureReader
+
+
+CHUNKED_MAGIC = b'BJCZ'
+CHUNKED_VERSION = 1
+TRAILER_MAGIC = b'BJCT'
+
+CHUNKED_HEADER = struct.Struct('<4sBBBx')
+CHUNK = struct.Struct('<IIQQ')
+TRAILER_ENTRY = struct.Struct('<QQQ')
+DEFINITION = struct.Struct('<HH')
+FOOTER = struct.Struct('<QII4s')
+
+CODECS = {
+    'zlib': 1,
+    'lz4': 2,
+    'zstd': 3,
+}
+
+
+def get_codec(name):
+    """
+    Return the (compress, decompress) functions of a codec. lz4 and zstd
+    require the lz4 and zstandard packages.
+    """
+    if name == 'zlib':
+        return zlib.compress, zlib.decompress
+    if name == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise CaptureFormatError('lz4 compression requires the lz4 package')
+        return lz4.frame.compress, lz4.frame.decompress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise CaptureFormatError('zstd compression requires the zstandard package')
+        return (
+            zstandard.ZstdCompressor().compress,
+            zstandard.ZstdDecompressor().decompress)
+    raise CaptureFormatError('unknown codec %s' % name)
+
+
+def available_codecs():
+    """
+    Return the names of the codecs that can be used.
+    """
+    codecs = []
+    for name in sorted(CODECS, key=CODECS.get):
+        try:
+            get_codec(name)
+        except CaptureFormatError:
+            continue
+        codecs.append(name)
+    return codecs
+
+
+class ChunkedFile(object):
+    """
+    Compressed capture file written by `CaptureWriter`.
+
+    Records written are compressed in chunks, cut by the writer with
+    `end_chunk`, in a background thread so that writes do not wait for
+    compression (unless `max_pending` chunks are waiting to be compressed).
+    `characteristics` are the (service, characteristic) to ID mapping of
+    the writer, saved in the trailer on `close`.
+    """
+
+    def __init__(self, path, codec='zlib', flags=0, characteristics=None,
+                 max_pending=64):
+        self.path = path
+        self.characteristics = characteristics if characteristics is not None else {}
+        self.chunks = []
+        self.closed = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with ChunkedCaptureReader(path) as reader:
+                codec = reader.codec
+                self.chunks = [chunk[:3] for chunk in reader.chunks]
+                self.offset = reader.size
+                end = reader.data_end
+                flags |= reader.flags
+            self._file = open(path, 'r+b')
+            # Drop the trailer and any chunk truncated by a crash
+            self._file.truncate(end)
+            self._file.seek(FLAGS_OFFSET)
+            self._file.write(bytes(bytearray([flags])))
+            self._file.seek(end)
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(CHUNKED_HEADER.pack(
+                CHUNKED_MAGIC, CHUNKED_VERSION, flags, CODECS[codec]))
+            self.offset = HEADER.size
+        self.codec = codec
+        self._compress = get_codec(codec)[0]
+        self._pending = bytearray()
+        self._queue = Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._compress_chunks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, data):
+        self._pending += data
+
+    def flush(self):
+        # Records are written with their chunk
+        pass
+
+    def end_chunk(self):
+        """
+        Queue the records written since the last chunk for compression.
+        """
+        if self._error is not None:
+            raise self._error
+        if self._pending:
+            self._queue.put((self.offset, bytes(self._pending)))
+            self.offset += len(self._pending)
+            del self._pending[:]
+
+    def close(self):
+        if self.closed:
+            return
+        self.end_chunk()
+        self._queue.put(None)
+        self._thread.join()
+        self.closed = True
+        try:
+            if self._error is not None:
+                raise self._error
+            self._write_trailer()
+        finally:
+            self._file.close()
+
+    def _compress_chunks(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is not None:
+                continue
+            offset, data = chunk
+            try:
+                compressed = self._compress(data)
+                timestamp = RECORD.unpack_from(data)[0]
+                position = self._file.tell()
+                self._file.write(
+                    CHUNK.pack(len(compressed), len(data), offset, timestamp))
+                self._file.write(compressed)
+                self._file.flush()
+                self.chunks.append((timestamp, position, offset))
+            except Exception as exception:
+                self._error = exception
+
+    def _write_trailer(self):
+        position = self._file.tell()
+        trailer = bytearray()
+        for chunk in self.chunks:
+            trailer += TRAILER_ENTRY.pack(*chunk)
+        for (service, characteristic), id in sorted(
+                self.characteristics.items(), key=lambda item: item[1]):
+            name = encode_name(service, characteristic)
+            trailer += DEFINITION.pack(id, len(name))
+            trailer += name
+        trailer += FOOTER.pack(
+            position, len(self.chunks), len(self.characteristics),
+            TRAILER_MAGIC)
+        self._file.write(trailer)
+        self._file.flush()
+
+
+class ChunkedCaptureReader(CaptureReader):
+    """
+    Compressed capture reader.
+
+    Chunks are decompressed when records they hold are accessed, and the
+    last `cache_size` decompressed chunks are kept. `seek` finds the chunk
+    holding the records of a given time from the chunk index, so that
+    iterating from the middle of a capture only decompresses the chunks
+    read. Record data are views of decompressed chunks.
+    """
+
+    def __init__(self, path, characteristics=None, end=None, cache_size=8):
+        self.path = path
+        self.cache_size = cache_size
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._map = b''
+        try:
+            self._decompress = self._check_header()
+        except Exception:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._file.close()
+            raise
+        self._cache = OrderedDict()
+        self.characteristics = dict(characteristics or {})
+        # (first timestamp, file offset, offset, length) of each chunk
+        self.chunks = []
+        self._offsets = []
+        if not self._load_trailer():
+            self._scan()
+        self._timestamps = [chunk[0] for chunk in self.chunks]
+        self._offsets = [chunk[2] for chunk in self.chunks]
+        if self.chunks:
+            self.size = self.end = self.chunks[-1][2] + self.chunks[-1][3]
+        else:
+            self.size = self.end = HEADER.size
+
+    def seek(self, timestamp):
+        """
+        Return the offset of the first record of the chunk holding the
+        records at `timestamp` (in nanoseconds since the epoch), for
+        `records`.
+        """
+        index = max(0, bisect.bisect_left(self._timestamps, timestamp) - 1)
+        return self._offsets[index] if self.chunks else HEADER.size
+
+    def headers(self, start=None, stop=None):
+        if start is None:
+            start = HEADER.size
+        unpack_from = RECORD.unpack_from
+        for index in range(self._chunk_index(start), len(self.chunks)):
+            base = self.chunks[index][2]
+            if stop is not None and base >= stop:
+                break
+            data = self._chunk(index)
+            position = max(start - base, 0)
+            size = len(data) if stop is None else min(len(data), stop - base)
+            while position + RECORD.size <= size:
+                header = unpack_from(data, position)
+                yield base + position, header
+                position += RECORD.size + header[4]
+
+    def blocks(self):
+        for index in range(len(self.chunks)):
+            yield self.chunks[index][2], self._chunk(index)
+
+    def header_at(self, position):
+        index = self._chunk_index(position)
+        return RECORD.unpack_from(
+            self._chunk(index), position - self.chunks[index][2])
+
+    def payload(self, position, length):
+        index = self._chunk_index(position)
+        start = position - self.chunks[index][2] + RECORD.size
+        return memoryview(self._chunk(index))[start:start + length]
+
+    def close(self):
+        self._cache.clear()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _check_header(self):
+        # Return the decompression function of the capture codec
+        if len(self._map) < CHUNKED_HEADER.size:
+            raise CaptureFormatError('truncated capture header')
+        magic, version, self.flags, codec = CHUNKED_HEADER.unpack_from(self._map)
+        if magic != CHUNKED_MAGIC:
+            raise CaptureFormatError('not a compressed BtleJuice capture')
+        if version != CHUNKED_VERSION:
+            raise CaptureFormatError('unsupported capture version %d' % version)
+        codecs = dict((id, name) for name, id in CODECS.items())
+        if codec not in codecs:
+            raise CaptureFormatError('unknown codec %d' % codec)
+        self.codec = codecs[codec]
+        return get_codec(self.codec)[1]
+
+    def _chunk_index(self, position):
+        return max(0, bisect.bisect_right(self._offsets, position) - 1)
+
+    def _chunk(self, index):
+        data = self._cache.get(index)
+        if data is not None:
+            return data
+        timestamp, position, offset, length = self.chunks[index]
+        compressed_length = CHUNK.unpack_from(self._map, position)[0]
+        start = position + CHUNK.size
+        data = self._decompress(self._map[start:start + compressed_length])
+        if len(data) != length:
+            raise CaptureFormatError('corrupted chunk at %d' % position)
+        self._cache_chunk(index, data)
+        return data
+
+    def _cache_chunk(self, index, data):
+        self._cache[index] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load_trailer(self):
+        data = self._map
+        if len(data) < CHUNKED_HEADER.size + FOOTER.size:
+            return False
+        position, chunks, definitions, magic = FOOTER.unpack_from(
+            data, len(data) - FOOTER.size)
+        if magic != TRAILER_MAGIC or position > len(data) - FOOTER.size:
+            return False
+        self.data_end = position
+        for i in range(chunks):
+            timestamp, chunk_position, offset = TRAILER_ENTRY.unpack_from(
+                data, position)
+            length = CHUNK.unpack_from(data, chunk_position)[1]
+            self.chunks.append((timestamp, chunk_position, offset, length))
+            position += TRAILER_ENTRY.size
+        for i in range(definitions):
+            id, length = DEFINITION.unpack_from(data, position)
+            position += DEFINITION.size
+            self.characteristics[id] = decode_name(data[position:position + length])
+            position += length
+        return True
+
+    def _scan(self):
+        # Chunks are read until one is truncated or corrupted
+        data = self._map
+        position = CHUNKED_HEADER.size
+        offset = HEADER.size
+        while position + CHUNK.size <= len(data):
+            compressed_length, length, chunk_offset, timestamp = CHUNK.unpack_from(
+                data, position)
+            start = position + CHUNK.size
+            if chunk_offset != offset or start + compressed_length > len(data):
+                break
+            try:
+                chunk = self._decompress(data[start:start + compressed_length])
+            except Exception:
+                break
+            if len(chunk) != length:
+                break
+            self.chunks.append((timestamp, position, offset, length))
+            self._offsets.append(offset)
+            self._cache_chunk(len(self.chunks) - 1, chunk)
+            for record_position, header in self.headers(offset):
+                if header[1] == DEFINE:
+                    self.characteristics[header[3]] = self._define(
+                        record_position, header[4])
+            position = start + compressed_length
+            offset += length
+        self.data_end = position
+
+
+def open_capture(path, characteristics=None, end=None):
+    """
+    Return a reader of a compressed or uncompressed capture.
+    """
+    with open(path, 'rb') as capture:
+        magic = capture.read(len(MAGIC))
+    if magic == CHUNKED_MAGIC:
+        return ChunkedCaptureReader(path, characteristics, end)
+    return CaptureReader(path, characteristics, end)
+
+
+def compress_capture(source, destination, codec='zlib', chunk_size=1 << 20):
+    """
+    Write a compressed copy of a capture, return its number of records.
+    """
+    from btlejuice.capture.writer import CaptureWriter
+    with open_capture(source) as reader:
+        with CaptureWriter(
+                destination, buffer_size=chunk_size, compression=codec,
+                chunk_size=chunk_size,
+                delta=bool(reader.flags & DELTA_ENCODED)) as writer:
+            for record in reader:
+                writer.add(record)
+    return writer.records
@@ -0,0 +1,114 @@
+"""
+BtleJuice capture delta encoding
+
+A delta record payload is the distance (in bytes, backwards) to the previous
+record of the same characteristic and operation, followed by a patch
+against the value of that record: the new value length, then runs of
+(unchanged bytes skipped, changed bytes count, changed bytes). Integers are
+unsigned LEB128 varints.
+"""
+import re
+
+# Unchanged bytes runs shorter than this are merged into changed bytes runs
+MIN_GAP = 3
+
+CHANGED = re.compile(b'[^\x00]+')
+
+try:
+    int.from_bytes
+
+    def _xor(a, b):
+        return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(
+            len(a), 'little')
+except AttributeError:  # Python 2
+    def _xor(a, b):
+        return bytes(bytearray(x ^ y for x, y in zip(bytearray(a), bytearray(b))))
+
+
+def write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, position):
+    """
+    Return the varint at `position` in data (a bytearray or memoryview) and
+    the position following it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_delta(distance, previous, value):
+    """
+    Return the delta payload of value against the previous value, found
+    `distance` bytes before.
+    """
+    delta = bytearray()
+    write_varint(delta, distance)
+    write_varint(delta, len(value))
+    if value == previous:
+        return bytes(delta)
+    common = min(len(previous), len(value))
+    runs = [
+        match.span() for match in
+        CHANGED.finditer(_xor(value[:common], previous[:common]))]
+    if len(value) > common:
+        runs.append((common, len(value)))
+    end = 0
+    start = changed = None
+    for run_start, run_end in runs:
+        if start is not None and run_start - changed < MIN_GAP:
+            changed = run_end
+            continue
+        if start is not None:
+            end = _write_run(delta, value, end, start, changed)
+        start, changed = run_start, run_end
+    if start is not None:
+        _write_run(delta, value, end, start, changed)
+    return bytes(delta)
+
+
+def _write_run(delta, value, end, start, changed):
+    write_varint(delta, start - end)
+    write_varint(delta, changed - start)
+    delta += value[start:changed]
+    return changed
+
+
+def delta_distance(delta):
+    """
+    Return the distance to the previous record of a delta payload and the
+    position of its patch.
+    """
+    return read_varint(delta, 0)
+
+
+def apply_patch(previous, delta, position):
+    """
+    Apply the patch starting at `position` in a delta payload to the
+    previous value.
+    """
+    length, position = read_varint(delta, position)
+    value = bytearray(previous[:length])
+    if len(value) < length:
+        value.extend(bytearray(length - len(value)))
+    end = 0
+    size = len(delta)
+    while position < size:
+        skip, position = read_varint(delta, position)
+        count, position = read_varint(delta, position)
+        end += skip
+        value[end:end + count] = delta[position:position + count]
+        position += count
+        end += count
+    return bytes(value)
@@ -0,0 +1,181 @@
+"""
+BtleJuice device emulation from captures
+"""
+import threading
+from bisect import bisect_right
+
+from btlejuice.capture.format import READ, NOTIFICATION, SUBSCRIBE, ENABLED
+from btlejuice.capture.index import CaptureIndex
+from btlejuice.interface import HookingInterface
+from btlejuice.exceptions import HookForceResponse
+from btlejuice.utils import bufferize
+
+
+class EmulatorInterface(HookingInterface):
+    """
+    Hooking interface emulating the device recorded in a capture.
+
+    Reads, writes and subscriptions are answered from the capture and never
+    forwarded to the device. The nth read of a characteristic returns its
+    nth recorded value (the last one once they are exhausted, or the first
+    one again with `loop`); with `sequence` False, reads return the last
+    recorded value. Characteristics without recorded reads return the last
+    value written to them.
+
+    Once a characteristic is subscribed to, its recorded notifications are
+    sent on their recorded schedule (relative to the recorded subscription),
+    scaled by `speed`, until the subscription is disabled. Notifications go
+    through `on_before_notification`.
+
+    The capture is read through its index (see `CaptureIndex`), which is
+    updated first.
+    """
+
+    def __init__(self, host, port, target, path, sequence=True, loop=False,
+                 speed=1.0, **kw):
+        self.path = path
+        self.sequence = sequence
+        self.loop = loop
+        self.speed = speed
+        self.reads = {}
+        self.notifications = {}
+        self.subscriptions = {}
+        self.written = {}
+        self._load()
+        self._lock = threading.Lock()
+        self._read_cursors = {}
+        self._served = {}
+        self._notification_cursors = {}
+        self._timers = {}
+        HookingInterface.__init__(self, host, port, target, **kw)
+
+    def reset(self):
+        """
+        Restart read and notification sequences from the beginning.
+        """
+        self.cancel_notifications()
+        with self._lock:
+            self._read_cursors.clear()
+            self._served.clear()
+            self._notification_cursors.clear()
+            self.written.clear()
+
+    def cancel_notifications(self):
+        with self._lock:
+            timers = list(self._timers.values())
+            self._timers.clear()
+        for timer in timers:
+            timer.cancel()
+
+    def disconnect(self):
+        self.cancel_notifications()
+        HookingInterface.disconnect(self)
+
+    # Hooks
+
+    def on_before_read(self, service, characteristic, offset):
+        key = (service, characteristic)
+        with self._lock:
+            if offset:
+                # Long read: continue reading the value being served
+                value = self._served.get(key, b'')
+            else:
+                value = self._next_read(key)
+                self._served[key] = value
+        raise HookForceResponse(value[offset:])
+
+    def on_before_write(self, service, characteristic, data, offset, withoutResponse):
+        key = (service, characteristic)
+        with self._lock:
+            value = self.written.get(key, b'')
+            self.written[key] = value[:offset or 0] + bytes(data)
+        raise HookForceResponse()
+
+    def on_before_subscribe(self, service, characteristic, enabled):
+        key = (service, characteristic)
+        with self._lock:
+            timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if enabled:
+            self._schedule(key)
+        raise HookForceResponse()
+
+    # Internals
+
+    def _load(self):
+        with CaptureIndex(self.path) as index:
+            for record in index.query(operation=READ):
+                key = (record.service, record.characteristic)
+                self.reads.setdefault(key, []).append(bytes(record.data))
+            for record in index.query(operation=NOTIFICATION):
+                key = (record.service, record.characteristic)
+                self.notifications.setdefault(key, []).append(
+                    (record.timestamp, bytes(record.data)))
+            for record in index.query(operation=SUBSCRIBE):
+                if record.flags & ENABLED:
+                    key = (record.service, record.characteristic)
+                    self.subscriptions.setdefault(key, []).append(record.timestamp)
+
+    def _next_read(self, key):
+        values = self.reads.get(key)
+        if not values:
+            return self.written.get(key, b'')
+        if not self.sequence:
+            return values[-1]
+        cursor = self._read_cursors.get(key, 0)
+        if cursor >= len(values):
+            cursor = 0 if self.loop else len(values) - 1
+        self._read_cursors[key] = cursor + 1
+        return values[cursor]
+
+    def _delay(self, key, cursor):
+        # Time between the notification at `cursor` and the previous
+        # notification or recorded subscription
+        notifications = self.notifications[key]
+        timestamp = notifications[cursor][0]
+        reference = notifications[cursor - 1][0] if cursor else timestamp
+        subscriptions = self.subscriptions.get(key, ())
+        position = bisect_right(subscriptions, timestamp)
+        if position and (not cursor or subscriptions[position - 1] > reference):
+            reference = subscriptions[position - 1]
+        if not self.speed:
+            return 0
+        return (timestamp - reference) / 1e9 / self.speed
+
+    def _schedule(self, key):
+        with self._lock:
+            timer = self._next_timer(key)
+        if timer is not None:
+            timer.start()
+
+    def _next_timer(self, key):
+        # Called with the lock held
+        notifications = self.notifications.get(key)
+        if not notifications:
+            return None
+        cursor = self._notification_cursors.get(key, 0)
+        if cursor >= len(notifications):
+            if not self.loop:
+                self._timers.pop(key, None)
+                return None
+            cursor = self._notification_cursors[key] = 0
+        timer = threading.Timer(
+            self._delay(key, cursor), self._notify, args=(key,))
+        timer.daemon = True
+        self._timers[key] = timer
+        return timer
+
+    def _notify(self, key):
+        with self._lock:
+            if self._timers.get(key) is not threading.current_thread():
+                # Subscription disabled
+                return
+            cursor = self._notification_cursors.get(key, 0)
+            data = self.notifications[key][cursor][1]
+            self._notification_cursors[key] = cursor + 1
+            timer = self._next_timer(key)
+        self.update_data(key[0], key[1], bufferize(data))
+        if timer is not None:
+            # Cancelled timers do not run once started
+            timer.start()
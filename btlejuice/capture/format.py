@@ -0,0 +1,118 @@
+"""
+BtleJuice capture format
+
+A capture file starts with an 8-byte header (magic, version, flags) followed
+by records. Each record is a 14-byte header (timestamp in nanoseconds since
+the epoch, operation, flags, characteristic ID, payload length) and its
+payload. Characteristics are interned: a DEFINE record assigns an ID to a
+service/characteristic pair (payload `service\\0characteristic`) before its
+first use. All integers are little-endian.
+"""
+import struct
+
+
+MAGIC = b'BJCP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBBH')
+RECORD = struct.Struct('<QBBHH')
+
+# Operations
+DEFINE = 0
+READ = 1
+WRITE = 2
+NOTIFICATION = 3
+SUBSCRIBE = 4
+CONNECT = 5
+DISCONNECT = 6
+
+OPERATIONS = {
+    DEFINE: 'define',
+    READ: 'read',
+    WRITE: 'write',
+    NOTIFICATION: 'notification',
+    SUBSCRIBE: 'subscribe',
+    CONNECT: 'connect',
+    DISCONNECT: 'disconnect',
+}
+
+# Record flags
+WITHOUT_RESPONSE = 0x01  # WRITE: write without response
+ENABLED = 0x01           # SUBSCRIBE: notifications enabled
+HAS_OFFSET = 0x02        # WRITE: payload starts with a 16-bit offset
+DELTA = 0x80             # Payload is a delta (see btlejuice.capture.delta)
+
+# Capture flags
+DELTA_ENCODED = 0x01     # Capture may contain delta records
+
+# Operations whose values may be delta encoded
+DELTA_OPERATIONS = (READ, WRITE, NOTIFICATION)
+
+# Characteristic ID of records not related to a characteristic.
+NO_CHARACTERISTIC = 0xffff
+MAX_CHARACTERISTICS = 0xffff
+MAX_PAYLOAD = 0xffff
+
+OFFSET = struct.Struct('<H')
+
+try:
+    from time import time_ns
+except ImportError:  # Python < 3.7
+    from time import time as _time
+
+    def time_ns():
+        return int(_time() * 1000000000)
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+FLAGS_OFFSET = 5
+
+
+def encode_header(flags=0):
+    return HEADER.pack(MAGIC, VERSION, flags, 0)
+
+
+def decode_header(data):
+    """
+    Return the flags of a capture file header.
+    """
+    if len(data) < HEADER.size:
+        raise CaptureFormatError('truncated capture header')
+    magic, version, flags, reserved = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CaptureFormatError('not a BtleJuice capture')
+    if version != VERSION:
+        raise CaptureFormatError('unsupported capture version %d' % version)
+    return flags
+
+
+def encode_name(service, characteristic):
+    """
+    Return the DEFINE record payload of a characteristic.
+    """
+    return ('%s\0%s' % (service, characteristic)).encode('utf-8')
+
+
+def decode_name(data):
+    """
+    Return the (service, characteristic) pair of a DEFINE record payload.
+    """
+    return tuple(bytes(data).decode('utf-8').split('\0', 1))
+
+
+def to_bytes(data):
+    """
+    Convert data received from the core to bytes.
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    if isinstance(data, list):
+        return bytes(bytearray(data))
+    if data is None:
+        return b''
+    return str(data).encode('utf-8')
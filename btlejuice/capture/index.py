@@ -0,0 +1,273 @@
+"""
+BtleJuice capture index
+
+The index of a capture is a sidecar file starting with a header (magic,
+version, CRC32 of the first record of the capture, to detect replaced
+captures) and made of segments, each one covering
+the records appended to the capture since the previous segment. A segment
+is a header (end of the capture covered, number of characteristic
+definitions and of entries), the characteristic definitions it introduces
+(ID, name length, `service\\0characteristic`) and its entries (characteristic
+ID, operation, timestamp, record offset) sorted by characteristic, operation
+and timestamp.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+from btlejuice.capture.format import (
+    HEADER, RECORD, DEFINE, OPERATIONS, NO_CHARACTERISTIC, CaptureFormatError,
+    encode_name, decode_name
+)
+from btlejuice.capture.chunks import open_capture
+
+
+INDEX_MAGIC = b'BJCI'
+INDEX_VERSION = 2
+
+INDEX_HEADER = struct.Struct('<4sBxxxI')
+SEGMENT = struct.Struct('<QII')
+DEFINITION = struct.Struct('<HH')
+ENTRY = struct.Struct('<HBQQ')
+
+MAX_TIMESTAMP = (1 << 64) - 1
+
+
+def _fingerprint(reader):
+    # CRC32 of the first record of a capture, None if it has no records
+    if reader.size < HEADER.size + RECORD.size:
+        return None
+    header = reader.header_at(HEADER.size)
+    return zlib.crc32(
+        RECORD.pack(*header) + bytes(reader.payload(HEADER.size, header[4]))
+    ) & 0xffffffff
+
+
+class CaptureIndex(object):
+    """
+    Index of a capture over characteristics, operations and time.
+
+    `query` binary searches each index segment and reads the matching
+    records from the capture, without scanning it. Opening the index
+    indexes the records appended to the capture since it was last updated
+    (see `update`), and rebuilds it if the capture was truncated or
+    replaced. The index is stored in `<capture>.idx` by default.
+    """
+
+    def __init__(self, path, index_path=None, update=True):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.reader = None
+        self._file = None
+        self._map = b''
+        self._load()
+        if update:
+            self.update()
+        else:
+            self._open_reader()
+
+    def update(self):
+        """
+        Index the records appended to the capture, return their number.
+        """
+        self._close_reader()
+        reader = open_capture(self.path, self.characteristics, self.end)
+        fingerprint = _fingerprint(reader)
+        if reader.size < self.end or fingerprint != self.fingerprint:
+            reader.close()
+            self._reset()
+            reader = open_capture(self.path, self.characteristics, self.end)
+        definitions = []
+        entries = []
+        end = self.end
+        try:
+            for position, header in reader.headers(self.end):
+                timestamp, operation, flags, id, length = header
+                if operation == DEFINE:
+                    definitions.append(
+                        (id, decode_name(reader.payload(position, length))))
+                else:
+                    entries.append((id, operation, timestamp, position))
+                end = position + RECORD.size + length
+        finally:
+            reader.close()
+        if end != self.end:
+            entries.sort()
+            self.fingerprint = fingerprint
+            self._write_segment(end, definitions, entries)
+        self._open_reader()
+        return len(entries)
+
+    def query(self, characteristic=None, operation=None, start=None, end=None,
+              service=None):
+        """
+        Iterate over the records matching a characteristic (and service),
+        an operation and a time range, in timestamp order.
+
+        Timestamps are in nanoseconds since the epoch, `start` is inclusive
+        and `end` exclusive. Records not related to a characteristic
+        (connections) only match queries without characteristic and service.
+        """
+        ids = [
+            id for id, (record_service, record_characteristic)
+            in self.characteristics.items()
+            if characteristic in (None, record_characteristic)
+            and service in (None, record_service)
+        ]
+        if characteristic is None and service is None:
+            ids.append(NO_CHARACTERISTIC)
+        if operation is None:
+            operations = [op for op in sorted(OPERATIONS) if op != DEFINE]
+        else:
+            operations = [operation]
+        start = start or 0
+        end = MAX_TIMESTAMP if end is None else end
+        matches = []
+        unpack_from = ENTRY.unpack_from
+        for base, count in self._segments:
+            for id in ids:
+                for op in operations:
+                    low = self._search(base, count, (id, op, start, 0))
+                    high = self._search(base, count, (id, op, end, 0))
+                    for i in range(low, high):
+                        entry = unpack_from(self._map, base + i * ENTRY.size)
+                        matches.append((entry[2], entry[3]))
+        matches.sort()
+        for timestamp, position in matches:
+            yield self.reader.record_at(position)
+
+    def current(self):
+        """
+        Return whether the index covers the whole capture, without
+        updating it.
+        """
+        return self.reader.size == self.end and \
+            _fingerprint(self.reader) == self.fingerprint
+
+    def segments(self):
+        """
+        Iterate over the entries of each index segment, as (buffer, offset,
+        count) tuples: `count` ENTRY structures at `offset` in `buffer`.
+        """
+        for base, count in self._segments:
+            yield self._map, base, count
+
+    def close(self):
+        self._close_reader()
+        self._close_map()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_pack):
+        self.close()
+
+    def _search(self, base, count, key):
+        # Index of the first entry not lower than key
+        low, high = 0, count
+        unpack_from = ENTRY.unpack_from
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_from(self._map, base + middle * ENTRY.size) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _load(self):
+        self.characteristics = {}
+        self.end = HEADER.size
+        self.fingerprint = None
+        self._segments = []
+        self._size = 0
+        if not os.path.exists(self.index_path):
+            return
+        self._map_index()
+        data = self._map
+        if len(data) < INDEX_HEADER.size:
+            return
+        magic, version, fingerprint = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC:
+            raise CaptureFormatError('not a BtleJuice capture index')
+        if version < INDEX_VERSION:
+            # Indexes without fingerprint are rebuilt
+            self._reset()
+            return
+        if version != INDEX_VERSION:
+            raise CaptureFormatError('unsupported index version %d' % version)
+        self.fingerprint = fingerprint
+        position = INDEX_HEADER.size
+        self._size = position
+        # Segments truncated by a crash are ignored and overwritten
+        while position + SEGMENT.size <= len(data):
+            end, definitions, count = SEGMENT.unpack_from(data, position)
+            position += SEGMENT.size
+            names = {}
+            for i in range(definitions):
+                if position + DEFINITION.size > len(data):
+                    return
+                id, length = DEFINITION.unpack_from(data, position)
+                position += DEFINITION.size
+                names[id] = decode_name(data[position:position + length])
+                position += length
+            if position + count * ENTRY.size > len(data):
+                return
+            self._segments.append((position, count))
+            position += count * ENTRY.size
+            self.characteristics.update(names)
+            self.end = end
+            self._size = position
+
+    def _reset(self):
+        self._close_map()
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        self._load()
+
+    def _write_segment(self, end, definitions, entries):
+        segment = bytearray()
+        if not self._size:
+            segment += INDEX_HEADER.pack(
+                INDEX_MAGIC, INDEX_VERSION, self.fingerprint)
+        segment += SEGMENT.pack(end, len(definitions), len(entries))
+        for id, (service, characteristic) in definitions:
+            name = encode_name(service, characteristic)
+            segment += DEFINITION.pack(id, len(name))
+            segment += name
+        base = self._size + len(segment)
+        for entry in entries:
+            segment += ENTRY.pack(*entry)
+        self._close_map()
+        with open(self.index_path, 'r+b' if self._size else 'wb') as index:
+            index.truncate(self._size)
+            index.seek(self._size)
+            index.write(segment)
+        self._size += len(segment)
+        self._segments.append((base, len(entries)))
+        self.characteristics.update(definitions)
+        self.end = end
+        self._map_index()
+
+    def _map_index(self):
+        self._file = open(self.index_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._map = b''
+
+    def _close_map(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = b''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open_reader(self):
+        self.reader = open_capture(self.path, self.characteristics, self.end)
+
+    def _close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -0,0 +1,58 @@
+"""
+BtleJuice capture interface
+"""
+from btlejuice.interface import SniffingInterface
+from btlejuice.utils import unbufferize
+from btlejuice.capture.writer import CaptureWriter
+
+
+class CaptureInterface(SniffingInterface):
+    """
+    Sniffing interface recording reads, writes, notifications,
+    subscriptions and client connections to a capture file.
+
+    Records are written before the `on_*` callbacks are called, so they can
+    be overriden without calling this class. The capture is flushed when
+    the interface is disconnected from the core: call `close` once done
+    (this also indexes the capture with `index`).
+    """
+
+    def __init__(self, host, port, target, path, buffer_size=65536,
+                 flush_interval=1.0, index=False, delta=False,
+                 compression=None, **kw):
+        self.capture = CaptureWriter(
+            path, buffer_size, flush_interval, index, delta,
+            compression=compression)
+        SniffingInterface.__init__(self, host, port, target, **kw)
+
+    def client_connect(self, client):
+        self.capture.connect(client)
+
+    def client_disconnect(self, client):
+        self.capture.disconnect(client)
+
+    def read_response(self, service, characteristic, data):
+        self.capture.read(service, characteristic, unbufferize(data))
+        SniffingInterface.read_response(self, service, characteristic, data)
+
+    def write_request(self, service, characteristic, data, offset, withoutResponse):
+        self.capture.write(
+            service, characteristic, unbufferize(data), offset or 0,
+            withoutResponse)
+        SniffingInterface.write_request(
+            self, service, characteristic, data, offset, withoutResponse)
+
+    def notify_request(self, service, characteristic, enabled):
+        self.capture.subscribe(service, characteristic, enabled)
+        SniffingInterface.notify_request(self, service, characteristic, enabled)
+
+    def update_data(self, service, characteristic, data):
+        self.capture.notification(service, characteristic, unbufferize(data))
+        SniffingInterface.update_data(self, service, characteristic, data)
+
+    def disconnect(self):
+        SniffingInterface.disconnect(self)
+        self.capture.flush()
+
+    def close(self):
+        self.capture.close()
@@ -0,0 +1,92 @@
+"""
+BtleJuice capture merging
+"""
+import heapq
+import os
+from collections import namedtuple
+
+from btlejuice.capture.chunks import open_capture
+from btlejuice.capture.writer import CaptureWriter
+
+
+MergedRecord = namedtuple('MergedRecord', ('source', 'record'))
+
+
+def source_name(path):
+    """
+    Return the default source name of a capture: its file name without
+    extension.
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def merge_captures(paths, offsets=None, sources=None):
+    """
+    Iterate over the records of several captures in timestamp order, as
+    `MergedRecord` (source, record) tuples.
+
+    Captures are read in streaming, one record per capture being held at a
+    time. `offsets` are clock corrections (nanoseconds) added to the
+    timestamps of each capture, and `sources` the names records are tagged
+    with (default: the capture file names without extension). Records with
+    the same timestamp are returned in capture order. Record data are only
+    valid until the next record is read (copy them with `bytes()`).
+    """
+    offsets = list(offsets or ())
+    offsets += [0] * (len(paths) - len(offsets))
+    if sources is None:
+        sources = [source_name(path) for path in paths]
+    readers = []
+    try:
+        heap = []
+        for position, path in enumerate(paths):
+            reader = open_capture(path)
+            readers.append(reader)
+            records = iter(reader)
+            for record in records:
+                heap.append((
+                    record.timestamp + offsets[position], position, record,
+                    records))
+                break
+        heapq.heapify(heap)
+        while heap:
+            timestamp, position, record, records = heap[0]
+            if offsets[position]:
+                record = record._replace(timestamp=timestamp)
+            yield MergedRecord(sources[position], record)
+            for record in records:
+                heapq.heapreplace(heap, (
+                    record.timestamp + offsets[position], position, record,
+                    records))
+                break
+            else:
+                heapq.heappop(heap)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def write_merged(paths, output, offsets=None, sources=None, tag=False,
+                 **kw):
+    """
+    Write the records of several captures to `output` in timestamp order
+    (see `merge_captures`), return the number of records written.
+
+    With `tag`, services and client addresses of the merged capture are
+    prefixed with their source name (`source/service`). Other keyword
+    arguments are passed to `CaptureWriter`.
+    """
+    count = 0
+    kw.setdefault('buffer_size', 1 << 20)
+    with CaptureWriter(output, **kw) as writer:
+        for source, record in merge_captures(paths, offsets, sources):
+            if tag:
+                if record.service is None:
+                    record = record._replace(
+                        data=source.encode('utf-8') + b'/' + bytes(record.data))
+                else:
+                    record = record._replace(
+                        service='%s/%s' % (source, record.service))
+            writer.add(record)
+            count += 1
+    return count
@@ -0,0 +1,284 @@
+"""
+BtleJuice PCAP/PCAPNG export
+
+Proxied GATT operations are written as ATT PDUs in HCI ACL packets
+(link type DLT_BLUETOOTH_HCI_H4_WITH_PHDR), which Wireshark decodes down to
+the ATT layer. Packets are written from the point of view of the device
+emulated by the proxy: requests from the client application are received,
+responses and notifications are sent. Characteristics are given
+synthetic ATT handles in order of appearance, their client characteristic
+configuration descriptor (written by subscriptions) being the next handle.
+Client connections are written as HCI connection events.
+"""
+import struct
+
+from btlejuice.capture.format import (
+    READ, WRITE, NOTIFICATION, SUBSCRIBE, CONNECT, DISCONNECT,
+    WITHOUT_RESPONSE, ENABLED, time_ns, to_bytes
+)
+from btlejuice.capture.interface import CaptureInterface
+from btlejuice.capture.chunks import open_capture
+from btlejuice.capture.reader import write_offset
+from btlejuice.capture.writer import BufferedWriter
+from btlejuice.interface import SniffingInterface
+
+
+LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR = 201
+SNAPLEN = 65535
+
+# PCAP (nanosecond timestamps)
+PCAP_HEADER = struct.Struct('<IHHiIII')
+PCAP_MAGIC_NANOSECONDS = 0xa1b23c4d
+PCAP_RECORD = struct.Struct('<IIII')
+
+# PCAPNG
+BLOCK_SECTION_HEADER = 0x0a0d0d0a
+BLOCK_INTERFACE_DESCRIPTION = 0x00000001
+BLOCK_ENHANCED_PACKET = 0x00000006
+BYTE_ORDER_MAGIC = 0x1a2b3c4d
+OPTION_END = 0
+OPTION_COMMENT = 1
+OPTION_TSRESOL = 9
+
+# H4 with pseudo-header
+DIRECTION = struct.Struct('>I')
+SENT = 0
+RECEIVED = 1
+REQUEST = RECEIVED
+RESPONSE = SENT
+H4_ACL = 0x02
+H4_EVENT = 0x04
+ACL_HEADER = struct.Struct('<HH')
+L2CAP_HEADER = struct.Struct('<HH')
+L2CAP_ATT = 0x0004
+CONNECTION_HANDLE = 0x0040
+PACKET_BOUNDARY_START = 0x2000
+
+# ATT opcodes
+ATT_READ_REQUEST = 0x0a
+ATT_READ_RESPONSE = 0x0b
+ATT_WRITE_REQUEST = 0x12
+ATT_WRITE_RESPONSE = 0x13
+ATT_PREPARE_WRITE_REQUEST = 0x16
+ATT_PREPARE_WRITE_RESPONSE = 0x17
+ATT_HANDLE_VALUE_NOTIFICATION = 0x1b
+ATT_WRITE_COMMAND = 0x52
+ATT_HANDLE = struct.Struct('<BH')
+ATT_PREPARE_WRITE = struct.Struct('<BHH')
+
+# HCI events
+HCI_DISCONNECTION_COMPLETE = 0x05
+HCI_LE_META = 0x3e
+HCI_LE_CONNECTION_COMPLETE = 0x01
+REMOTE_USER_TERMINATED = 0x13
+
+FIRST_HANDLE = 0x0010
+
+FORMATS = ('pcap', 'pcapng')
+
+
+def _option(code, value):
+    padding = -len(value) % 4
+    return struct.pack('<HH', code, len(value)) + value + b'\0' * padding
+
+
+def _block(type, body):
+    length = 12 + len(body)
+    return struct.pack('<II', type, length) + body + struct.pack('<I', length)
+
+
+def _address(client):
+    # Bluetooth addresses are sent least significant byte first
+    try:
+        address = bytearray(int(byte, 16) for byte in client.split(':'))
+    except (AttributeError, ValueError):
+        address = bytearray()
+    if len(address) != 6:
+        address = bytearray(6)
+    address.reverse()
+    return bytes(address)
+
+
+class PcapWriter(BufferedWriter):
+    """
+    Buffered PCAP or PCAPNG writer of proxied GATT operations.
+
+    Has the same recording methods as `CaptureWriter`, so it can be used as
+    a live sink (see `PcapInterface`), and `add` converts capture records.
+    PCAPNG packets are commented with their service and characteristic.
+    """
+
+    def __init__(self, path, format='pcapng', buffer_size=65536,
+                 flush_interval=1.0):
+        if format not in FORMATS:
+            raise ValueError('unknown format %s' % format)
+        self.path = path
+        self.format = format
+        self.handles = {}
+        self.packets = 0
+        file = open(path, 'wb')
+        if format == 'pcap':
+            file.write(PCAP_HEADER.pack(
+                PCAP_MAGIC_NANOSECONDS, 2, 4, 0, 0, SNAPLEN,
+                LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR))
+        else:
+            file.write(_block(BLOCK_SECTION_HEADER, struct.pack(
+                '<IHHq', BYTE_ORDER_MAGIC, 1, 0, -1)))
+            file.write(_block(BLOCK_INTERFACE_DESCRIPTION, struct.pack(
+                '<HHI', LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR, 0, SNAPLEN) +
+                _option(OPTION_TSRESOL, b'\x09') + _option(OPTION_END, b'')))
+        file.flush()
+        BufferedWriter.__init__(self, file, buffer_size, flush_interval)
+
+    def read(self, service, characteristic, data, timestamp=None):
+        handle = self._handle(service, characteristic)
+        self._att(timestamp, service, characteristic, (
+            (REQUEST, ATT_HANDLE.pack(ATT_READ_REQUEST, handle)),
+            (RESPONSE, bytes(bytearray([ATT_READ_RESPONSE])) + to_bytes(data)),
+        ))
+
+    def write(self, service, characteristic, data, offset=0,
+              withoutResponse=False, timestamp=None):
+        handle = self._handle(service, characteristic)
+        data = to_bytes(data)
+        if withoutResponse:
+            pdus = ((REQUEST, ATT_HANDLE.pack(ATT_WRITE_COMMAND, handle) + data),)
+        elif offset:
+            pdus = (
+                (REQUEST, ATT_PREPARE_WRITE.pack(
+                    ATT_PREPARE_WRITE_REQUEST, handle, offset) + data),
+                (RESPONSE, ATT_PREPARE_WRITE.pack(
+                    ATT_PREPARE_WRITE_RESPONSE, handle, offset) + data),
+            )
+        else:
+            pdus = (
+                (REQUEST, ATT_HANDLE.pack(ATT_WRITE_REQUEST, handle) + data),
+                (RESPONSE, bytes(bytearray([ATT_WRITE_RESPONSE]))),
+            )
+        self._att(timestamp, service, characteristic, pdus)
+
+    def notification(self, service, characteristic, data, timestamp=None):
+        handle = self._handle(service, characteristic)
+        self._att(timestamp, service, characteristic, ((
+            RESPONSE,
+            ATT_HANDLE.pack(ATT_HANDLE_VALUE_NOTIFICATION, handle) + to_bytes(data)
+        ),))
+
+    def subscribe(self, service, characteristic, enabled, timestamp=None):
+        handle = self._handle(service, characteristic) + 1
+        value = b'\x01\x00' if enabled else b'\x00\x00'
+        self._att(timestamp, service, characteristic, (
+            (REQUEST, ATT_HANDLE.pack(ATT_WRITE_REQUEST, handle) + value),
+            (RESPONSE, bytes(bytearray([ATT_WRITE_RESPONSE]))),
+        ))
+
+    def connect(self, client, timestamp=None):
+        client = to_bytes(client).decode('utf-8', 'replace')
+        parameters = struct.pack(
+            '<BBHBB6sHHHB', HCI_LE_CONNECTION_COMPLETE, 0, CONNECTION_HANDLE,
+            1, 0, _address(client), 24, 0, 72, 0)
+        self._event(timestamp, HCI_LE_META, parameters, client)
+
+    def disconnect(self, client, timestamp=None):
+        client = to_bytes(client).decode('utf-8', 'replace')
+        parameters = struct.pack(
+            '<BHB', 0, CONNECTION_HANDLE, REMOTE_USER_TERMINATED)
+        self._event(timestamp, HCI_DISCONNECTION_COMPLETE, parameters, client)
+
+    def add(self, record):
+        """
+        Write a `CaptureRecord`.
+        """
+        operation = record.operation
+        if operation == READ:
+            self.read(
+                record.service, record.characteristic, record.data,
+                record.timestamp)
+        elif operation == WRITE:
+            offset, data = write_offset(record)
+            self.write(
+                record.service, record.characteristic, data, offset,
+                bool(record.flags & WITHOUT_RESPONSE), record.timestamp)
+        elif operation == NOTIFICATION:
+            self.notification(
+                record.service, record.characteristic, record.data,
+                record.timestamp)
+        elif operation == SUBSCRIBE:
+            self.subscribe(
+                record.service, record.characteristic,
+                bool(record.flags & ENABLED), record.timestamp)
+        elif operation == CONNECT:
+            self.connect(record.data, record.timestamp)
+        elif operation == DISCONNECT:
+            self.disconnect(record.data, record.timestamp)
+
+    def _handle(self, service, characteristic):
+        key = (service, characteristic)
+        handle = self.handles.get(key)
+        if handle is None:
+            # Declaration, value and configuration descriptor handles
+            handle = FIRST_HANDLE + 3 * len(self.handles) + 1
+            self.handles[key] = handle
+        return handle
+
+    def _att(self, timestamp, service, characteristic, pdus):
+        if timestamp is None:
+            timestamp = time_ns()
+        comment = '%s:%s' % (service, characteristic)
+        for direction, pdu in pdus:
+            l2cap = L2CAP_HEADER.pack(len(pdu), L2CAP_ATT) + pdu
+            acl = ACL_HEADER.pack(
+                CONNECTION_HANDLE | PACKET_BOUNDARY_START, len(l2cap)) + l2cap
+            self._packet(
+                timestamp, DIRECTION.pack(direction) +
+                bytes(bytearray([H4_ACL])) + acl, comment)
+
+    def _event(self, timestamp, code, parameters, comment):
+        self._packet(
+            timestamp, DIRECTION.pack(RECEIVED) +
+            struct.pack('<BBB', H4_EVENT, code, len(parameters)) + parameters,
+            comment)
+
+    def _packet(self, timestamp, packet, comment):
+        if timestamp is None:
+            timestamp = time_ns()
+        if self.format == 'pcap':
+            header = PCAP_RECORD.pack(
+                timestamp // 1000000000, timestamp % 1000000000, len(packet),
+                len(packet))
+            with self._lock:
+                self.packets += 1
+                self._append(header, packet)
+            return
+        body = struct.pack(
+            '<IIIII', 0, timestamp >> 32, timestamp & 0xffffffff, len(packet),
+            len(packet)) + packet + b'\0' * (-len(packet) % 4)
+        body += _option(OPTION_COMMENT, comment.encode('utf-8'))
+        body += _option(OPTION_END, b'')
+        with self._lock:
+            self.packets += 1
+            self._append(_block(BLOCK_ENHANCED_PACKET, body))
+
+
+class PcapInterface(CaptureInterface):
+    """
+    Sniffing interface writing proxied GATT operations to a PCAP or PCAPNG
+    file (see `PcapWriter`).
+    """
+
+    def __init__(self, host, port, target, path, format='pcapng',
+                 buffer_size=65536, flush_interval=1.0, **kw):
+        self.capture = PcapWriter(path, format, buffer_size, flush_interval)
+        SniffingInterface.__init__(self, host, port, target, **kw)
+
+
+def export_pcap(capture, path, format='pcapng'):
+    """
+    Convert a capture file to PCAP or PCAPNG, return the number of packets
+    written.
+    """
+    with open_capture(capture) as reader:
+        with PcapWriter(path, format, buffer_size=1 << 20) as writer:
+            for record in reader:
+                writer.add(record)
+    return writer.packets
@@ -0,0 +1,202 @@
+"""
+BtleJuice capture reader
+"""
+import mmap
+from collections import namedtuple
+
+from btlejuice.capture.format import (
+    HEADER, RECORD, OFFSET, DEFINE, WRITE, HAS_OFFSET, DELTA, DELTA_ENCODED,
+    NO_CHARACTERISTIC, decode_header, decode_name
+)
+from btlejuice.capture.delta import apply_patch, delta_distance
+
+
+CaptureRecord = namedtuple('CaptureRecord', [
+    'timestamp', 'operation', 'service', 'characteristic', 'flags', 'data'])
+
+
+class CaptureReader(object):
+    """
+    Memory-mapped capture reader.
+
+    Iterating yields `CaptureRecord`s whose `data` is a memoryview of the
+    mapped file (no copy): convert it with bytes() to keep it after `close`.
+    Write offsets are left in the payload (see `write_offset`). A record
+    truncated by a crash ends the capture. Delta encoded values are decoded
+    (as bytes): sequentially while iterating, from their last keyframe
+    otherwise.
+
+    The capture is scanned on opening to load characteristic definitions,
+    unless they are given with the `end` of the capture they cover (as done
+    by `CaptureIndex`).
+    """
+
+    def __init__(self, path, characteristics=None, end=None):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._map = b''
+        try:
+            self.flags = decode_header(self._map)
+        except Exception:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._file.close()
+            raise
+        self._view = memoryview(self._map)
+        self.size = len(self._map)
+        self.codec = None
+        self.characteristics = dict(characteristics or {})
+        if end is None:
+            end = HEADER.size
+            # Load characteristic definitions and find the end of the capture
+            for position, header in self.headers():
+                timestamp, operation, flags, id, length = header
+                if operation == DEFINE:
+                    self.characteristics[id] = self._define(position, length)
+                end = position + RECORD.size + length
+        self.end = end
+
+    def __iter__(self):
+        return self.records()
+
+    def seek(self, timestamp):
+        """
+        Return an offset from which to iterate over the records at or after
+        `timestamp` with `records`. Uncompressed captures are not indexed
+        by time: use `CaptureIndex` to search them.
+        """
+        return HEADER.size
+
+    def records(self, start=None, stop=None):
+        """
+        Iterate over the records starting at file offset `start` (and
+        before offset `stop`).
+        """
+        if not self.flags & DELTA_ENCODED:
+            for position, header in self.headers(start, stop):
+                if header[1] == DEFINE:
+                    self.characteristics[header[3]] = self._define(position, header[4])
+                    continue
+                yield self._record(position, header)
+            return
+        # Last value of each (characteristic ID, operation): position, value
+        values = {}
+        for position, header in self.headers(start, stop):
+            timestamp, operation, flags, id, length = header
+            if operation == DEFINE:
+                self.characteristics[id] = self._define(position, length)
+                continue
+            key = (id, operation)
+            data = self.payload(position, length)
+            if flags & DELTA:
+                distance, patch = delta_distance(data)
+                previous = values.get(key)
+                if previous is not None and previous[0] == position - distance:
+                    data = apply_patch(previous[1], data, patch)
+                else:
+                    data = self._decode(position, header)
+            values[key] = (position, data)
+            yield self._record(position, header, data)
+
+    def headers(self, start=None, stop=None):
+        """
+        Iterate over the (offset, header) of the records starting at file
+        offset `start` (and before offset `stop`). Headers are (timestamp,
+        operation, flags, characteristic ID, length) tuples.
+        """
+        data = self._map
+        size = len(data) if stop is None else min(stop, len(data))
+        position = HEADER.size if start is None else start
+        unpack_from = RECORD.unpack_from
+        while position + RECORD.size <= size:
+            header = unpack_from(data, position)
+            if position + RECORD.size + header[4] > size:
+                break
+            yield position, header
+            position += RECORD.size + header[4]
+
+    def blocks(self):
+        """
+        Iterate over (offset, data) blocks of the records of the capture,
+        `data` being the capture from file offset `offset`.
+        """
+        yield 0, self._view[:self.end]
+
+    def header_at(self, position):
+        """
+        Return the header of the record at file offset `position`.
+        """
+        return RECORD.unpack_from(self._map, position)
+
+    def record_at(self, position):
+        """
+        Return the record at file offset `position`.
+        """
+        return self._record(position, self.header_at(position))
+
+    def payload(self, position, length):
+        """
+        Return a view of the payload of the record at file offset `position`.
+        """
+        start = position + RECORD.size
+        return self._view[start:start + length]
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                # Payloads are still referenced, the map is closed with them
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_pack):
+        self.close()
+
+    def _record(self, position, header, data=None):
+        timestamp, operation, flags, id, length = header
+        if id == NO_CHARACTERISTIC:
+            service = characteristic = None
+        else:
+            service, characteristic = self.characteristics[id]
+        if data is None:
+            if flags & DELTA:
+                data = self._decode(position, header)
+            else:
+                data = self.payload(position, length)
+        return CaptureRecord(
+            timestamp, operation, service, characteristic, flags & ~DELTA,
+            data)
+
+    def _decode(self, position, header):
+        # Walk back to the last keyframe, then apply the patches
+        patches = []
+        while header[2] & DELTA:
+            delta = self.payload(position, header[4])
+            distance, patch = delta_distance(delta)
+            patches.append((delta, patch))
+            position -= distance
+            header = self.header_at(position)
+        value = self.payload(position, header[4])
+        for delta, patch in reversed(patches):
+            value = apply_patch(value, delta, patch)
+        return bytes(value)
+
+    def _define(self, position, length):
+        return decode_name(self.payload(position, length))
+
+
+def write_offset(record):
+    """
+    Return the offset and data of a WRITE record.
+    """
+    if record.operation == WRITE and record.flags & HAS_OFFSET:
+        return OFFSET.unpack_from(record.data)[0], record.data[OFFSET.size:]
+    return 0, record.data
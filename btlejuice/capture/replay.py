@@ -0,0 +1,164 @@
+"""
+BtleJuice capture replay
+"""
+import time
+
+from btlejuice.capture.chunks import open_capture
+from btlejuice.capture.format import (
+    READ, WRITE, NOTIFICATION, SUBSCRIBE, CONNECT, DISCONNECT,
+    WITHOUT_RESPONSE, ENABLED
+)
+from btlejuice.capture.reader import write_offset
+
+
+# Maximum number of device request/response rounds per replayed record
+MAX_ROUNDS = 8
+
+
+def core_event(record):
+    """
+    Return the core event (event, args) that led to a capture record.
+    """
+    operation = record.operation
+    if operation == READ:
+        return 'proxy_read', (record.service, record.characteristic, 0)
+    if operation == WRITE:
+        offset, data = write_offset(record)
+        return 'proxy_write', (
+            record.service, record.characteristic, bytes(data), offset,
+            bool(record.flags & WITHOUT_RESPONSE))
+    if operation == NOTIFICATION:
+        return 'data', (
+            record.service, record.characteristic, bytes(record.data))
+    if operation == SUBSCRIBE:
+        return 'proxy_notify', (
+            record.service, record.characteristic,
+            bool(record.flags & ENABLED))
+    client = bytes(record.data).decode('utf-8', 'replace')
+    if operation == CONNECT:
+        return 'app.connect', (client,)
+    if operation == DISCONNECT:
+        return 'app.disconnect', (client,)
+    return None
+
+
+def device_response(request, values):
+    """
+    Return the core event answering a device request emitted by an
+    interface (ble_read, ble_write, ble_notify), or None. Reads are
+    answered from `values`, mapping (service, characteristic) to values.
+    """
+    event = request[0]
+    if event == 'ble_read':
+        return 'ble_read_resp', (
+            request[1], request[2], values.get((request[1], request[2]), b''))
+    if event == 'ble_write':
+        if len(request) > 5 and request[5]:
+            # Write without response
+            return None
+        return 'ble_write_resp', (request[1], request[2], False)
+    if event == 'ble_notify':
+        return 'ble_notify_resp', (request[1], request[2])
+    return None
+
+
+class Replayer(object):
+    """
+    Capture replayer.
+
+    Records are turned back into the core events that produced them: reads
+    into `proxy_read` requests, writes into `proxy_write`, subscriptions
+    into `proxy_notify`, notifications into `data` and client connections
+    into `app.connect` and `app.disconnect`. `replay` feeds them to an app
+    through a `LoopbackTransport`, answering the device requests of its
+    interface with the recorded values, and `MockCore.start_replay` sends
+    them from a local core stand-in.
+
+    `speed` scales the recorded timing: 1.0 replays in real time, 10.0 ten
+    times faster, 0 as fast as possible. `start` and `end` (nanoseconds
+    since the epoch, end excluded) select a part of the capture.
+    """
+
+    def __init__(self, path, speed=1.0, start=None, end=None):
+        self.path = path
+        self.speed = speed
+        self.start = start
+        self.end = end
+        # Events sent by the interface, with the timestamp of the record
+        # being replayed, when collected
+        self.emitted = []
+
+    def records(self):
+        """
+        Iterate over the replayed records.
+        """
+        with open_capture(self.path) as reader:
+            start = None if self.start is None else reader.seek(self.start)
+            for record in reader.records(start):
+                if self.start is not None and record.timestamp < self.start:
+                    continue
+                if self.end is not None and record.timestamp >= self.end:
+                    break
+                yield record
+
+    def timed_records(self, wait=time.sleep):
+        """
+        Iterate over the replayed records, each one when it is due.
+        """
+        origin = started = None
+        for record in self.records():
+            if self.speed:
+                if origin is None:
+                    origin = record.timestamp
+                    started = time.time()
+                delay = started + (record.timestamp - origin) / 1e9 / self.speed - time.time()
+                if delay > 0:
+                    wait(delay)
+            yield record
+
+    def replay(self, app, transport, collect=False):
+        """
+        Replay the capture to an app using a `LoopbackTransport`, return
+        the number of records and events replayed and the replay duration.
+
+        With `collect`, events sent by the interface are kept in `emitted`.
+        """
+        values = {}
+        records = events = 0
+        started = time.time()
+        # Dispatch the packets queued on connection
+        transport.process()
+        transport.clear()
+        for record in self.timed_records():
+            event = core_event(record)
+            if event is None:
+                continue
+            if record.operation in (READ, NOTIFICATION):
+                values[(record.service, record.characteristic)] = bytes(record.data)
+            transport.feed_event(event[0], *event[1])
+            transport.process()
+            records += 1
+            events += 1
+            for round in range(MAX_ROUNDS):
+                emitted = transport.emitted()
+                transport.clear()
+                if collect:
+                    self.emitted.extend(
+                        (record.timestamp, request) for request in emitted)
+                responses = [
+                    response for response in (
+                        device_response(request, values) for request in emitted)
+                    if response is not None]
+                if not responses:
+                    break
+                for response in responses:
+                    transport.feed_event(response[0], *response[1])
+                events += len(responses)
+                transport.process()
+        elapsed = time.time() - started
+        return {
+            'records': records,
+            'events': events,
+            'elapsed': elapsed,
+            'events_per_sec': events / elapsed if elapsed else 0,
+        }
@@ -0,0 +1,254 @@
+"""
+BtleJuice capture writer
+"""
+import os
+import threading
+import time
+
+from btlejuice.capture.format import (
+    RECORD, OFFSET, DEFINE, READ, WRITE, NOTIFICATION, SUBSCRIBE, CONNECT,
+    DISCONNECT, WITHOUT_RESPONSE, ENABLED, HAS_OFFSET, DELTA, DELTA_ENCODED,
+    DELTA_OPERATIONS, NO_CHARACTERISTIC, MAX_CHARACTERISTICS, MAX_PAYLOAD,
+    FLAGS_OFFSET, CaptureFormatError, encode_header, encode_name, time_ns,
+    to_bytes
+)
+from btlejuice.capture.chunks import ChunkedFile, open_capture
+from btlejuice.capture.delta import encode_delta
+
+
+class BufferedWriter(object):
+    """
+    Buffered file writer.
+
+    Data are written when the buffer exceeds `buffer_size` bytes, at most
+    `flush_interval` seconds after they were buffered (by a flusher thread,
+    started with the first buffered data), on `flush` and on `close`.
+    Subclasses append to the buffer with `_append` while holding `_lock`.
+    """
+
+    def __init__(self, file, buffer_size=65536, flush_interval=1.0):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._file = file
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._buffered = threading.Condition(self._lock)
+        self._flushed_at = time.time()
+        self._flusher = None
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush()
+            self._file.close()
+            self._buffered.notify()
+            flusher = self._flusher
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_pack):
+        self.close()
+
+    def _append(self, *chunks):
+        empty = not self._buffer
+        for chunk in chunks:
+            self._buffer += chunk
+        if len(self._buffer) >= self.buffer_size or \
+                time.time() - self._flushed_at >= self.flush_interval:
+            self._flush()
+        elif self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher)
+            self._flusher.daemon = True
+            self._flusher.start()
+        elif empty:
+            self._buffered.notify()
+
+    def _run_flusher(self):
+        # Flush data left in the buffer for `flush_interval` seconds
+        with self._lock:
+            while not self._file.closed:
+                if not self._buffer:
+                    self._buffered.wait()
+                    continue
+                delay = self._flushed_at + self.flush_interval - time.time()
+                if delay > 0:
+                    self._buffered.wait(delay)
+                else:
+                    self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            del self._buffer[:]
+        self._flushed_at = time.time()
+
+
+class CaptureWriter(BufferedWriter):
+    """
+    Append-only capture writer.
+
+    Records are buffered (see `BufferedWriter`). Writing to an existing
+    capture appends to it. With `index`, the capture index is updated on
+    `close`.
+
+    With `delta`, read, written and notified values are stored as deltas
+    against the previous value of the same characteristic and operation
+    when this is smaller, and in full every `keyframe_interval` values so
+    that a record can be decoded without reading the whole capture.
+    Readers decode them transparently.
+
+    With `compression` (a codec from `available_codecs`), records are
+    compressed in chunks of about `chunk_size` bytes (see `ChunkedFile`).
+    They are only written once their chunk is complete.
+    """
+
+    def __init__(self, path, buffer_size=65536, flush_interval=1.0,
+                 index=False, delta=False, keyframe_interval=32,
+                 compression=None, chunk_size=1 << 20):
+        self.path = path
+        self.index = index
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.characteristics = {}
+        self.records = 0
+        # Last value of each (characteristic ID, operation): position, value
+        # and number of values since the last keyframe
+        self._values = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open_capture(path) as reader:
+                for id, key in reader.characteristics.items():
+                    self.characteristics[key] = id
+                end = reader.end
+                flags = reader.flags
+                self.compression = reader.codec
+        if self.compression is not None:
+            file = ChunkedFile(
+                path, self.compression, DELTA_ENCODED if delta else 0,
+                self.characteristics)
+            end = file.offset
+        elif os.path.exists(path) and os.path.getsize(path) > 0:
+            file = open(path, 'r+b')
+            # Drop any record truncated by a crash
+            file.truncate(end)
+            if delta and not flags & DELTA_ENCODED:
+                file.seek(FLAGS_OFFSET)
+                file.write(bytes(bytearray([flags | DELTA_ENCODED])))
+            file.seek(end)
+        else:
+            file = open(path, 'wb')
+            file.write(encode_header(DELTA_ENCODED if delta else 0))
+            file.flush()
+            end = file.tell()
+        self._position = self._chunk_start = end
+        BufferedWriter.__init__(self, file, buffer_size, flush_interval)
+
+    def read(self, service, characteristic, data, timestamp=None):
+        self.write_record(READ, service, characteristic, data, 0, timestamp)
+
+    def write(self, service, characteristic, data, offset=0,
+              withoutResponse=False, timestamp=None):
+        flags = WITHOUT_RESPONSE if withoutResponse else 0
+        data = to_bytes(data)
+        if offset:
+            flags |= HAS_OFFSET
+            data = OFFSET.pack(offset) + data
+        self.write_record(WRITE, service, characteristic, data, flags, timestamp)
+
+    def notification(self, service, characteristic, data, timestamp=None):
+        self.write_record(
+            NOTIFICATION, service, characteristic, data, 0, timestamp)
+
+    def subscribe(self, service, characteristic, enabled, timestamp=None):
+        self.write_record(
+            SUBSCRIBE, service, characteristic, b'',
+            ENABLED if enabled else 0, timestamp)
+
+    def connect(self, client, timestamp=None):
+        self.write_record(CONNECT, None, None, client, 0, timestamp)
+
+    def disconnect(self, client, timestamp=None):
+        self.write_record(DISCONNECT, None, None, client, 0, timestamp)
+
+    def add(self, record):
+        """
+        Append a `CaptureRecord` (read from another capture).
+        """
+        self.write_record(
+            record.operation, record.service, record.characteristic,
+            record.data, record.flags, record.timestamp)
+
+    def write_record(self, operation, service, characteristic, data, flags=0,
+                     timestamp=None):
+        """
+        Append a record. `timestamp` is in nanoseconds since the epoch
+        (default: now).
+        """
+        data = to_bytes(data)
+        if len(data) > MAX_PAYLOAD:
+            raise CaptureFormatError('payload too large (%d bytes)' % len(data))
+        if timestamp is None:
+            timestamp = time_ns()
+        with self._lock:
+            if self.compression is not None and \
+                    self._position - self._chunk_start >= self.chunk_size:
+                self._end_chunk()
+            if service is None:
+                id = NO_CHARACTERISTIC
+            else:
+                id = self._intern(service, characteristic, timestamp)
+                if self.delta and operation in DELTA_OPERATIONS:
+                    data, flags = self._encode(id, operation, data, flags)
+            self.records += 1
+            self._position += RECORD.size + len(data)
+            self._append(
+                RECORD.pack(timestamp, operation, flags, id, len(data)), data)
+
+    def close(self):
+        BufferedWriter.close(self)
+        if self.index:
+            from btlejuice.capture.index import CaptureIndex
+            CaptureIndex(self.path).close()
+
+    def _intern(self, service, characteristic, timestamp):
+        key = (service, characteristic)
+        id = self.characteristics.get(key)
+        if id is None:
+            id = len(self.characteristics)
+            if id >= MAX_CHARACTERISTICS:
+                raise CaptureFormatError('too many characteristics')
+            self.characteristics[key] = id
+            name = encode_name(service, characteristic)
+            self._buffer += RECORD.pack(timestamp, DEFINE, 0, id, len(name))
+            self._buffer += name
+            self._position += RECORD.size + len(name)
+        return id
+
+    def _end_chunk(self):
+        # Chunks are decoded independently: restart delta encoding
+        self._flush()
+        self._file.end_chunk()
+        self._chunk_start = self._position
+        self._values.clear()
+
+    def _encode(self, id, operation, data, flags):
+        key = (id, operation)
+        position = self._position
+        previous = self._values.get(key)
+        if previous is not None and previous[2] < self.keyframe_interval:
+            delta = encode_delta(position - previous[0], previous[1], data)
+            if len(delta) < len(data):
+                self._values[key] = (position, data, previous[2] + 1)
+                return delta, flags | DELTA
+        self._values[key] = (position, data, 1)
+        return data, flags
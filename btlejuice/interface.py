@@ -1,18 +1,33 @@
 """
 BtleJuice Built-in Interfaces
 """
+from threading import Timer
+
+from btlejuice.scan import ScanResults
+from btlejuice.stats import LatencyHistogram, perf_counter_ns
+from btlejuice.trace import GattTracer, TRACED_STAGES
 from btlejuice.utils import unbufferize, bufferize
 from btlejuice.exceptions import HookForceResponse, HookModify
 
 class BtleJuiceInterface(object):
     """
     Interface base class for BtleJuice.
+
+    `HOOKS` lists the callbacks instrumented by `enable_stats` and
+    `enable_tracing`.
     """
 
+    HOOKS = ()
+
     def __init__(self, host, port):
         self.host = host
         self.port = port
         self.namespace = None
+        self._fallback_timer = None
+        self._target_ready = False
+        self._histograms = None
+        self._tracer = None
+        self._hook_observers = []
 
     def  set_namespace(self, namespace):
         self.namespace = namespace
@@ -33,6 +48,27 @@ class BtleJuiceInterface(object):
         """
         self.emit('target', target)
 
+    def fast_select_target(self, target, timeout=5.0):
+        """
+        Select a known target without scanning.
+
+        If the proxy is not ready within `timeout` seconds, `fast_select_failed`
+        is called (scanning fallback).
+        """
+        self.cancel_fast_select()
+        self._fallback_timer = Timer(timeout, self.fast_select_failed)
+        self._fallback_timer.daemon = True
+        self._fallback_timer.start()
+        self.select_target(target)
+
+    def cancel_fast_select(self):
+        """
+        Cancel a pending fast target selection fallback.
+        """
+        if self._fallback_timer is not None:
+            self._fallback_timer.cancel()
+            self._fallback_timer = None
+
     def get_status(self):
         """
         Asks for a status update.
@@ -43,8 +79,114 @@ class BtleJuiceInterface(object):
         """
         Stop proxy.
         """
+        self._target_ready = False
         self.emit('stop')
 
+    ########################
+    # Hook instrumentation
+    ########################
+
+    def enable_stats(self):
+        """
+        Measure the execution time of each hook, per characteristic.
+
+        Hooks are wrapped on this instance only, disabled instrumentation
+        has no cost.
+        """
+        if self._histograms is not None:
+            return
+        self._histograms = {}
+        self._add_hook_observer(self._record_hook_latency)
+
+    def disable_stats(self):
+        """
+        Remove hook instrumentation and forget collected statistics.
+        """
+        if self._histograms is None:
+            return
+        self._remove_hook_observer(self._record_hook_latency)
+        self._histograms = None
+
+    def stats(self):
+        """
+        Return hook latency statistics (nanoseconds), indexed by
+        (hook, service, characteristic).
+        """
+        if self._histograms is None:
+            return {}
+        return dict(
+            (key, histogram.summary())
+            for key, histogram in self._histograms.items()
+        )
+
+    def enable_tracing(self, path):
+        """
+        Trace proxied GATT operations into `path` (Trace Event format).
+        """
+        if self._tracer is not None:
+            return
+        self._tracer = GattTracer(path, rtt=self._transport_rtt)
+        self._add_hook_observer(self._tracer.hook)
+        for method, stage, operation in TRACED_STAGES:
+            setattr(self, method, self._tracer.wrap(
+                stage, operation, getattr(self, method)))
+
+    def disable_tracing(self):
+        """
+        Stop tracing and close the trace file.
+        """
+        if self._tracer is None:
+            return
+        for method, stage, operation in TRACED_STAGES:
+            self.__dict__.pop(method, None)
+        self._remove_hook_observer(self._tracer.hook)
+        self._tracer.close()
+        self._tracer = None
+
+    def _transport_rtt(self):
+        """
+        Return the last measured engine.io ping round-trip time, if any.
+        """
+        io = getattr(self.namespace, '_io', None)
+        return getattr(io, 'ping_rtt', None)
+
+    def _record_hook_latency(self, hook, service, characteristic, started, elapsed,
+                             error=None):
+        key = (hook, service, characteristic)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+        histogram.record(elapsed)
+
+    def _add_hook_observer(self, observer):
+        if not self._hook_observers:
+            for hook in self.HOOKS:
+                setattr(self, hook, self._observed_hook(hook, getattr(self, hook)))
+        self._hook_observers.append(observer)
+
+    def _remove_hook_observer(self, observer):
+        if observer in self._hook_observers:
+            self._hook_observers.remove(observer)
+        if not self._hook_observers:
+            for hook in self.HOOKS:
+                self.__dict__.pop(hook, None)
+
+    def _observed_hook(self, hook, callback):
+        observers = self._hook_observers
+        def observed_hook(service, characteristic, *args):
+            started = perf_counter_ns()
+            error = None
+            try:
+                return callback(service, characteristic, *args)
+            except Exception as exception:
+                error = exception
+                raise
+            finally:
+                elapsed = perf_counter_ns() - started
+                for observer in observers:
+                    observer(hook, service, characteristic, started, elapsed, error)
+        return observed_hook
+
     ########################
     # Device operations.
     ########################
@@ -144,6 +286,20 @@ class BtleJuiceInterface(object):
         """
         pass
 
+    def target_ready(self):
+        """
+        Called by the core namespace when the proxy is ready.
+        """
+        self._target_ready = True
+        self.cancel_fast_select()
+        self.proxy_ready()
+
+    def fast_select_failed(self):
+        """
+        Called when a fast target selection did not succeed in time.
+        """
+        pass
+
     def proxy_ready(self):
         """
         Called when the proxy is ready.
@@ -204,20 +360,57 @@ class BtleJuiceInterface(object):
 
 
 class SniffingInterface(BtleJuiceInterface):
-    def __init__(self, host, port, target):
+    """
+    Base sniffing class.
+
+    Set `fast_connect` to select a known target right away instead of
+    scanning for it first. Scanning is used as a fallback if the proxy is
+    not ready after `fast_connect_timeout` seconds.
+    """
+
+    HOOKS = (
+        'on_data_read',
+        'on_data_write',
+        'on_subscribe_notification',
+        'on_notification_data',
+    )
+
+    def __init__(self, host, port, target, fast_connect=False, fast_connect_timeout=5.0):
         self.target = target
+        self.fast_connect = fast_connect
+        self.fast_connect_timeout = fast_connect_timeout
+        self.scan_results = ScanResults(addresses=[target])
         BtleJuiceInterface.__init__(self, host, port)
 
     def connect(self):
         # Stop previous operations.
         self.stop()
+        if self.fast_connect:
+            self.fast_select_target(self.target, self.fast_connect_timeout)
+        else:
+            self.scan_results.clear()
+            self.scan()
+
+    def disconnect(self):
+        self.cancel_fast_select()
+
+    def fast_select_failed(self):
+        """
+        Target is not reachable right away, scan for it.
+        """
+        self.stop()
+        self.scan_results.clear()
         self.scan()
 
     def device_found(self, device, name, rssi):
         """
         Wait for our target device to be detected.
+
+        The target is selected again on each of its advertisements until
+        the proxy is ready.
         """
-        if device.lower() == self.target.lower():
+        entry = self.scan_results.update(device, name, rssi)
+        if entry.matched and not self._target_ready:
             self.select_target(self.target)
 
     def read_request(self, service, characteristic, offset):
@@ -272,7 +465,7 @@ class SniffingInterface(BtleJuiceInterface):
         """
         pass
 
-    def on_data_write(self, service, characteristic, data, offset, withoutResponse, error):
+    def on_data_write(self, service, characteristic, data, offset, withoutResponse, error=None):
         """
         Called after a write operation was performed. Should be overriden.
         """
@@ -308,21 +501,57 @@ class HookingInterface(BtleJuiceInterface):
     performed on the target device (you may also provide data if the response
     is supposed to return some). Use `HookModify` to  modify on-the-fly the data
     returned by or sent to the target device.
+
+    Set `fast_connect` to select a known target right away instead of
+    scanning for it first. Scanning is used as a fallback if the proxy is
+    not ready after `fast_connect_timeout` seconds.
     """
-    def __init__(self, host, port, target):
+
+    HOOKS = (
+        'on_before_read',
+        'on_after_read',
+        'on_before_write',
+        'on_before_subscribe',
+        'on_before_notification',
+    )
+
+    def __init__(self, host, port, target, fast_connect=False, fast_connect_timeout=5.0):
         self.target = target
+        self.fast_connect = fast_connect
+        self.fast_connect_timeout = fast_connect_timeout
+        self.scan_results = ScanResults(addresses=[target])
         BtleJuiceInterface.__init__(self, host, port)
 
     def connect(self):
         # Stop previous operations.
         self.stop()
+        if self.fast_connect:
+            self.fast_select_target(self.target, self.fast_connect_timeout)
+            self.on_proxy_setup()
+        else:
+            self.scan_results.clear()
+            self.scan()
+
+    def disconnect(self):
+        self.cancel_fast_select()
+
+    def fast_select_failed(self):
+        """
+        Target is not reachable right away, scan for it.
+        """
+        self.stop()
+        self.scan_results.clear()
         self.scan()
 
-    def device_found(self, device, address, rssi):
+    def device_found(self, device, name, rssi):
         """
         Wait for our target device to be detected.
+
+        The target is selected again on each of its advertisements until
+        the proxy is ready.
         """
-        if device.lower() == self.target.lower():
+        entry = self.scan_results.update(device, name, rssi)
+        if entry.matched and not self._target_ready:
             self.select_target(self.target)
             self.on_proxy_setup()
 
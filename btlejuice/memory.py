@@ -0,0 +1,213 @@
+"""
+BtleJuice allocation tracking
+"""
+import os
+import sys
+import tracemalloc
+
+from btlejuice.profiling import ENGINEIO_EVENTS
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+STDLIB_DIR = os.path.dirname(os.path.abspath(os.__file__))
+
+# Pipeline stage of each btlejuice module (path relative to the package).
+STAGES = (
+    (os.path.join('socketIO_client', 'parsers.py'), 'codec'),
+    (os.path.join('socketIO_client', 'transports.py'), 'transport'),
+    ('socketIO_client', 'socket.io'),
+    ('__init__.py', 'dispatch'),
+    ('utils.py', 'dispatch'),
+    ('', 'interface'),
+)
+
+
+def get_stage(traceback):
+    """
+    Return the pipeline stage responsible for an allocation traceback.
+
+    Allocations made by the standard library (json, collections, ...) are
+    attributed to their caller, and allocations made outside btlejuice to
+    interface hooks.
+    """
+    for frame in reversed(traceback):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(PACKAGE_DIR + os.sep):
+            relative = filename[len(PACKAGE_DIR) + 1:]
+            for prefix, stage in STAGES:
+                if relative.startswith(prefix):
+                    return stage
+        elif not filename.startswith(STDLIB_DIR) and \
+                not filename.startswith('<'):
+            return 'hooks'
+    return 'other'
+
+
+class AllocationRecord(object):
+    """
+    Allocations of an event type.
+    """
+
+    __slots__ = ('events', 'packets', 'blocks', 'size', 'peak')
+
+    def __init__(self):
+        self.events = 0
+        self.packets = 0
+        self.blocks = 0
+        self.size = 0
+        self.peak = 0
+
+    def add(self, other):
+        self.packets += other.packets
+        self.blocks += other.blocks
+        self.size += other.size
+        self.peak = max(self.peak, other.peak)
+
+    def summary(self):
+        events = self.events or 1
+        return {
+            'events': self.events,
+            'packets': self.packets,
+            'blocks_per_event': float(self.blocks) / events,
+            'bytes_per_event': float(self.size) / events,
+            'peak_bytes': self.peak,
+        }
+
+
+class AllocationTracker(object):
+    """
+    Tracemalloc-based allocation tracker for a socket.io client.
+
+    Every received packet is measured, from parsing to the end of its
+    dispatch, and attributed to the core event it carries (binary events
+    span several packets). For each event type, `stats` reports the memory
+    blocks and bytes still allocated after handling an event (what makes
+    the heap and the garbage collector work grow) and the peak of transient
+    memory used while handling it. `stages` attributes the memory allocated
+    since `start` to pipeline stages: codec, transport, socket.io, dispatch,
+    interface and hooks.
+    """
+
+    def __init__(self, client, nframes=16):
+        self.client = client
+        self.nframes = nframes
+        self.records = {}
+        self._pending = AllocationRecord()
+        self._event = None
+        self._started_tracing = False
+        self._snapshot = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            self._started_tracing = True
+        self._snapshot = tracemalloc.take_snapshot()
+        self.client._packet_wrappers.append(self._tracked)
+
+    def stop(self):
+        if self._tracked in self.client._packet_wrappers:
+            self.client._packet_wrappers.remove(self._tracked)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def wrap_event(self, event, callback):
+        """
+        Wrap a namespace callback to attribute the current packet to `event`.
+        """
+        if event in ENGINEIO_EVENTS:
+            return callback
+        def tracked(*args):
+            if self._event is None:
+                self._event = event
+            return callback(*args)
+        return tracked
+
+    def stats(self):
+        """
+        Return allocations per event type.
+        """
+        return dict(
+            (event, record.summary()) for event, record in self.records.items())
+
+    def stages(self, limit=None):
+        """
+        Return the memory blocks and bytes allocated since `start` and still
+        alive, per pipeline stage.
+        """
+        stages = {}
+        snapshot = tracemalloc.take_snapshot()
+        for difference in snapshot.compare_to(self._snapshot, 'traceback'):
+            if difference.size_diff <= 0:
+                continue
+            stage = get_stage(difference.traceback)
+            blocks, size = stages.get(stage, (0, 0))
+            stages[stage] = (
+                blocks + difference.count_diff, size + difference.size_diff)
+        return dict(
+            (stage, {'blocks': blocks, 'bytes': size})
+            for stage, (blocks, size) in stages.items())
+
+    def _tracked(self, process_packet):
+        def tracked(packet):
+            blocks = sys.getallocatedblocks()
+            size = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            try:
+                return process_packet(packet)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                pending = self._pending
+                pending.packets += 1
+                pending.blocks += sys.getallocatedblocks() - blocks
+                pending.size += current - size
+                pending.peak = max(pending.peak, peak - size)
+                if self._event is not None:
+                    record = self.records.get(self._event)
+                    if record is None:
+                        record = self.records[self._event] = AllocationRecord()
+                    record.events += 1
+                    record.add(pending)
+                    self._pending = AllocationRecord()
+                    self._event = None
+        return tracked
+
+
+def measure_allocations(app, transport, event, *args, **kw):
+    """
+    Feed `count` `event` events to a `BtleJuiceApp` through its loopback
+    transport, after `warmup` untracked ones, and return their allocation
+    summary (see `AllocationTracker`). Packets recorded by the transport
+    are cleared after each event, but are included in the measure.
+    """
+    count = kw.get('count', 1000)
+    warmup = kw.get('warmup', 100)
+    transport.process()
+    for i in range(warmup):
+        transport.feed_event(event, *args)
+        transport.process()
+        transport.clear()
+    app.enable_allocation_tracking()
+    try:
+        for i in range(count):
+            transport.feed_event(event, *args)
+            transport.process()
+            transport.clear()
+        return app.allocation_stats()[event]
+    finally:
+        app.disable_allocation_tracking()
+
+
+def assert_allocations(app, transport, max_blocks, event, *args, **kw):
+    """
+    Fail if handling `event` leaves more than `max_blocks` memory blocks
+    allocated on average (see `measure_allocations`).
+    """
+    summary = measure_allocations(app, transport, event, *args, **kw)
+    if summary['blocks_per_event'] > max_blocks:
+        raise AssertionError(
+            '%s events allocate %.1f blocks (%.0f bytes) each, budget is %d' % (
+                event, summary['blocks_per_event'],
+                summary['bytes_per_event'], max_blocks))
+    return summary
@@ -0,0 +1,283 @@
+"""
+BtleJuice session metrics
+"""
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from btlejuice.exceptions import HookForceResponse, HookModify
+from btlejuice.profiling import ENGINEIO_EVENTS
+from btlejuice.socketIO_client.parsers import Buffer
+
+
+# Name of engine.io packets that do not carry a socket.io event.
+ENGINEIO_PACKETS = {
+    0: 'open', 1: 'close', 2: 'ping', 3: 'pong', 4: 'message', 5: 'upgrade',
+    6: 'noop',
+}
+
+
+class Metrics(object):
+    """
+    Counters and gauges of a `BtleJuiceApp` session.
+
+    Counts packets and bytes received and sent per event type, connections,
+    hook calls and hook errors, and samples the last ping round-trip time,
+    outstanding acks and the dispatch backlog when rendered. `render`
+    returns them in the Prometheus text exposition format.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.client
+        self.packets_received = {}
+        self.bytes_received = {}
+        self.packets_sent = {}
+        self.bytes_sent = {}
+        self.connections = {}
+        self.hook_calls = {}
+        self.hook_errors = {}
+        self._lock = threading.Lock()
+        self._event = None
+        self._pending = [0, 0]
+        self._emitting = None
+
+    def start(self):
+        self.client._packet_wrappers.append(self._counted)
+        self.client.emit = self._counted_emit(self.client.emit)
+        self.client._message = self._counted_message(self.client._message)
+        self.app.namespace.event_wrappers.append(self)
+        self.app.interface._add_hook_observer(self.record_hook)
+
+    def stop(self):
+        if self._counted in self.client._packet_wrappers:
+            self.client._packet_wrappers.remove(self._counted)
+        self.client.__dict__.pop('emit', None)
+        self.client.__dict__.pop('_message', None)
+        if self in self.app.namespace.event_wrappers:
+            self.app.namespace.event_wrappers.remove(self)
+        self.app.interface._remove_hook_observer(self.record_hook)
+
+    # Instrumentation
+
+    def wrap_event(self, event, callback):
+        """
+        Wrap a namespace callback to attribute the current packet to `event`.
+        """
+        if event in ENGINEIO_EVENTS:
+            return callback
+        connection = event in ('connect', 'reconnect', 'disconnect')
+        def counted(*args):
+            if connection:
+                self._add(self.connections, event, 1)
+            if self._event is None:
+                self._event = event
+            return callback(*args)
+        return counted
+
+    def record_hook(self, hook, service, characteristic, started, elapsed,
+                    error=None):
+        self._add(self.hook_calls, hook, 1)
+        if error is not None and \
+                not isinstance(error, (HookForceResponse, HookModify)):
+            self._add(self.hook_errors, hook, 1)
+
+    def _counted(self, process_packet):
+        def counted(packet):
+            try:
+                return process_packet(packet)
+            finally:
+                engineIO_packet_type, engineIO_packet_data = packet
+                self._pending[0] += 1
+                self._pending[1] += len(engineIO_packet_data)
+                event = self._event
+                if event is None and (
+                        engineIO_packet_type != 4 or
+                        not self.client.attachment_count):
+                    event = ENGINEIO_PACKETS.get(
+                        engineIO_packet_type, 'unknown')
+                if event is not None:
+                    packets, size = self._pending
+                    self._add(self.packets_received, event, packets)
+                    self._add(self.bytes_received, event, size)
+                    self._pending = [0, 0]
+                    self._event = None
+        return counted
+
+    def _counted_emit(self, emit):
+        def counted(event, *args, **kw):
+            self._emitting = event
+            try:
+                return emit(event, *args, **kw)
+            finally:
+                self._emitting = None
+                buffers = [arg for arg in args if isinstance(arg, Buffer)]
+                if buffers:
+                    self._add(self.packets_sent, event, len(buffers))
+                    self._add(self.bytes_sent, event, sum(
+                        len(buf.content) for buf in buffers))
+        return counted
+
+    def _counted_message(self, message):
+        def counted(engineIO_packet_data, *args, **kw):
+            event = self._emitting or 'message'
+            self._add(self.packets_sent, event, 1)
+            self._add(
+                self.bytes_sent, event, len(engineIO_packet_data.encode('utf-8')))
+            return message(engineIO_packet_data, *args, **kw)
+        return counted
+
+    def _add(self, counters, key, amount):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + amount
+
+    # Exposition
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+        lines = []
+
+        def family(name, kind, description, samples):
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                if value is None:
+                    continue
+                if labels:
+                    name_labels = '%s{%s}' % (name, ','.join(
+                        '%s="%s"' % (label, _escape(label_value))
+                        for label, label_value in sorted(labels.items())))
+                else:
+                    name_labels = name
+                lines.append('%s %s' % (name_labels, _format(value)))
+
+        def labelled(label, counters):
+            with self._lock:
+                items = sorted(counters.items())
+            return [({label: key}, value) for key, value in items]
+
+        family(
+            'btlejuice_packets_received_total', 'counter',
+            'Engine.io packets received from the core, per event type.',
+            labelled('event', self.packets_received))
+        family(
+            'btlejuice_bytes_received_total', 'counter',
+            'Bytes received from the core, per event type.',
+            labelled('event', self.bytes_received))
+        family(
+            'btlejuice_packets_sent_total', 'counter',
+            'Engine.io packets sent to the core, per event type.',
+            labelled('event', self.packets_sent))
+        family(
+            'btlejuice_bytes_sent_total', 'counter',
+            'Bytes sent to the core, per event type.',
+            labelled('event', self.bytes_sent))
+        with self._lock:
+            connections = dict(self.connections)
+        family(
+            'btlejuice_connects_total', 'counter',
+            'Connections to the core.',
+            [({}, connections.get('connect', 0))])
+        family(
+            'btlejuice_reconnects_total', 'counter',
+            'Reconnections to the core.',
+            [({}, connections.get('reconnect', 0))])
+        family(
+            'btlejuice_disconnects_total', 'counter',
+            'Disconnections from the core.',
+            [({}, connections.get('disconnect', 0))])
+        family(
+            'btlejuice_hook_calls_total', 'counter',
+            'Interface hook calls.',
+            labelled('hook', self.hook_calls))
+        family(
+            'btlejuice_hook_errors_total', 'counter',
+            'Interface hooks that raised an unexpected exception.',
+            labelled('hook', self.hook_errors))
+        family(
+            'btlejuice_connected', 'gauge',
+            'Whether the session with the core is open.',
+            [({}, 1 if self.client.connected else 0)])
+        family(
+            'btlejuice_ping_rtt_seconds', 'gauge',
+            'Last engine.io ping round-trip time.',
+            [({}, self.client.ping_rtt)])
+        family(
+            'btlejuice_outstanding_acks', 'gauge',
+            'Emitted events waiting for an acknowledgement.',
+            [({}, len(self.client._callback_by_ack_id))])
+        family(
+            'btlejuice_pending_attachments', 'gauge',
+            'Binary attachments expected to complete the current event.',
+            [({}, self.client.attachment_count)])
+        family(
+            'btlejuice_dispatch_backlog_bytes', 'gauge',
+            'Bytes received by the transport and not dispatched yet.',
+            [({}, self._backlog())])
+        return '\n'.join(lines) + '\n'
+
+    def _backlog(self):
+        transport = getattr(self.client, '_transport_instance', None)
+        if transport is None or not self.client.connected:
+            return None
+        return transport.backlog()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(HTTPServer):
+    """
+    HTTP endpoint serving `Metrics` on /metrics, from a daemon thread.
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=9464):
+        HTTPServer.__init__(self, (host, port), MetricsRequestHandler)
+        self.metrics = metrics
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
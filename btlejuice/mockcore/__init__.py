@@ -0,0 +1,16 @@
+"""
+BtleJuice core stand-in
+
+A pure-Python local replacement for the BtleJuice core, speaking engine.io v3
+over websocket and polling, for offline and load testing of interfaces.
+"""
+
+from btlejuice.mockcore.server import EngineIOServer, Session
+from btlejuice.mockcore.core import MockCore, GattProfile
+
+__all__ = [
+    'MockCore',
+    'GattProfile',
+    'EngineIOServer',
+    'Session'
+]
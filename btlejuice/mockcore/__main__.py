@@ -0,0 +1,99 @@
+import argparse
+import time
+
+from btlejuice.mockcore import MockCore
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BtleJuice core stand-in')
+    parser.add_argument(
+        '--server', '-s',
+        type=str,
+        dest='server',
+        default='127.0.0.1',
+        help='Listening address'
+    )
+    parser.add_argument(
+        '--port',
+        '-p',
+        type=int,
+        dest='port',
+        default=8080,
+        help='Listening port'
+    )
+    parser.add_argument(
+        '--rate',
+        '-r',
+        type=str,
+        dest='rates',
+        action='append',
+        default=[],
+        help='Generated events rate, as EVENT=RATE (events/s, 0 for as fast as possible)'
+    )
+    parser.add_argument(
+        '--size',
+        type=int,
+        dest='size',
+        default=20,
+        help='Generated payloads size'
+    )
+    parser.add_argument(
+        '--clients',
+        type=int,
+        dest='clients',
+        default=1,
+        help='Number of clients to wait for before generating events'
+    )
+    parser.add_argument(
+        '--count',
+        '-n',
+        type=int,
+        dest='count',
+        default=None,
+        help='Number of events to generate per event type'
+    )
+    parser.add_argument(
+        '--duration',
+        '-d',
+        type=float,
+        dest='duration',
+        default=None,
+        help='Load generation duration (seconds)'
+    )
+    parser.add_argument(
+        '--replay',
+        type=str,
+        dest='replay',
+        default=None,
+        help='Capture to replay to clients'
+    )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        dest='speed',
+        default=1.0,
+        help='Replay speed (1 for real time, 0 for as fast as possible)'
+    )
+    args = parser.parse_args()
+    rates = {}
+    for rate in args.rates:
+        event, value = rate.split('=', 1)
+        rates[event] = float(value)
+
+    core = MockCore(args.server, args.port, payload_size=args.size)
+    core.start()
+    print('[i] Core stand-in listening on %s:%d' % (args.server, core.port))
+    try:
+        if rates:
+            core.wait_for_clients(args.clients)
+            print('[i] Generating events: %s' % ', '.join(args.rates))
+            core.start_load(rates, args.count, args.duration)
+        elif args.replay:
+            core.wait_for_clients(args.clients)
+            print('[i] Replaying %s' % args.replay)
+            core.start_replay(args.replay, args.speed)
+        while True:
+            time.sleep(1)
+            print('[i] %s' % core.stats())
+    except KeyboardInterrupt:
+        print('[i] Stopping ...')
+        core.stop()
@@ -0,0 +1,341 @@
+"""
+BtleJuice core stand-in.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from btlejuice.mockcore.server import EngineIOServer
+from btlejuice.stats import LatencyHistogram, perf_counter_ns
+
+
+# Response expected from the interface for each generated request.
+RESPONSES = {
+    'proxy_read': 'proxy_read_resp',
+    'proxy_write': 'proxy_write_resp',
+    'proxy_notify': 'proxy_notify_resp',
+    'data': 'proxy_data',
+}
+
+# Events the load generator knows how to produce.
+GENERATED_EVENTS = ('proxy_read', 'proxy_write', 'proxy_notify', 'data', 'peripheral')
+
+
+class GattProfile(object):
+    """
+    Simulated target device.
+
+    `services` maps service UUIDs to {characteristic UUID: value}. `devices`
+    lists additional (address, name) devices reported while scanning.
+    """
+
+    def __init__(self, address='aa:bb:cc:dd:ee:ff', name='BtleJuice Mock',
+                 services=None, devices=()):
+        self.address = address
+        self.name = name
+        if services is None:
+            services = {
+                '180f': {'2a19': b'\x64'},
+                'fff0': {'fff1': b'\x00' * 20, 'fff4': b'\x00' * 20},
+            }
+        self.services = dict(
+            (service, dict(characteristics))
+            for service, characteristics in services.items()
+        )
+        self.devices = [(address, name)] + list(devices)
+        self._lock = threading.Lock()
+
+    def characteristics(self):
+        """
+        Return the (service, characteristic) pairs of this profile.
+        """
+        return [
+            (service, characteristic)
+            for service, characteristics in sorted(self.services.items())
+            for characteristic in sorted(characteristics)
+        ]
+
+    def read(self, service, characteristic):
+        return self.services.get(service, {}).get(characteristic, b'')
+
+    def write(self, service, characteristic, data, offset=0):
+        with self._lock:
+            characteristics = self.services.setdefault(service, {})
+            value = characteristics.get(characteristic, b'')
+            characteristics[characteristic] = value[:offset] + bytes(data)
+
+    def describe(self):
+        """
+        Return the profile as sent in 'profile' events.
+        """
+        return {
+            'address': self.address,
+            'name': self.name,
+            'services': [
+                {
+                    'uuid': service,
+                    'characteristics': [
+                        {'uuid': characteristic, 'properties': ['read', 'write', 'notify']}
+                        for characteristic in sorted(characteristics)
+                    ],
+                }
+                for service, characteristics in sorted(self.services.items())
+            ],
+        }
+
+
+class MockCore(EngineIOServer):
+    """
+    Local stand-in for the BtleJuice core.
+
+    Answers the requests sent by the bindings (scan, target selection, device
+    reads, writes and subscriptions) from a `GattProfile`, and generates
+    proxy and scan events at configurable rates with `start_load`. Latencies
+    between generated requests and the responses sent back by interfaces are
+    recorded and reported by `stats`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8080, profile=None,
+                 payload_size=20, rssi=-60):
+        EngineIOServer.__init__(self, host, port)
+        self.profile = profile or GattProfile()
+        self.payload_size = payload_size
+        self.rssi = rssi
+        self.status = 'connected'
+        self.target = None
+        self._load_thread = None
+        self._load_stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._clients = threading.Condition()
+        self.reset_stats()
+
+    # Stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.sent = {}
+            self.received = {}
+            self._pending = {}
+            self.latencies = {}
+
+    def stats(self):
+        """
+        Return events sent and received per event type, and request/response
+        latencies (nanoseconds) per request type.
+        """
+        with self._stats_lock:
+            return {
+                'sent': dict(self.sent),
+                'received': dict(self.received),
+                'latency': dict(
+                    (event, histogram.summary())
+                    for event, histogram in self.latencies.items()
+                ),
+            }
+
+    def wait_for_clients(self, count=1, timeout=None):
+        """
+        Wait until `count` clients are connected.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._clients:
+            while len(self.sessions) < count:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._clients.wait(remaining)
+        return True
+
+    # Events
+
+    def emit(self, event, *args):
+        expected = RESPONSES.get(event)
+        if expected is not None and not (event == 'proxy_write' and args[4]):
+            key = (expected, args[0], args[1])
+            with self._stats_lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = deque()
+                for session in self.sessions:
+                    pending.append(perf_counter_ns())
+        with self._stats_lock:
+            self.sent[event] = self.sent.get(event, 0) + len(self.sessions)
+        EngineIOServer.emit(self, event, *args)
+
+    def handle_connect(self, session):
+        EngineIOServer.handle_connect(self, session)
+        with self._clients:
+            self._clients.notify_all()
+
+    def handle_disconnect(self, session):
+        with self._clients:
+            self._clients.notify_all()
+
+    def handle_event(self, session, event, args):
+        received = perf_counter_ns()
+        with self._stats_lock:
+            self.received[event] = self.received.get(event, 0) + 1
+            if len(args) >= 2:
+                pending = self._pending.get((event, args[0], args[1]))
+                if pending:
+                    histogram = self.latencies.get(event)
+                    if histogram is None:
+                        histogram = self.latencies[event] = LatencyHistogram()
+                    histogram.record(received - pending.popleft())
+        handler = getattr(self, 'on_' + event, None)
+        if handler is not None:
+            handler(session, *args)
+
+    def on_scan_devices(self, session):
+        self.status = 'scanning'
+        for address, name in self.profile.devices:
+            session.emit('peripheral', address, name, self.rssi)
+
+    def on_stop(self, session):
+        self.status = 'connected'
+        self.target = None
+
+    def on_status(self, session):
+        session.emit('app.status', self.status)
+
+    def on_target(self, session, target):
+        self.target = target
+        self.status = 'proxy'
+        session.emit('app.target', target)
+        session.emit('profile', self.profile.describe())
+        session.emit('ready')
+
+    def on_ble_read(self, session, service, characteristic, *args):
+        session.emit(
+            'ble_read_resp', service, characteristic,
+            self.profile.read(service, characteristic))
+
+    def on_ble_write(self, session, service, characteristic, data, offset=0,
+                     withoutResponse=False, *args):
+        if not isinstance(data, bytes):
+            data = str(data).encode('utf-8')
+        self.profile.write(service, characteristic, data, offset or 0)
+        if not withoutResponse:
+            session.emit('ble_write_resp', service, characteristic, False)
+
+    def on_ble_notify(self, session, service, characteristic, enabled=True, *args):
+        session.emit('ble_notify_resp', service, characteristic)
+
+    # Load generation
+
+    def start_load(self, rates, count=None, duration=None):
+        """
+        Generate events for all connected clients.
+
+        `rates` maps event types (proxy_read, proxy_write, proxy_notify, data,
+        peripheral) to events per second, 0 meaning as fast as possible.
+        Generation stops after `count` events per type or `duration` seconds.
+        """
+        for event in rates:
+            if event not in GENERATED_EVENTS:
+                raise ValueError('cannot generate %s events' % event)
+        self.stop_load()
+        self._load_stop.clear()
+        self._load_thread = threading.Thread(
+            target=self._generate, args=(dict(rates), count, duration))
+        self._load_thread.daemon = True
+        self._load_thread.start()
+
+    def start_replay(self, path, speed=1.0, start=None, end=None):
+        """
+        Send the core events recorded in a capture to all connected clients
+        (see `Replayer`), `speed` scaling the recorded timing (0 for as fast
+        as possible). Recorded read values are set in the profile before
+        their read request is sent, so that device reads return them.
+        """
+        from btlejuice.capture.replay import Replayer
+        self.stop_load()
+        self._load_stop.clear()
+        self._load_thread = threading.Thread(
+            target=self._replay, args=(Replayer(path, speed, start, end),))
+        self._load_thread.daemon = True
+        self._load_thread.start()
+
+    def stop_load(self):
+        if self._load_thread is not None:
+            self._load_stop.set()
+            self._load_thread.join()
+            self._load_thread = None
+
+    def wait_load(self, timeout=None):
+        """
+        Wait for the load generation to complete.
+        """
+        if self._load_thread is not None:
+            self._load_thread.join(timeout)
+            return not self._load_thread.is_alive()
+        return True
+
+    def stop(self):
+        self.stop_load()
+        EngineIOServer.stop(self)
+
+    def make_args(self, event, index):
+        """
+        Return the arguments of the `index`-th generated `event`.
+        """
+        characteristics = self.profile.characteristics()
+        service, characteristic = characteristics[index % len(characteristics)]
+        if event == 'proxy_read':
+            return (service, characteristic, 0)
+        if event == 'proxy_write':
+            return (service, characteristic, os.urandom(self.payload_size), 0, False)
+        if event == 'proxy_notify':
+            return (service, characteristic, index % 2 == 0)
+        if event == 'data':
+            return (service, characteristic, os.urandom(self.payload_size))
+        # Scan flood: a pool of 256 devices advertising repeatedly
+        return (
+            'c0:ff:ee:00:00:%02x' % (index % 256),
+            'device-%d' % (index % 256),
+            self.rssi + random.randint(-10, 10)
+        )
+
+    def _replay(self, replayer):
+        from btlejuice.capture.replay import core_event
+        from btlejuice.capture.format import READ
+        for record in replayer.timed_records(self._load_stop.wait):
+            if self._load_stop.is_set():
+                break
+            event = core_event(record)
+            if event is None:
+                continue
+            if record.operation == READ:
+                self.profile.write(
+                    record.service, record.characteristic, record.data)
+            self.emit(event[0], *event[1])
+
+    def _generate(self, rates, count, duration):
+        started = time.time()
+        events = list(rates)
+        emitted = dict((event, 0) for event in events)
+        due = dict((event, started) for event in events)
+        while events and not self._load_stop.is_set():
+            now = time.time()
+            if duration is not None and now - started >= duration:
+                break
+            for event in list(events):
+                rate = rates[event]
+                while due[event] <= now:
+                    self.emit(event, *self.make_args(event, emitted[event]))
+                    emitted[event] += 1
+                    if count is not None and emitted[event] >= count:
+                        events.remove(event)
+                        break
+                    if not rate:
+                        break
+                    due[event] += 1.0 / rate
+                    if due[event] < now - 1:
+                        # Do not try to catch up more than one second.
+                        due[event] = now
+            if events:
+                delay = min(due[event] for event in events) - time.time()
+                if delay > 0:
+                    self._load_stop.wait(delay)
@@ -0,0 +1,491 @@
+"""
+Minimal engine.io v3 / socket.io server.
+
+Supports the polling and websocket transports (including the polling to
+websocket upgrade), text and binary socket.io events on the root namespace.
+Only what the BtleJuice bindings need is implemented (Python 3 only).
+"""
+import base64
+import hashlib
+import json
+import struct
+import sys
+import threading
+import uuid
+from collections import deque
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from btlejuice.socketIO_client.parsers import (
+    Buffer, decode_engineIO_content, encode_engineIO_content,
+    encode_engineIO_binary_content, _rebuild_data)
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+PING_INTERVAL = 25000
+PING_TIMEOUT = 60000
+# Maximum time (seconds) a polling request waits for packets.
+POLLING_TIMEOUT = 5
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+
+class Session(object):
+    """
+    Engine.io client session.
+    """
+
+    def __init__(self, server, sid):
+        self.server = server
+        self.sid = sid
+        self.transport = 'polling'
+        self.closed = False
+        self._queue = deque()
+        self._ready = threading.Condition()
+        self._websocket = None
+        self._binary_event = None
+        self._emit_lock = threading.Lock()
+
+    # Sending
+
+    def emit(self, event, *args):
+        """
+        Emit a socket.io event.
+
+        Binary arguments (bytes, bytearray, Buffer) are sent as attachments.
+        """
+        attachments = []
+        def deconstruct(data):
+            if isinstance(data, Buffer):
+                data = data.content
+            if isinstance(data, (bytes, bytearray)):
+                attachments.append(bytes(data))
+                return {'_placeholder': True, 'num': len(attachments) - 1}
+            return data
+        payload = json.dumps(
+            [event] + [deconstruct(arg) for arg in args], ensure_ascii=False)
+        with self._emit_lock:
+            # Attachments must directly follow their event.
+            if attachments:
+                self.send_packet(4, '5%d-%s' % (len(attachments), payload))
+                for attachment in attachments:
+                    self.send_binary(attachment)
+            else:
+                self.send_packet(4, '2' + payload)
+
+    def send_packet(self, packet_type, data=''):
+        """
+        Send a text engine.io packet.
+        """
+        websocket = self._websocket
+        if websocket is not None:
+            websocket.send_frame(OPCODE_TEXT, (str(packet_type) + data).encode('utf-8'))
+        else:
+            with self._ready:
+                self._queue.append((packet_type, data))
+                self._ready.notify()
+
+    def send_binary(self, data):
+        """
+        Send a binary engine.io message.
+        """
+        websocket = self._websocket
+        if websocket is not None:
+            websocket.send_frame(OPCODE_BINARY, b'\x04' + data)
+        else:
+            with self._ready:
+                self._queue.append((None, data))
+                self._ready.notify()
+
+    def poll(self, timeout=POLLING_TIMEOUT):
+        """
+        Wait for queued packets and return them (polling transport), binary
+        messages are returned with a None packet type.
+        """
+        with self._ready:
+            if not self._queue and not self.closed:
+                self._ready.wait(timeout)
+            packets = list(self._queue)
+            self._queue.clear()
+        return packets or [(6, '')]
+
+    def upgrade(self, websocket):
+        """
+        Switch to the websocket transport and flush queued packets.
+        """
+        with self._ready:
+            packets = list(self._queue)
+            self._queue.clear()
+            self._websocket = websocket
+            self.transport = 'websocket'
+            self._ready.notify()
+        for packet_type, data in packets:
+            if packet_type is None:
+                self.send_binary(data)
+            else:
+                self.send_packet(packet_type, data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        with self._ready:
+            self._ready.notify()
+        self.server.remove_session(self)
+        self.server.handle_disconnect(self)
+
+    # Receiving
+
+    def receive_packet(self, packet_type, data):
+        """
+        Process an engine.io packet sent by the client.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = bytes(data).decode('utf-8')
+        if packet_type == 1:
+            self.close()
+        elif packet_type == 2:
+            self.send_packet(3, data)
+        elif packet_type == 4:
+            self._receive_message(data)
+
+    def receive_binary(self, data):
+        """
+        Process a binary attachment sent by the client.
+        """
+        if self._binary_event is None:
+            return
+        args, count, attachments = self._binary_event
+        attachments.append(bytes(data))
+        if len(attachments) == count:
+            self._binary_event = None
+            args = _rebuild_data(args, attachments)
+            self.server.handle_event(self, args[0], args[1:])
+
+    def _receive_message(self, data):
+        if not data:
+            return
+        packet_type, data = data[0], data[1:]
+        if packet_type == '2':
+            args = _parse_args(data)
+            if args:
+                self.server.handle_event(self, args[0], args[1:])
+        elif packet_type == '5':
+            count, data = data.split('-', 1)
+            args = _parse_args(data)
+            if args:
+                self._binary_event = (args, int(count), [])
+        elif packet_type == '1':
+            self.close()
+
+
+class WebsocketConnection(object):
+    """
+    Server side of a websocket connection (RFC 6455).
+    """
+
+    def __init__(self, rfile, wfile):
+        self._rfile = rfile
+        self._wfile = wfile
+        self._frames = deque()
+        self._pending = threading.Condition()
+        self._closed = False
+        # Frames are written by a dedicated thread, so that reading from the
+        # client never waits for the client to read (like an async core).
+        self._writer = threading.Thread(target=self._write_frames)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        with self._pending:
+            self._frames.append(header + payload)
+            self._pending.notify()
+
+    def close(self):
+        """
+        Stop writing once queued frames are sent.
+        """
+        with self._pending:
+            self._closed = True
+            self._pending.notify()
+        self._writer.join()
+
+    def _write_frames(self):
+        while True:
+            with self._pending:
+                while not self._frames and not self._closed:
+                    self._pending.wait()
+                if not self._frames:
+                    return
+                frames = list(self._frames)
+                self._frames.clear()
+            try:
+                self._wfile.write(b''.join(frames))
+                self._wfile.flush()
+            except (IOError, OSError, ValueError):
+                return
+
+    def recv_message(self):
+        """
+        Return the next (opcode, payload) message, or None once closed.
+        """
+        message_opcode = None
+        fragments = []
+        while True:
+            header = self._rfile.read(2)
+            if len(header) < 2:
+                return None
+            first, second = struct.unpack('!BB', header)
+            opcode = first & 0x0f
+            length = second & 0x7f
+            if length == 126:
+                length = struct.unpack('!H', self._rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._rfile.read(8))[0]
+            mask = self._rfile.read(4) if second & 0x80 else None
+            payload = self._rfile.read(length)
+            if mask:
+                payload = _unmask(payload, mask)
+            if opcode == OPCODE_PING:
+                self.send_frame(OPCODE_PONG, payload)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                self.send_frame(OPCODE_CLOSE, payload[:2])
+                return None
+            if opcode != OPCODE_CONTINUATION:
+                message_opcode = opcode
+            fragments.append(payload)
+            if first & 0x80:
+                return message_opcode, b''.join(fragments)
+
+
+class EngineIORequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = self._parse_request()
+        if query is None:
+            return
+        sid = query.get('sid', [None])[0]
+        if query.get('transport', ['polling'])[0] == 'websocket':
+            self._serve_websocket(sid)
+        elif sid is None:
+            session = self.server.create_session()
+            self._send_payload([(0, self.server.handshake(session, ['websocket']))])
+            self.server.handle_connect(session)
+        else:
+            session = self.server.get_session(sid)
+            if session is None:
+                self._send_error(400, 'Session ID unknown')
+            else:
+                self._send_payload(session.poll())
+
+    def do_POST(self):
+        query = self._parse_request()
+        if query is None:
+            return
+        session = self.server.get_session(query.get('sid', [None])[0])
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if session is None:
+            self._send_error(400, 'Session ID unknown')
+            return
+        for packet_type, data in decode_engineIO_content(bytearray(content)):
+            if data[:1] == b'\x04':
+                # Binary message (text messages start with a digit)
+                session.receive_binary(data[1:])
+            else:
+                session.receive_packet(packet_type, data)
+        self._send_response(200, b'ok', 'text/html')
+
+    def _parse_request(self):
+        url = urlparse(self.path)
+        if url.path.strip('/') != self.server.resource:
+            self._send_error(404, 'Not found')
+            return None
+        return parse_qs(url.query)
+
+    def _send_payload(self, packets):
+        content = bytearray()
+        for packet_type, data in packets:
+            if packet_type is None:
+                content.extend(encode_engineIO_binary_content(data))
+            else:
+                content.extend(encode_engineIO_content([(packet_type, data)]))
+        self._send_response(200, bytes(content), 'application/octet-stream')
+
+    def _send_error(self, code, message):
+        self._send_response(code, message.encode('utf-8'), 'text/plain')
+
+    def _send_response(self, code, content, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _serve_websocket(self, sid):
+        key = self.headers.get('Sec-WebSocket-Key')
+        session = self.server.get_session(sid) if sid else None
+        if key is None or (sid and session is None):
+            self._send_error(400, 'Bad request')
+            return
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest())
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept.decode('ascii'))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        websocket = WebsocketConnection(self.rfile, self.wfile)
+
+        if session is None:
+            # Direct websocket connection, no polling handshake.
+            session = self.server.create_session()
+            session.upgrade(websocket)
+            session.send_packet(0, self.server.handshake(session, []))
+            self.server.handle_connect(session)
+        try:
+            while not session.closed:
+                message = websocket.recv_message()
+                if message is None:
+                    break
+                opcode, payload = message
+                if opcode == OPCODE_BINARY:
+                    session.receive_binary(payload[1:])
+                    continue
+                packet = payload.decode('utf-8')
+                packet_type, data = int(packet[0]), packet[1:]
+                if session.transport != 'websocket':
+                    # Upgrade in progress
+                    if packet_type == 2 and data == 'probe':
+                        websocket.send_frame(OPCODE_TEXT, b'3probe')
+                    elif packet_type == 5:
+                        session.upgrade(websocket)
+                    continue
+                session.receive_packet(packet_type, data)
+        except (IOError, OSError, ValueError):
+            pass
+        websocket.close()
+        if session.transport == 'websocket':
+            session.close()
+
+
+class EngineIOServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded engine.io server.
+
+    Override `handle_connect`, `handle_event` and `handle_disconnect` to
+    implement the application.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=8080, resource='socket.io'):
+        HTTPServer.__init__(self, (host, port), EngineIORequestHandler)
+        self.resource = resource
+        self.sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        for session in list(self.sessions.values()):
+            session.close()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (IOError, OSError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def create_session(self):
+        session = Session(self, uuid.uuid4().hex)
+        with self._sessions_lock:
+            self.sessions[session.sid] = session
+        return session
+
+    def get_session(self, sid):
+        return self.sessions.get(sid)
+
+    def remove_session(self, session):
+        with self._sessions_lock:
+            self.sessions.pop(session.sid, None)
+
+    def handshake(self, session, upgrades):
+        return json.dumps({
+            'sid': session.sid,
+            'upgrades': upgrades,
+            'pingInterval': PING_INTERVAL,
+            'pingTimeout': PING_TIMEOUT,
+        })
+
+    def emit(self, event, *args):
+        """
+        Emit an event to every connected session.
+        """
+        for session in list(self.sessions.values()):
+            session.emit(event, *args)
+
+    def handle_connect(self, session):
+        session.send_packet(4, '0')
+
+    def handle_event(self, session, event, args):
+        pass
+
+    def handle_disconnect(self, session):
+        pass
+
+
+def _unmask(payload, mask):
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (
+        int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')
+    ).to_bytes(length, 'big')
+
+
+def _parse_args(data):
+    # Skip ack id, if any.
+    start = data.find('[')
+    if start < 0:
+        return []
+    try:
+        args = json.loads(data[start:])
+    except ValueError:
+        return []
+    return args if isinstance(args, list) else [args]
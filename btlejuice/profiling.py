@@ -0,0 +1,95 @@
+"""
+BtleJuice on-demand profiling
+"""
+import cProfile
+import pstats
+import time
+
+from btlejuice.stats import perf_counter_ns
+
+
+# Engine.io packet callbacks, run for every packet rather than per event.
+ENGINEIO_EVENTS = (
+    'open', 'close', 'ping', 'pong', 'message', 'upgrade', 'noop', 'blob')
+
+
+class DispatchProfiler(object):
+    """
+    Profile of the receive/dispatch thread.
+
+    Collects a cProfile profile of the thread calling `start`, along with the
+    time spent handling each core event type and in each interface hook.
+    `save` writes the profile in pstats format to `path` (for pstats,
+    snakeviz, ...) and a text report to `path` + '.txt'.
+    """
+
+    def __init__(self, path, seconds=10):
+        self.path = path
+        self.seconds = seconds
+        self.started = None
+        self.stopped = None
+        self.events = {}
+        self.hooks = {}
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self.started = time.time()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self.stopped = time.time()
+
+    @property
+    def expired(self):
+        return self.started is not None and \
+            time.time() - self.started >= self.seconds
+
+    def wrap_event(self, event, callback):
+        """
+        Wrap a namespace callback to record the time spent handling `event`.
+        """
+        if event in ENGINEIO_EVENTS:
+            return callback
+        def profiled(*args):
+            started = perf_counter_ns()
+            try:
+                return callback(*args)
+            finally:
+                self._record(self.events, event, perf_counter_ns() - started)
+        return profiled
+
+    def record_hook(self, hook, service, characteristic, started, elapsed,
+                    error=None):
+        self._record(self.hooks, hook, elapsed)
+
+    def save(self):
+        self._profile.dump_stats(self.path)
+        with open(self.path + '.txt', 'w') as report:
+            self.report(report)
+
+    def report(self, stream, limit=40):
+        """
+        Write the per event, per hook and per function report to `stream`.
+        """
+        duration = (self.stopped or time.time()) - self.started
+        stream.write('Profiled %.1f seconds\n' % duration)
+        for title, records in (('Event', self.events), ('Hook', self.hooks)):
+            stream.write('\n%-28s %10s %12s %10s %7s\n' % (
+                title, 'count', 'total (ms)', 'mean (us)', 'cpu %'))
+            for name, (count, total) in sorted(
+                    records.items(), key=lambda item: -item[1][1]):
+                stream.write('%-28s %10d %12.2f %10.2f %7.1f\n' % (
+                    name, count, total / 1e6, total / 1e3 / count,
+                    100.0 * total / 1e9 / duration if duration else 0))
+        stream.write('\n')
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(limit)
+
+    def _record(self, records, name, elapsed):
+        record = records.get(name)
+        if record is None:
+            records[name] = [1, elapsed]
+        else:
+            record[0] += 1
+            record[1] += elapsed
@@ -0,0 +1,140 @@
+"""
+BtleJuice scan results
+"""
+import re
+import time
+from fnmatch import translate
+
+
+class ScanEntry(object):
+    """
+    Scan result for a single device.
+
+    `rssi` is smoothed over the received advertisements, `count` is the number
+    of advertisements coalesced into this entry.
+    """
+
+    __slots__ = (
+        'address', 'name', 'rssi', 'first_seen', 'last_seen', 'count',
+        'matched'
+    )
+
+    def __init__(self, address, name, rssi, seen):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.first_seen = seen
+        self.last_seen = seen
+        self.count = 1
+        self.matched = False
+
+    def __repr__(self):
+        return '<ScanEntry %s %r rssi=%s count=%d>' % (
+            self.address, self.name, self.rssi, self.count)
+
+
+class ScanResults(object):
+    """
+    Scan results table.
+
+    Coalesces advertisements by device address, and matches devices against
+    a set of target addresses and name patterns (shell-style wildcards are
+    accepted in names). Matching is performed once per device, repeated
+    advertisements only update the RSSI and last-seen time.
+
+    Callbacks registered with `subscribe` are called with the new `ScanEntry`
+    each time a device is seen for the first time.
+    """
+
+    def __init__(self, addresses=None, names=None, smoothing=0.25):
+        self.smoothing = smoothing
+        self.devices = {}
+        self._callbacks = []
+        self.set_targets(addresses, names)
+
+    def set_targets(self, addresses=None, names=None):
+        """
+        Define the target addresses and name patterns.
+        """
+        self.addresses = set(address.lower() for address in addresses or ())
+        self.names = set()
+        patterns = []
+        for name in names or ():
+            if any(c in name for c in '*?['):
+                patterns.append(translate(name))
+            else:
+                self.names.add(name)
+        if patterns:
+            self._name_pattern = re.compile('|'.join(patterns))
+        else:
+            self._name_pattern = None
+        for entry in self.devices.values():
+            entry.matched = self._match(entry.address, entry.name)
+
+    def subscribe(self, callback):
+        """
+        Register a callback called with each new device.
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def clear(self):
+        """
+        Forget all the devices seen so far.
+        """
+        self.devices = {}
+
+    def update(self, address, name, rssi):
+        """
+        Record an advertisement and return the corresponding `ScanEntry`.
+
+        The returned entry `count` is 1 if the device is new.
+        """
+        address = address.lower()
+        now = time.time()
+        entry = self.devices.get(address)
+        if entry is not None:
+            if rssi is not None:
+                if entry.rssi is None:
+                    entry.rssi = rssi
+                else:
+                    entry.rssi += self.smoothing * (rssi - entry.rssi)
+            entry.last_seen = now
+            entry.count += 1
+            if name and name != entry.name:
+                # Name may only be present in scan responses.
+                entry.name = name
+                entry.matched = self._match(address, name)
+            return entry
+
+        entry = ScanEntry(address, name, rssi, now)
+        entry.matched = self._match(address, name)
+        self.devices[address] = entry
+        for callback in self._callbacks:
+            callback(entry)
+        return entry
+
+    def matches(self):
+        """
+        Return the entries matching our targets.
+        """
+        return [entry for entry in self.devices.values() if entry.matched]
+
+    def _match(self, address, name):
+        if address in self.addresses:
+            return True
+        if name:
+            if name in self.names:
+                return True
+            if self._name_pattern is not None:
+                return self._name_pattern.match(name) is not None
+        return False
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __contains__(self, address):
+        return address.lower() in self.devices
@@ -1,23 +1,26 @@
 import atexit
+import time
 
 from .exceptions import ConnectionError, TimeoutError, PacketError
-from .heartbeats import HeartbeatThread
+from .heartbeats import HeartbeatThread, NullHeartbeat
 from .logs import LoggingMixin
 from .namespaces import (
     EngineIONamespace, SocketIONamespace,
     LoggingSocketIONamespace, find_callback, make_logging_prefix)
+from .recorder import FlightRecorder, monotonic
 from .parsers import (
     parse_host, parse_engineIO_session,
     format_socketIO_packet_data, parse_socketIO_packet_data,
     get_namespace_path,
-    parse_socketIO_binary_packet_data, _data_is_binary, 
+    parse_socketIO_binary_packet_data, _data_is_binary, _rebuild_data,
     format_socketIO_binary_packet_data, Buffer)
 from .symmetries import get_character
 from .transports import (
-    WebsocketTransport, XHR_PollingTransport, prepare_http_session, TRANSPORTS)
+    WebsocketTransport, XHR_PollingTransport, LoopbackTransport,
+    prepare_http_session, CONNECT_TIMEOUT, TRANSPORTS)
 
 
-__all__ = 'SocketIO', 'SocketIONamespace'
+__all__ = 'SocketIO', 'SocketIONamespace', 'LoopbackTransport'
 __version__ = '0.7.0'
 BaseNamespace = SocketIONamespace
 LoggingNamespace = LoggingSocketIONamespace
@@ -45,10 +48,20 @@ class EngineIO(LoggingMixin):
         self._client_transports = transports
         self._hurry_interval_in_seconds = hurry_interval_in_seconds
         self._http_session = prepare_http_session(kw)
+        self._connect_timeout = kw.get('timeout', CONNECT_TIMEOUT)
 
         self._log_name = self._url
+        self._cache_log_levels()
+        self.flight_recorder = FlightRecorder(
+            kw.get('flight_recorder_size', 256),
+            kw.get('flight_recorder_directory'))
+        self._record_frame = self.flight_recorder.frames.append
+        self._ping_sent_at = None
+        self.ping_rtt = None
         self._opened = False
         self._wants_to_close = False
+        # Functions wrapping packet processing, see _process_packets
+        self._packet_wrappers = []
         atexit.register(self._close)
 
         if Namespace:
@@ -61,8 +74,14 @@ class EngineIO(LoggingMixin):
     def _transport(self):
         if self._opened:
             return self._transport_instance
-        self._engineIO_session = self._get_engineIO_session()
-        self._negotiate_transport()
+        loopback = self._get_loopback_transport()
+        if loopback is not None:
+            self._engineIO_session = self._open_loopback_session(loopback)
+        elif 'xhr-polling' in self._client_transports:
+            self._engineIO_session = self._get_engineIO_session()
+            self._negotiate_transport()
+        else:
+            self._engineIO_session = self._open_websocket_session()
         self._connect_namespaces()
         self._opened = True
         self._reset_heartbeat()
@@ -83,9 +102,62 @@ class EngineIO(LoggingMixin):
                 warning = Exception(
                     '[engine.io waiting for connection] %s' % e)
                 warning_screen.throw(warning)
+        self._record_frame((
+            monotonic(), 'received', engineIO_packet_type, engineIO_packet_data))
         assert engineIO_packet_type == 0  # engineIO_packet_type == open
         return parse_engineIO_session(engineIO_packet_data)
 
+    def _open_websocket_session(self):
+        'Open the engine.io session directly over websocket, without probing'
+        warning_screen = self._yield_warning_screen()
+        for elapsed_time in warning_screen:
+            transport = None
+            try:
+                transport = WebsocketTransport(
+                    self._http_session, self._is_secure, self._url,
+                    timeout=self._connect_timeout)
+                engineIO_packet_type, engineIO_packet_data = next(
+                    transport.recv_packet())
+                break
+            except (TimeoutError, ConnectionError) as e:
+                if transport is not None:
+                    transport.close()
+                if not self._wait_for_connection:
+                    raise
+                warning = Exception(
+                    '[engine.io waiting for connection] %s' % e)
+                warning_screen.throw(warning)
+        self._record_frame((
+            monotonic(), 'received', engineIO_packet_type, engineIO_packet_data))
+        assert engineIO_packet_type == 0  # engineIO_packet_type == open
+        engineIO_session = parse_engineIO_session(engineIO_packet_data)
+        transport.set_session(engineIO_session)
+        self._transport_instance = transport
+        self.transport_name = 'websocket'
+        self._debug('[engine.io transport selected] %s', self.transport_name)
+        return engineIO_session
+
+    def _get_loopback_transport(self):
+        for transport in self._client_transports:
+            if isinstance(transport, LoopbackTransport):
+                return transport
+        return None
+
+    def _open_loopback_session(self, transport):
+        'Open the engine.io session over an in-memory loopback transport'
+        engineIO_packet_type, engineIO_packet_data = next(
+            transport.recv_packet())
+        self._record_frame((
+            monotonic(), 'received', engineIO_packet_type, engineIO_packet_data))
+        assert engineIO_packet_type == 0  # engineIO_packet_type == open
+        engineIO_session = parse_engineIO_session(engineIO_packet_data)
+        transport.set_session(engineIO_session)
+        transport.attach(self)
+        self._transport_instance = transport
+        self.transport_name = 'loopback'
+        self._debug('[engine.io transport selected] %s', self.transport_name)
+        return engineIO_session
+
     def _negotiate_transport(self):
         self._transport_instance = self._get_transport('xhr-polling')
         self.transport_name = 'xhr-polling'
@@ -94,10 +166,12 @@ class EngineIO(LoggingMixin):
         if is_ws_client and is_ws_server:
             try:
                 transport = self._get_transport('websocket')
-                transport.send_packet(2, 'probe')
+                self._send_packet(transport, 2, 'probe')
                 for packet_type, packet_data in transport.recv_packet():
+                    self._record_frame((
+                        monotonic(), 'received', packet_type, packet_data))
                     if packet_type == 3 and packet_data == b'probe':
-                        transport.send_packet(5, '')
+                        self._send_packet(transport, 5)
                         self._transport_instance = transport
                         self.transport_name = 'websocket'
                     else:
@@ -112,6 +186,10 @@ class EngineIO(LoggingMixin):
             hurried = self._heartbeat_thread.hurried
         except AttributeError:
             hurried = False
+        if self.transport_name == 'loopback':
+            # Packets are only processed on demand, no need to ping
+            self._heartbeat_thread = NullHeartbeat()
+            return
         ping_interval = self._engineIO_session.ping_interval
         if self.transport_name.endswith('-polling'):
             # Use ping/pong to unblock recv for polling transport
@@ -189,7 +267,7 @@ class EngineIO(LoggingMixin):
 
     def _open(self):
         engineIO_packet_type = 0
-        self._transport_instance.send_packet(engineIO_packet_type)
+        self._send_packet(self._transport_instance, engineIO_packet_type)
 
     def _close(self):
         self._wants_to_close = True
@@ -202,20 +280,23 @@ class EngineIO(LoggingMixin):
             return
         engineIO_packet_type = 1
         try:
-            self._transport_instance.send_packet(engineIO_packet_type)
+            self._send_packet(self._transport_instance, engineIO_packet_type)
         except (TimeoutError, ConnectionError):
             pass
         self._opened = False
 
     def _ping(self, engineIO_packet_data=''):
         engineIO_packet_type = 2
-        self._transport_instance.send_packet(
-            engineIO_packet_type, engineIO_packet_data)
+        self._ping_sent_at = time.time()
+        self._send_packet(
+            self._transport_instance, engineIO_packet_type,
+            engineIO_packet_data)
 
     def _pong(self, engineIO_packet_data=''):
         engineIO_packet_type = 3
-        self._transport_instance.send_packet(
-            engineIO_packet_type, engineIO_packet_data)
+        self._send_packet(
+            self._transport_instance, engineIO_packet_type,
+            engineIO_packet_data)
 
     @retry
     def _message(self, engineIO_packet_data, with_transport_instance=False):
@@ -224,21 +305,34 @@ class EngineIO(LoggingMixin):
             transport = self._transport_instance
         else:
             transport = self._transport
-        transport.send_packet(engineIO_packet_type, engineIO_packet_data)
-        self._debug('[socket.io packet sent] %s', engineIO_packet_data)
+        self._send_packet(transport, engineIO_packet_type, engineIO_packet_data)
+        if self._debug_enabled:
+            self._debug('[socket.io packet sent] %s', engineIO_packet_data)
 
     def _upgrade(self):
         engineIO_packet_type = 5
-        self._transport_instance.send_packet(engineIO_packet_type)
+        self._send_packet(self._transport_instance, engineIO_packet_type)
 
     def _noop(self):
         engineIO_packet_type = 6
-        self._transport_instance.send_packet(engineIO_packet_type)
+        self._send_packet(self._transport_instance, engineIO_packet_type)
+
+    def _send_packet(
+            self, transport, engineIO_packet_type, engineIO_packet_data=''):
+        # Recorded before sending, so that a failed send is in the dump
+        self._record_frame((
+            monotonic(), 'sent', engineIO_packet_type, engineIO_packet_data))
+        if self._packet_log_enabled:
+            self._log_packet(
+                'sent', engineIO_packet_type, engineIO_packet_data)
+        transport.send_packet(engineIO_packet_type, engineIO_packet_data)
 
     # React
 
     def wait(self, seconds=None, **kw):
         'Wait in a loop and react to events as defined in the namespaces'
+        # Pick up logging level changes
+        self._cache_log_levels()
         # Use ping/pong to unblock recv for polling transport
         self._heartbeat_thread.hurry()
         # Use timeout to unblock recv for websocket transport
@@ -258,6 +352,7 @@ class EngineIO(LoggingMixin):
                     raise
             except ConnectionError as e:
                 self._opened = False
+                self._dump_flight_recorder('connection error: %s' % e)
                 try:
                     warning = Exception('[connection error] %s' % e)
                     warning_screen.throw(warning)
@@ -274,15 +369,38 @@ class EngineIO(LoggingMixin):
     def _should_stop_waiting(self):
         return self._wants_to_close
 
+    def dump_flight_recorder(self, path=None):
+        'Write the last packets sent and received to a file, return its path'
+        return self.flight_recorder.dump(path, session=self._url)
+
+    def _dump_flight_recorder(self, reason):
+        try:
+            path = self.flight_recorder.dump_on_error(reason, self._url)
+        except (IOError, OSError) as e:
+            self._warn('[flight recorder] could not dump packets: %s', e)
+            return
+        if path:
+            self._warn('[flight recorder] last packets written to %s', path)
+
     def _process_packets(self):
+        process_packet = self._process_packet
+        for wrapper in self._packet_wrappers:
+            process_packet = wrapper(process_packet)
         for engineIO_packet in self._transport.recv_packet():
             try:
-                self._process_packet(engineIO_packet)
+                process_packet(engineIO_packet)
             except PacketError as e:
                 self._warn('[packet error] %s', e)
+                self._dump_flight_recorder('packet error: %s' % e)
 
     def _process_packet(self, packet):
         engineIO_packet_type, engineIO_packet_data = packet
+        self._record_frame((
+            monotonic(), 'received', engineIO_packet_type,
+            engineIO_packet_data))
+        if self._packet_log_enabled:
+            self._log_packet(
+                'received', engineIO_packet_type, engineIO_packet_data)
         # Launch callbacks
         namespace = self.get_namespace()
         try:
@@ -314,6 +432,8 @@ class EngineIO(LoggingMixin):
         namespace._find_packet_callback('ping')(data)
 
     def _on_pong(self, data, namespace):
+        if self._ping_sent_at is not None:
+            self.ping_rtt = time.time() - self._ping_sent_at
         namespace._find_packet_callback('pong')(data)
 
     def _on_message(self, data, namespace):
@@ -337,6 +457,14 @@ class SocketIO(EngineIO):
     - Prefix host with https:// to use SSL.
     - Set wait_for_connection=True to block until we have a connection.
     - Specify desired transports=['websocket', 'xhr-polling'].
+    - Specify transports=['websocket'] to skip the polling handshake and
+      open the session directly over websocket. Set timeout to the seconds
+      to wait for the session (default: 60).
+    - Specify transports=[LoopbackTransport()] to exchange packets in
+      memory, without any server.
+    - Set flight_recorder_size to the number of packets kept in memory,
+      written to flight_recorder_directory on connection and packet errors
+      or by dump_flight_recorder().
     - Pass query params, headers, cookies, proxies as keyword arguments.
 
     SocketIO(
@@ -357,6 +485,7 @@ class SocketIO(EngineIO):
         self.buffers = []
         self.attachment_count = 0
         self.current_packet = None
+        self.packet = None
         super(SocketIO, self).__init__(
             host, port, Namespace, wait_for_connection, transports,
             resource, hurry_interval_in_seconds, **kw)
@@ -446,6 +575,9 @@ class SocketIO(EngineIO):
             # send all the binary buffers
             transport = self._transport
             for buf in buffers:
+                self._record_frame((monotonic(), 'sent', 4, buf.content))
+                if self._packet_log_enabled:
+                    self._log_packet('sent', 4, buf.content)
                 transport.send_binary_packet(buf.content)
         else:
 
@@ -490,7 +622,8 @@ class SocketIO(EngineIO):
         engineIO_packet_data = super(SocketIO, self)._process_packet(packet)
         if engineIO_packet_data is None:
             return
-        self._debug('[socket.io packet received] %s', engineIO_packet_data)
+        if self._debug_enabled:
+            self._debug('[socket.io packet received] %s', engineIO_packet_data)
         try:
             socketIO_packet_type = int(get_character(engineIO_packet_data, 0))
             socketIO_packet_data = engineIO_packet_data[1:]
@@ -499,7 +632,11 @@ class SocketIO(EngineIO):
             socketIO_packet_data = engineIO_packet_data[1:]
 
         # Launch callbacks
-        path = get_namespace_path(socketIO_packet_data)
+        if socketIO_packet_type == 7:
+            # Binary attachments belong to the pending binary event
+            path = self.packet.path if self.packet else ''
+        else:
+            path = get_namespace_path(socketIO_packet_data)
         namespace = self.get_namespace(path)
         try:
             delegate = {
@@ -573,7 +710,7 @@ class SocketIO(EngineIO):
             self.buffers.append(Buffer(data))
             self.attachment_count -= 1
             if self.attachment_count == 0:
-                args = self._rebuild_packet(self.packet.args, self.buffers)
+                args = _rebuild_data(self.packet.args, self.buffers)
                 #print args
                 event = args[0]
                 namespace._find_packet_callback(event)(*args[1:])
@@ -582,28 +719,6 @@ class SocketIO(EngineIO):
         else:
             self._warn('[unexpected] do not exepect a binary blob right now')
 
-    def _rebuild_packet(self, packet, buffers):
-        """
-        Crawl the packet data and replace placeholders by the buffers.
-        """
-        if type(packet) is list:
-            rebuilt_list = []
-            for item in packet:
-                rebuilt_list.append(self._rebuild_packet(item, buffers))
-            return rebuilt_list
-        elif type(packet) is dict:
-            if u'_placeholder' in packet and u'num' in packet:
-                # replace placeholder with the correct buffer
-                num = int(packet[u'num'])
-                return self.buffers[num]
-            else:
-                rebuilt_dict = {}
-                for key in packet:
-                    rebuilt_dict[key] = self._rebuild_packet(packet[key], buffers)
-                return rebuilt_dict
-        else:
-            return packet
-
     def _prepare_to_send_ack(self, path, ack_id):
         'Return function that acknowledges the server'
         return lambda *args: self._ack(path, ack_id, *args)
@@ -50,3 +50,21 @@ class HeartbeatThread(Thread):
     def halt(self):
         self._rest.set()
         self._halt.set()
+
+
+class NullHeartbeat(object):
+    'Heartbeat for transports that do not need one (loopback)'
+
+    hurried = False
+
+    def relax(self):
+        pass
+
+    def hurry(self):
+        pass
+
+    def halt(self):
+        pass
+
+    def join(self):
+        pass
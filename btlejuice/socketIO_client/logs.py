@@ -1,3 +1,5 @@
+import binascii
+import json
 import logging
 import time
 
@@ -7,11 +9,41 @@ from .symmetries import NullHandler
 LOG = logging.getLogger('socketIO-client')
 LOG.addHandler(NullHandler())
 
+# Every engine.io packet sent and received, as structured records. Disabled
+# unless switched on (see enable_packet_log), including in debug mode.
+PACKET_LOG = logging.getLogger('socketIO-client.packets')
+PACKET_LOG.addHandler(NullHandler())
+PACKET_LOG.setLevel(logging.WARNING)
+
 
 class LoggingMixin(object):
 
+    # Whether debug messages and packet records are enabled, cached for the
+    # packet hot path by _cache_log_levels.
+    _debug_enabled = False
+    _packet_log_enabled = False
+
+    def _cache_log_levels(self):
+        self._debug_enabled = LOG.isEnabledFor(logging.DEBUG)
+        self._packet_log_enabled = PACKET_LOG.isEnabledFor(logging.DEBUG)
+
     def _log(self, level, msg, *attrs):
-        LOG.log(level, '%s %s' % (self._log_name, msg), *attrs)
+        # Only format messages that will be logged (isEnabledFor results are
+        # cached by the logging module until levels change).
+        if LOG.isEnabledFor(level):
+            LOG.log(level, '%s %s' % (self._log_name, msg), *attrs)
+
+    def _log_packet(self, direction, engineIO_packet_type,
+                    engineIO_packet_data=''):
+        if PACKET_LOG.isEnabledFor(logging.DEBUG):
+            PACKET_LOG.debug(
+                '%s %s %s %r', self._log_name, direction,
+                engineIO_packet_type, engineIO_packet_data, extra={
+                    'session': self._log_name,
+                    'direction': direction,
+                    'packet_type': engineIO_packet_type,
+                    'packet_data': engineIO_packet_data,
+                })
 
     def _debug(self, msg, *attrs):
         self._log(logging.DEBUG, msg, *attrs)
@@ -46,3 +78,58 @@ def _yield_elapsed_time(seconds=None):
 
 def _get_elapsed_time(start_time):
     return time.time() - start_time
+
+
+class PacketLogFormatter(logging.Formatter):
+    'Format packet records as JSON lines'
+
+    def format(self, record):
+        data = record.packet_data
+        entry = {
+            'time': record.created,
+            'session': record.session,
+            'direction': record.direction,
+            'type': record.packet_type,
+            'size': len(data),
+        }
+        entry['data'], binary = format_packet_data(data)
+        if binary:
+            entry['binary'] = True
+        return json.dumps(entry)
+
+
+def format_packet_data(data):
+    """Return packet data as text, hex-encoded if it is not valid UTF-8, and
+    whether it was hex-encoded.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            return bytes(data).decode('utf-8'), False
+        except UnicodeDecodeError:
+            return binascii.hexlify(bytes(data)).decode('ascii'), True
+    return data, False
+
+
+def enable_packet_log(filename=None, stream=None):
+    """Log every engine.io packet as a JSON line to `filename` or `stream`
+    (default: stderr), without enabling debug messages.
+
+    Return the handler, to be passed to disable_packet_log.
+    """
+    if filename:
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler(stream)
+    handler.setFormatter(PacketLogFormatter())
+    PACKET_LOG.addHandler(handler)
+    PACKET_LOG.setLevel(logging.DEBUG)
+    PACKET_LOG.propagate = False
+    return handler
+
+
+def disable_packet_log(handler):
+    PACKET_LOG.removeHandler(handler)
+    handler.close()
+    if not [h for h in PACKET_LOG.handlers if not isinstance(h, NullHandler)]:
+        PACKET_LOG.setLevel(logging.WARNING)
+        PACKET_LOG.propagate = True
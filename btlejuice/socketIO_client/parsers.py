@@ -1,11 +1,10 @@
 import json
-import six
 import functools
 from collections import namedtuple
-from types import *
-from six.moves.urllib.parse import urlparse as parse_url
 
-from .symmetries import decode_string, encode_string, get_byte, get_character
+from .symmetries import (
+    decode_string, encode_string, get_byte, get_character, itervalues,
+    parse_url, string_types)
 
 
 EngineIOSession = namedtuple('EngineIOSession', [
@@ -43,6 +42,11 @@ def encode_engineIO_content(engineIO_packets):
     return content
 
 
+def encode_engineIO_binary_content(engineIO_packet_data):
+    packet = format_packet_binary(4, engineIO_packet_data)
+    return _make_packet_prefix(packet, is_binary=True) + packet
+
+
 def decode_engineIO_content(content):
     content_index = 0
     content_length = len(content)
@@ -115,7 +119,7 @@ def parse_socketIO_packet_data(socketIO_packet_data):
         args = json.loads(data)
     except ValueError:
         args = []
-    if isinstance(args, six.string_types):
+    if isinstance(args, string_types):
         args = [args]
     return SocketIOData(path=path, ack_id=ack_id, args=args)
 
@@ -131,7 +135,9 @@ def format_packet_text(packet_type, packet_data):
     return encode_string(str(packet_type) + packet_data)
 
 def format_packet_binary(packet_type, packet_data):
-    return encode_string(chr(packet_type) + packet_data)
+    if not isinstance(packet_data, (bytes, bytearray)):
+        packet_data = encode_string(packet_data)
+    return bytes(bytearray([packet_type])) + bytes(packet_data)
 
 def parse_packet_text(packet_text):
     try:
@@ -159,9 +165,9 @@ def get_namespace_path(socketIO_packet_data):
     return ''.join(parts)
 
 
-def _make_packet_prefix(packet):
+def _make_packet_prefix(packet, is_binary=False):
     length_string = str(len(packet))
-    header_digits = bytearray([0])
+    header_digits = bytearray([1 if is_binary else 0])
     for i in range(len(length_string)):
         header_digits.append(ord(length_string[i]) - 48)
     header_digits.append(255)
@@ -169,7 +175,8 @@ def _make_packet_prefix(packet):
 
 
 def _read_packet_length(content, content_index):
-    while get_byte(content, content_index) != 0:
+    # Skip the string (0) or binary (1) packet marker
+    while get_byte(content, content_index) > 1:
         content_index += 1
     content_index += 1
     packet_length_string = ''
@@ -198,11 +205,24 @@ def _data_is_binary(data):
     elif isinstance(data, dict):
         return functools.reduce(
             lambda a, b: a or b, [_data_is_binary(item)
-                                  for item in six.itervalues(data)],
+                                  for item in itervalues(data)],
             False)
     else:
         return False
 
+def _rebuild_data(data, attachments):
+    """Replace the placeholders of binary packet data by their attachments."""
+    if isinstance(data, list):
+        return [_rebuild_data(item, attachments) for item in data]
+    elif isinstance(data, dict):
+        if u'_placeholder' in data and u'num' in data:
+            return attachments[int(data[u'num'])]
+        return dict(
+            (key, _rebuild_data(value, attachments))
+            for key, value in data.items())
+    else:
+        return data
+
 class Buffer:
     def __init__(self, content):
         self.content = content
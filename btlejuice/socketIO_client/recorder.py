@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import time
+from collections import deque
+
+from .logs import format_packet_data
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+
+class FlightRecorder(object):
+    """Ring buffer of the last engine.io packets sent and received.
+
+    Packets are kept as (monotonic time, direction, type, data) tuples and
+    only formatted when dumped, so that recording can stay always on. On the
+    packet path, tuples are appended to `frames` directly, with a time from
+    `monotonic`.
+    """
+
+    def __init__(self, size=256, directory=None, dump_interval=10):
+        self.frames = deque(maxlen=size)
+        self.directory = directory or tempfile.gettempdir()
+        self.dump_interval = dump_interval
+        self._last_dumped_frame = None
+        self._last_dump = None
+
+    def dump(self, path=None, reason='requested', session=None):
+        """Write the recorded packets as JSON lines to `path` (default: a
+        timestamped file in `directory`) and return the path.
+
+        The first line describes the dump, with the monotonic and wall-clock
+        times at which it was written.
+        """
+        if path is None:
+            path = os.path.join(self.directory, 'socketIO-client-%s-%d.jsonl' % (
+                time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        frames = list(self.frames)
+        with open(path, 'w') as output:
+            output.write(json.dumps({
+                'reason': reason,
+                'session': session,
+                'time': time.time(),
+                'monotonic': monotonic(),
+                'frames': len(frames),
+            }) + '\n')
+            for timestamp, direction, packet_type, packet_data in frames:
+                entry = {
+                    'monotonic': timestamp,
+                    'direction': direction,
+                    'type': packet_type,
+                    'size': len(packet_data),
+                }
+                entry['data'], binary = format_packet_data(packet_data)
+                if binary:
+                    entry['binary'] = True
+                output.write(json.dumps(entry) + '\n')
+        if frames:
+            self._last_dumped_frame = frames[-1]
+        return path
+
+    def dump_on_error(self, reason, session=None):
+        """Dump the recorded packets after an error, unless nothing was
+        recorded since the last dump or it was less than `dump_interval`
+        seconds ago. Return the path or None.
+        """
+        if not self.frames or self.frames[-1] is self._last_dumped_frame:
+            return None
+        now = monotonic()
+        if self._last_dump is not None and \
+                now - self._last_dump < self.dump_interval:
+            return None
+        self._last_dump = now
+        return self.dump(reason=reason, session=session)
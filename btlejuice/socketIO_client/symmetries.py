@@ -9,14 +9,12 @@ except ImportError:  # Python 2.6
             pass
 
 
-from six import indexbytes
-
-
 try:
-    from ssl import SSLError
-except ImportError:
-    class SSLError(Exception):
-        pass
+    from urllib.parse import urlencode as format_query
+    from urllib.parse import urlparse as parse_url
+except ImportError:  # Python 2
+    from urllib import urlencode as format_query
+    from urlparse import urlparse as parse_url
 
 
 try:
@@ -25,6 +23,26 @@ except NameError:
     memoryview = buffer
 
 
+try:
+    string_types = basestring,
+    binary_type = str
+
+    def indexbytes(x, index):
+        return ord(x[index])
+
+    def itervalues(d):
+        return d.itervalues()
+except NameError:  # Python 3
+    string_types = str,
+    binary_type = bytes
+
+    def indexbytes(x, index):
+        return x[index]
+
+    def itervalues(d):
+        return iter(d.values())
+
+
 def get_byte(x, index):
     return indexbytes(x, index)
 
@@ -1,36 +1,66 @@
-import requests
-import six
-import ssl
+import array
+import json
 import threading
 import time
-import socket
-from six.moves.urllib.parse import urlencode as format_query
-from six.moves.urllib.parse import urlparse as parse_url
-from socket import error as SocketError
-try:
-    from websocket import (
-        WebSocketConnectionClosedException, WebSocketTimeoutException,
-        create_connection)
-except ImportError:
-    exit("""\
-An incompatible websocket library is conflicting with the one we need.
-You can remove the incompatible library and install the correct one
-by running the following commands:
-
-yes | pip uninstall websocket websocket-client
-pip install -U websocket-client""")
+from collections import deque
 
 from .exceptions import ConnectionError, TimeoutError
 from .parsers import (
-    encode_engineIO_content, decode_engineIO_content,
-    format_packet_text, parse_packet_text, format_packet_binary)
-from .symmetries import SSLError, memoryview
+    encode_engineIO_content, encode_engineIO_binary_content,
+    decode_engineIO_content,
+    format_packet_text, parse_packet_text, format_packet_binary,
+    format_socketIO_packet_data, format_socketIO_binary_packet_data,
+    parse_socketIO_packet_data, _data_is_binary, _rebuild_data, Buffer)
+from .symmetries import (
+    binary_type, encode_string, format_query, memoryview, parse_url,
+    string_types)
+
+
+# Transport dependencies are imported by the first transport that needs them,
+# so that importing the package stays cheap.
+requests = None
+ssl = None
+SSLError = None
+SocketError = None
+WebSocketConnectionClosedException = None
+WebSocketTimeoutException = None
+create_connection = None
 
 
 ENGINEIO_PROTOCOL = 3
+# Seconds to wait for the engine.io session (engine.io default ping timeout)
+CONNECT_TIMEOUT = 60
 TRANSPORTS = 'xhr-polling', 'websocket'
 
 
+def _import_requests():
+    global requests
+    import requests
+
+
+def _import_websocket():
+    global ssl, SSLError, SocketError
+    global WebSocketConnectionClosedException, WebSocketTimeoutException
+    global create_connection
+    if create_connection is not None:
+        return
+    try:
+        from websocket import (
+            WebSocketConnectionClosedException, WebSocketTimeoutException,
+            create_connection)
+    except ImportError:
+        raise ImportError("""\
+An incompatible websocket library is conflicting with the one we need.
+You can remove the incompatible library and install the correct one
+by running the following commands:
+
+yes | pip uninstall websocket websocket-client
+pip install -U websocket-client""")
+    import ssl
+    from ssl import SSLError
+    from socket import error as SocketError
+
+
 class AbstractTransport(object):
 
     def __init__(self, http_session, is_secure, url, engineIO_session=None):
@@ -48,6 +78,10 @@ class AbstractTransport(object):
     def set_timeout(self, seconds=None):
         pass
 
+    def backlog(self):
+        'Return the number of bytes received but not processed yet, if known'
+        return None
+
 
 class XHR_PollingTransport(AbstractTransport):
 
@@ -86,12 +120,17 @@ class XHR_PollingTransport(AbstractTransport):
             yield engineIO_packet_type, engineIO_packet_data
 
     def send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
+        self._post(encode_engineIO_content([
+            (engineIO_packet_type, engineIO_packet_data),
+        ]))
+
+    def send_binary_packet(self, engineIO_packet_data=''):
+        self._post(encode_engineIO_binary_content(engineIO_packet_data))
+
+    def _post(self, data):
         with self._send_packet_lock:
             params = dict(self._params)
             params['t'] = self._get_timestamp()
-            data = encode_engineIO_content([
-                (engineIO_packet_type, engineIO_packet_data),
-            ])
             get_response(
                 self.http_session.post,
                 self._http_url,
@@ -109,16 +148,21 @@ class XHR_PollingTransport(AbstractTransport):
 
 class WebsocketTransport(AbstractTransport):
 
-    def __init__(self, http_session, is_secure, url, engineIO_session=None):
+    def __init__(self, http_session, is_secure, url, engineIO_session=None,
+                 timeout=None):
         super(WebsocketTransport, self).__init__(
             http_session, is_secure, url, engineIO_session)
+        _import_websocket()
         params = dict(http_session.params, **{
             'EIO': ENGINEIO_PROTOCOL, 'transport': 'websocket'})
         request = http_session.prepare_request(requests.Request('GET', url))
         kw = {'header': ['%s: %s' % x for x in request.headers.items()]}
+        self._timeout = timeout
         if engineIO_session:
             params['sid'] = engineIO_session.id
-            kw['timeout'] = self._timeout = engineIO_session.ping_timeout
+            self._timeout = engineIO_session.ping_timeout
+        if self._timeout:
+            kw['timeout'] = self._timeout
         ws_url = '%s://%s/?%s' % (
             'wss' if is_secure else 'ws', url, format_query(params))
         http_scheme = 'https' if is_secure else 'http'
@@ -131,7 +175,7 @@ class WebsocketTransport(AbstractTransport):
                     proxy_url_pack.username, proxy_url_pack.password)
         if http_session.verify:
             if http_session.cert:  # Specify certificate path on disk
-                if isinstance(http_session.cert, six.string_types):
+                if isinstance(http_session.cert, string_types):
                     kw['ca_certs'] = http_session.cert
                 else:
                     kw['ca_certs'] = http_session.cert[0]
@@ -153,7 +197,7 @@ class WebsocketTransport(AbstractTransport):
             raise ConnectionError('recv disconnected (%s)' % e)
         except SocketError as e:
             raise ConnectionError('recv disconnected (%s)' % e)
-        if not isinstance(packet_text, six.binary_type):
+        if not isinstance(packet_text, binary_type):
             packet_text = packet_text.encode('utf-8')
         engineIO_packet_type, engineIO_packet_data = parse_packet_text(
             packet_text)
@@ -170,20 +214,154 @@ class WebsocketTransport(AbstractTransport):
 
     def send_binary_packet(self, engineIO_packet_data=''):
         try:
-            if isinstance(engineIO_packet_data, bytes):
-                engineIO_packet_data = engineIO_packet_data.decode('utf-8')
             packet = format_packet_binary(4, engineIO_packet_data)
             self._connection.send_binary(packet)
         except WebSocketTimeoutException as e:
             raise TimeoutError('send timed out (%s)' % e)
-        except socket.error as e:
+        except SocketError as e:
             raise ConnectionError('send disconnected (%s)' % e)
         except WebSocketConnectionClosedException as e:
             raise ConnectionError('send disconnected (%s)' % e)
 
+    def close(self):
+        try:
+            self._connection.close()
+        except (SocketError, WebSocketConnectionClosedException):
+            pass
+
+    def set_session(self, engineIO_session):
+        'Adopt a session opened over this connection (no polling handshake)'
+        self.engineIO_session = engineIO_session
+        self._timeout = engineIO_session.ping_timeout
+        self.set_timeout()
+
     def set_timeout(self, seconds=None):
         self._connection.settimeout(seconds or self._timeout)
 
+    def backlog(self):
+        try:
+            import fcntl
+            import termios
+        except ImportError:  # Not available on Windows
+            return None
+        pending = array.array('i', [0])
+        try:
+            fcntl.ioctl(self._connection.sock, termios.FIONREAD, pending)
+        except (AttributeError, IOError, OSError, TypeError):
+            return None
+        return pending[0]
+
+
+class LoopbackTransport(AbstractTransport):
+    """In-memory transport, without socket or thread.
+
+    Pass an instance in place of the transport names to plug it into a
+    client, e.g. SocketIO('localhost', 8080, transports=[LoopbackTransport()]).
+    Packets queued with feed_packet/feed_event are parsed as if received
+    from a websocket and dispatched by process(); packets sent by the
+    client are kept in `sent` and decoded by emitted().
+    """
+
+    def __init__(
+            self, http_session=None, is_secure=False, url='loopback',
+            engineIO_session=None):
+        super(LoopbackTransport, self).__init__(
+            http_session, is_secure, url, engineIO_session)
+        self.sent = []
+        self._incoming = deque()
+        self._client = None
+        self.feed_packet(0, json.dumps({
+            'sid': 'loopback', 'upgrades': [],
+            'pingInterval': 25000, 'pingTimeout': 60000}))
+        self.feed_packet(4, '0')
+
+    def attach(self, client):
+        'Deliver packets to this engine.io client'
+        self._client = client
+
+    def set_session(self, engineIO_session):
+        self.engineIO_session = engineIO_session
+
+    def recv_packet(self):
+        while self._incoming:
+            yield self._incoming.popleft()
+
+    def send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
+        self.sent.append((engineIO_packet_type, engineIO_packet_data))
+
+    def send_binary_packet(self, engineIO_packet_data=''):
+        self.sent.append((4, Buffer(bytes(engineIO_packet_data))))
+
+    def backlog(self):
+        return sum(len(data) for packet_type, data in list(self._incoming))
+
+    # Server side
+
+    def feed_packet(self, engineIO_packet_type, engineIO_packet_data=''):
+        'Queue an engine.io packet for the client'
+        self._incoming.append(parse_packet_text(format_packet_text(
+            engineIO_packet_type, engineIO_packet_data)))
+
+    def feed_binary_packet(self, engineIO_packet_data):
+        'Queue a binary engine.io message for the client'
+        self._incoming.append(parse_packet_text(format_packet_binary(
+            4, engineIO_packet_data)))
+
+    def feed_event(self, event, *args, **kw):
+        """Queue a socket.io event for the client.
+
+        Bytes arguments are sent as binary attachments.
+        """
+        path = kw.get('path', '')
+        args = [event] + [
+            Buffer(arg) if isinstance(arg, (bytes, bytearray)) else arg
+            for arg in args]
+        if _data_is_binary(args):
+            buffers, socketIO_packet_data = format_socketIO_binary_packet_data(
+                path, None, args)
+            self.feed_packet(4, '5' + socketIO_packet_data)
+            for buf in buffers:
+                self.feed_binary_packet(buf.content)
+        else:
+            self.feed_packet(
+                4, '2' + format_socketIO_packet_data(path, None, args))
+
+    def process(self):
+        'Dispatch the queued packets to the attached client'
+        if self._client is not None:
+            self._client._cache_log_levels()
+            self._client._process_packets()
+
+    def emitted(self):
+        'Return the socket.io events sent by the client as (event, *args)'
+        events = []
+        attachments = []
+        packet = None
+        for engineIO_packet_type, engineIO_packet_data in self.sent:
+            if engineIO_packet_type != 4:
+                continue
+            if isinstance(engineIO_packet_data, Buffer):
+                attachments.append(engineIO_packet_data.content)
+                if packet is not None and len(attachments) == packet[0]:
+                    events.append(tuple(_rebuild_data(packet[1], attachments)))
+                    packet, attachments = None, []
+                continue
+            socketIO_packet_type = engineIO_packet_data[:1]
+            socketIO_packet_data = engineIO_packet_data[1:]
+            if socketIO_packet_type == '2':
+                events.append(tuple(parse_socketIO_packet_data(
+                    encode_string(socketIO_packet_data)).args))
+            elif socketIO_packet_type == '5':
+                count, socketIO_packet_data = socketIO_packet_data.split('-', 1)
+                args = parse_socketIO_packet_data(
+                    encode_string(socketIO_packet_data)).args
+                packet, attachments = (int(count), args), []
+        return events
+
+    def clear(self):
+        'Forget the packets sent so far'
+        del self.sent[:]
+
 
 def get_response(request, *args, **kw):
     try:
@@ -202,6 +380,7 @@ def get_response(request, *args, **kw):
 
 
 def prepare_http_session(kw):
+    _import_requests()
     http_session = requests.Session()
     http_session.headers.update(kw.get('headers', {}))
     http_session.auth = kw.get('auth')
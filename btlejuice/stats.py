@@ -0,0 +1,102 @@
+"""
+BtleJuice latency statistics
+"""
+try:
+    from time import perf_counter_ns
+except ImportError:  # Python < 3.7
+    from time import time as _time
+
+    def perf_counter_ns():
+        return int(_time() * 1000000000)
+
+
+class LatencyHistogram(object):
+    """
+    Fixed-memory latency histogram (HDR-style, log-linear buckets).
+
+    Values are recorded in nanoseconds. Each power of two is divided into
+    `2 ** (significant_bits - 1)` buckets, which bounds the relative error of
+    reported percentiles to `2 ** -(significant_bits - 1)`.
+    """
+
+    def __init__(self, significant_bits=6):
+        self._bits = significant_bits
+        self._sub_buckets = 1 << significant_bits
+        self._half = self._sub_buckets >> 1
+        self.counts = [0] * (
+            self._sub_buckets + (64 - significant_bits) * self._half)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        """
+        Record a value (nanoseconds).
+        """
+        if value < 0:
+            value = 0
+        if value < self._sub_buckets:
+            index = value
+        else:
+            shift = value.bit_length() - self._bits
+            index = self._sub_buckets + (shift - 1) * self._half + (
+                (value >> shift) - self._half)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _bucket_upper_bound(self, index):
+        if index < self._sub_buckets:
+            return index
+        shift = (index - self._sub_buckets) // self._half + 1
+        mantissa = (index - self._sub_buckets) % self._half + self._half
+        return ((mantissa + 1) << shift) - 1
+
+    def percentile(self, percent):
+        """
+        Return the value below which `percent` % of the recorded values fall.
+        """
+        if self.count == 0:
+            return 0
+        threshold = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self._bucket_upper_bound(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Add the values recorded by another histogram.
+        """
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """
+        Return count, mean, p50, p99 and max (nanoseconds).
+        """
+        return {
+            'count': self.count,
+            'mean': self.total // self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
@@ -0,0 +1,14 @@
+"""
+BtleJuice tests
+"""
+import shutil
+import tempfile
+
+
+def temporary_directory(test):
+    """
+    Return a temporary directory removed once `test` is done.
+    """
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    return directory
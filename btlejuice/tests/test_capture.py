@@ -0,0 +1,114 @@
+import gc
+import os
+import time
+import warnings
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp
+from btlejuice.capture import (
+    CaptureInterface, CaptureReader, CaptureWriter, READ, WRITE, NOTIFICATION,
+    SUBSCRIBE, CONNECT, DISCONNECT, WITHOUT_RESPONSE, ENABLED, write_offset,
+    CaptureFormatError, open_capture
+)
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.tests import temporary_directory
+
+
+class TestCapture(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temporary_directory(self), 'capture.bjc')
+
+    def read(self):
+        with CaptureReader(self.path) as reader:
+            return [
+                record._replace(data=bytes(record.data)) for record in reader]
+
+    def test_invalid(self):
+        'Files which are not captures are closed'
+        with open(self.path, 'wb') as capture:
+            capture.write(b'not a capture')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertRaises(CaptureFormatError, open_capture, self.path)
+            gc.collect()
+        self.assertEqual(
+            [w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_interface(self):
+        'Proxied operations and client connections are recorded'
+        transport = LoopbackTransport()
+        interface = CaptureInterface(
+            'localhost', 8080, 'aa:bb:cc:dd:ee:ff', self.path)
+        app = BtleJuiceApp(interface, transports=[transport])
+        try:
+            transport.feed_event('app.connect', '11:22:33:44:55:66')
+            transport.feed_event('proxy_read', 'fff0', 'fff1', 0)
+            transport.feed_event('ble_read_resp', 'fff0', 'fff1', b'\x01\x02')
+            transport.feed_event('proxy_write', 'fff0', 'fff4', b'\xff', 2, True)
+            transport.feed_event('proxy_notify', 'fff0', 'fff4', True)
+            transport.feed_event('data', 'fff0', 'fff4', b'\x03')
+            transport.feed_event('app.disconnect', '11:22:33:44:55:66')
+            transport.process()
+        finally:
+            app.client.disconnect()
+            interface.close()
+        records = self.read()
+        self.assertEqual(
+            [record.operation for record in records],
+            [CONNECT, READ, WRITE, SUBSCRIBE, NOTIFICATION, DISCONNECT])
+        self.assertEqual(records[0].data, b'11:22:33:44:55:66')
+        self.assertEqual(records[1][2:], ('fff0', 'fff1', 0, b'\x01\x02'))
+        self.assertEqual(write_offset(records[2]), (2, b'\xff'))
+        self.assertTrue(records[2].flags & WITHOUT_RESPONSE)
+        self.assertTrue(records[3].flags & ENABLED)
+        self.assertEqual(records[4].data, b'\x03')
+        timestamps = [record.timestamp for record in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_append(self):
+        'Reopened captures are appended to, truncated records are dropped'
+        with CaptureWriter(self.path) as writer:
+            writer.read('fff0', 'fff1', b'\x01', timestamp=1)
+            writer.read('fff0', 'fff2', b'\x02', timestamp=2)
+        with open(self.path, 'ab') as capture:
+            capture.write(b'\x00' * 5)
+        with CaptureWriter(self.path) as writer:
+            writer.notification('fff0', 'fff2', b'\x03', timestamp=3)
+            writer.notification('180f', '2a19', b'\x04', timestamp=4)
+        self.assertEqual(
+            [record[:4] + (record.data,) for record in self.read()], [
+                (1, READ, 'fff0', 'fff1', b'\x01'),
+                (2, READ, 'fff0', 'fff2', b'\x02'),
+                (3, NOTIFICATION, 'fff0', 'fff2', b'\x03'),
+                (4, NOTIFICATION, '180f', '2a19', b'\x04'),
+            ])
+
+    def test_buffering(self):
+        'Records are buffered until the buffer is full'
+        writer = CaptureWriter(self.path, buffer_size=64, flush_interval=60)
+        writer.read('fff0', 'fff1', b'\x00' * 8)
+        self.assertEqual(len(self.read()), 0)
+        writer.read('fff0', 'fff1', b'\x00' * 40)
+        self.assertEqual(len(self.read()), 2)
+        writer.close()
+
+    def test_flush_interval(self):
+        'Buffered records are written after the flush interval without new records'
+        writer = CaptureWriter(self.path, flush_interval=0.1)
+        try:
+            flusher = None
+            for count in range(1, 4):
+                writer.read('fff0', 'fff1', b'\x00')
+                self.assertEqual(len(self.read()), count - 1)
+                deadline = time.time() + 5
+                while len(self.read()) < count and time.time() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(len(self.read()), count)
+                # A single flusher thread is started
+                if flusher is None:
+                    flusher = writer._flusher
+                self.assertTrue(writer._flusher is flusher)
+        finally:
+            writer.close()
+        self.assertFalse(flusher.is_alive())
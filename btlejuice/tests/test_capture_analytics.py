@@ -0,0 +1,72 @@
+import os
+from unittest import TestCase
+
+from btlejuice.capture import (
+    CaptureWriter, open_capture, analyze_capture, capture_shards)
+from btlejuice.tests import temporary_directory
+
+
+class TestCaptureAnalytics(TestCase):
+
+    def write(self, name, **kw):
+        path = os.path.join(temporary_directory(self), name)
+        with CaptureWriter(path, **kw) as writer:
+            writer.connect('11:22:33:44:55:66', timestamp=0)
+            for i in range(2000):
+                writer.notification(
+                    'fff0', 'fff4', b'\x00' * 19 + bytes(bytearray([i % 50])),
+                    timestamp=1000 + i * 100)
+                if i % 10 == 0:
+                    writer.read('180f', '2a19', b'\x64', timestamp=1000 + i * 100)
+        return path
+
+    def check(self, path):
+        serial = analyze_capture(path, processes=1, shards=1)
+        parallel = analyze_capture(path, processes=2, shards=7)
+        self.assertEqual(set(serial), set(parallel))
+        for key in serial:
+            self.assertEqual(serial[key].summary(), parallel[key].summary())
+        notifications = parallel[('fff0', 'fff4')].summary()
+        self.assertEqual(notifications['count'], 2000)
+        self.assertEqual(notifications['bytes'], 40000)
+        self.assertEqual(notifications['unique'], 50)
+        self.assertEqual(notifications['operations'], {'notification': 2000})
+        self.assertEqual((notifications['first'], notifications['last']), (1000, 200900))
+        self.assertEqual(notifications['interval']['count'], 1999)
+        self.assertEqual(notifications['interval']['max'], 100)
+        self.assertEqual(parallel[('180f', '2a19')].summary()['count'], 200)
+        self.assertEqual(parallel[(None, None)].summary()['count'], 1)
+
+    def test_analytics(self):
+        'Shards analyzed in parallel give the same stats as a single pass'
+        path = self.write('capture.bjc')
+        with open_capture(path) as reader:
+            shards = capture_shards(reader, 7)
+        self.assertEqual(len(shards), 7)
+        self.check(path)
+
+    def test_unscanned(self):
+        'Uncompressed captures are split without scanning them on opening'
+        path = self.write('capture.bjc')
+        with open_capture(path) as reader:
+            characteristics = reader.characteristics
+            shards = capture_shards(reader, 7)
+        with open(path, 'ab') as capture:
+            capture.write(b'\x00' * 7)
+        with open_capture(path, {}, os.path.getsize(path)) as reader:
+            self.assertEqual(capture_shards(reader, 7), shards)
+            self.assertEqual(reader.characteristics, characteristics)
+        self.check(path)
+
+    def test_delta(self):
+        'Delta encoded captures are split anywhere'
+        self.check(self.write('delta.bjc', delta=True))
+
+    def test_compressed(self):
+        'Compressed captures are split at chunk boundaries'
+        path = self.write('capture.bjcz', compression='zlib', chunk_size=4096)
+        with open_capture(path) as reader:
+            offsets = [chunk[2] for chunk in reader.chunks]
+            shards = capture_shards(reader, 7)
+        self.assertTrue(all(start in offsets for start, stop in shards))
+        self.check(path)
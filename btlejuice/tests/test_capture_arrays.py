@@ -0,0 +1,75 @@
+import os
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from btlejuice.capture import (
+    CaptureIndex, CaptureWriter, READ, WRITE, NOTIFICATION, CONNECT, capture_arrays,
+    iter_capture_arrays)
+from btlejuice.tests import temporary_directory
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestCaptureArrays(TestCase):
+
+    def setUp(self):
+        self.directory = temporary_directory(self)
+
+    def write(self, name, **kw):
+        path = os.path.join(self.directory, name)
+        with CaptureWriter(path, **kw) as writer:
+            writer.connect('11:22:33:44:55:66', timestamp=1)
+            for i in range(100):
+                writer.notification(
+                    'fff0', 'fff4', b'\x00' * 18 + bytes(bytearray([i, i])),
+                    timestamp=10 + i)
+                writer.read('180f', '2a19', bytes(bytearray([i])), timestamp=10 + i)
+            writer.write('fff0', 'fff1', b'\x01\x02', timestamp=200)
+        return path
+
+    def check(self, arrays):
+        records = arrays.records
+        self.assertEqual(len(arrays), 202)
+        self.assertEqual(list(records['timestamp'][:3]), [1, 10, 10])
+        self.assertEqual(
+            list(records['operation'][:4]), [CONNECT, NOTIFICATION, READ, NOTIFICATION])
+        self.assertEqual(arrays.value(0), b'11:22:33:44:55:66')
+        self.assertEqual(arrays.value(199), b'\x00' * 18 + b'\x63\x63')
+        self.assertEqual(arrays.value(201), b'\x01\x02')
+        self.assertEqual(records['operation'][201], WRITE)
+        notifications = records['characteristic'] == arrays.characteristic_id('fff0', 'fff4')
+        self.assertEqual(int(notifications.sum()), 100)
+        self.assertTrue((numpy.diff(records['timestamp'][notifications]) == 1).all())
+        self.assertEqual(int(records['length'].sum()), len(arrays.payloads))
+
+    def test_arrays(self):
+        'Records and payloads are exported as arrays, without indexing the capture'
+        path = self.write('capture.bjc')
+        self.check(capture_arrays(path, batch_size=16))
+        self.assertFalse(os.path.exists(path + '.idx'))
+
+    def test_index(self):
+        'Record positions are read from an up to date index'
+        path = self.write('capture.bjc')
+        CaptureIndex(path).close()
+        self.check(capture_arrays(path, batch_size=16))
+        # Outdated index
+        with CaptureWriter(path) as writer:
+            writer.read('180f', '2a19', b'\x01', timestamp=300)
+        arrays = capture_arrays(path)
+        self.assertEqual(len(arrays), 203)
+        self.assertEqual(arrays.value(202), b'\x01')
+
+    def test_delta(self):
+        'Delta encoded values are decoded'
+        self.check(capture_arrays(self.write('delta.bjc', delta=True)))
+
+    def test_compressed(self):
+        'Compressed captures are exported chunk by chunk'
+        path = self.write('capture.bjcz', compression='zlib', chunk_size=512)
+        batches = list(iter_capture_arrays(path))
+        self.assertGreater(len(batches), 1)
+        self.check(capture_arrays(path))
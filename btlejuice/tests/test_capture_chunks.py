@@ -0,0 +1,103 @@
+import gc
+import os
+import struct
+import warnings
+from unittest import TestCase
+
+from btlejuice.capture import (
+    CaptureFormatError, CaptureIndex, CaptureWriter, ChunkedCaptureReader,
+    NOTIFICATION, available_codecs, compress_capture, open_capture)
+from btlejuice.tests import temporary_directory
+
+
+class TestChunks(TestCase):
+
+    def setUp(self):
+        directory = temporary_directory(self)
+        self.plain = os.path.join(directory, 'capture.bjc')
+        self.path = os.path.join(directory, 'capture.bjcz')
+        self.values = [
+            struct.pack('<IH', i, i // 100) + b'\x00' * 14 for i in range(5000)]
+
+    def write(self, path, **kw):
+        with CaptureWriter(path, **kw) as writer:
+            for i, value in enumerate(self.values):
+                writer.notification('fff0', 'fff%d' % (i % 4), value, timestamp=i)
+
+    def read(self, reader, start=None):
+        return [
+            (record.timestamp, record.characteristic, bytes(record.data))
+            for record in reader.records(start)]
+
+    def test_truncated_header(self):
+        'Captures with a truncated header are closed'
+        self.write(self.path, compression='zlib')
+        with open(self.path, 'rb') as capture:
+            header = capture.read(6)
+        with open(self.path, 'wb') as capture:
+            capture.write(header)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertRaises(CaptureFormatError, open_capture, self.path)
+            gc.collect()
+        self.assertEqual(
+            [w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_roundtrip(self):
+        'Compressed captures are read like uncompressed ones'
+        self.assertIn('zlib', available_codecs())
+        self.write(self.plain)
+        self.write(self.path, compression='zlib', chunk_size=4096, delta=True)
+        self.assertLess(os.path.getsize(self.path) * 5, os.path.getsize(self.plain))
+        with open_capture(self.plain) as plain:
+            expected = self.read(plain)
+        with open_capture(self.path) as reader:
+            self.assertTrue(isinstance(reader, ChunkedCaptureReader))
+            self.assertGreater(len(reader.chunks), 10)
+            self.assertEqual(self.read(reader), expected)
+
+    def test_seek(self):
+        'Readers seek to the chunk holding a timestamp'
+        self.write(self.path, compression='zlib', chunk_size=4096, delta=True)
+        with open_capture(self.path) as reader:
+            decompressed = []
+            decompress = reader._decompress
+            reader._decompress = lambda data: decompressed.append(data) or decompress(data)
+            start = reader.seek(3000)
+            records = self.read(reader, start)
+            self.assertLessEqual(records[0][0], 3000)
+            self.assertGreater(records[0][0], 3000 - 500)
+            self.assertEqual(records[-1][0], 4999)
+            self.assertLess(len(decompressed), len(reader.chunks) // 2)
+
+    def test_index(self):
+        'Compressed captures are indexed and appended to'
+        self.write(self.path, compression='zlib', chunk_size=4096, delta=True)
+        with CaptureWriter(self.path) as writer:
+            self.assertEqual(writer.compression, 'zlib')
+            writer.notification('fff0', 'fff9', b'\x01', timestamp=10000)
+        with CaptureIndex(self.path) as index:
+            records = list(index.query('fff1', NOTIFICATION, 2000, 2010))
+            self.assertEqual(
+                [bytes(record.data) for record in records],
+                [self.values[i] for i in (2001, 2005, 2009)])
+            self.assertEqual(len(list(index.query('fff9'))), 1)
+
+    def test_recovery(self):
+        'Chunks of captures that were not closed are read'
+        self.write(self.path, compression='zlib', chunk_size=4096)
+        with open(self.path, 'r+b') as capture:
+            capture.truncate(os.path.getsize(self.path) - 10)
+        with open_capture(self.path) as reader:
+            records = self.read(reader)
+        self.assertGreater(len(records), 4000)
+        self.assertEqual(
+            [value for timestamp, characteristic, value in records],
+            self.values[:len(records)])
+
+    def test_compress(self):
+        'Uncompressed captures are converted'
+        self.write(self.plain)
+        self.assertEqual(compress_capture(self.plain, self.path), len(self.values))
+        with open_capture(self.path) as reader:
+            self.assertEqual(len(self.read(reader)), len(self.values))
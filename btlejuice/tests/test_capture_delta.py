@@ -0,0 +1,85 @@
+import os
+import random
+import struct
+from unittest import TestCase
+
+from btlejuice.capture import (
+    CaptureIndex, CaptureReader, CaptureWriter, NOTIFICATION)
+from btlejuice.capture.format import DELTA
+from btlejuice.capture.delta import apply_patch, delta_distance, encode_delta
+from btlejuice.tests import temporary_directory
+
+
+def telemetry(count):
+    # Sensor readings: a counter, a slowly changing value, constant fields
+    for i in range(count):
+        yield (
+            'fff0', 'fff4' if i % 3 else 'fff5',
+            struct.pack('<IHH', i, 1000 + i // 50, 0x1234) + b'\x00' * 12)
+
+
+class TestDelta(TestCase):
+
+    def setUp(self):
+        self.directory = temporary_directory(self)
+
+    def write(self, name, delta, values, **kw):
+        path = os.path.join(self.directory, name)
+        with CaptureWriter(path, delta=delta, **kw) as writer:
+            for i, (service, characteristic, value) in enumerate(values):
+                writer.notification(service, characteristic, value, timestamp=i)
+        return path
+
+    def test_patch(self):
+        'Patches rebuild values of any length'
+        random.seed(0)
+        for i in range(200):
+            previous = bytearray(random.getrandbits(8) for i in range(random.randint(0, 30)))
+            value = bytearray(previous[:random.randint(0, 30)])
+            value.extend(random.getrandbits(8) for i in range(random.randint(0, 5)))
+            for j in range(random.randint(0, 3)):
+                if value:
+                    value[random.randrange(len(value))] = random.getrandbits(8)
+            delta = encode_delta(42, previous, value)
+            distance, patch = delta_distance(delta)
+            self.assertEqual(distance, 42)
+            self.assertEqual(apply_patch(previous, delta, patch), bytes(value))
+
+    def test_transparent(self):
+        'Delta encoded captures read like plain ones, and are smaller'
+        values = list(telemetry(1000))
+        plain = self.write('plain.bjc', False, values)
+        encoded = self.write('delta.bjc', True, values)
+        self.assertLess(os.path.getsize(encoded), os.path.getsize(plain) * 0.6)
+        with CaptureReader(encoded) as reader:
+            records = list(reader)
+            self.assertEqual(
+                [(record.characteristic, bytes(record.data)) for record in records],
+                [(characteristic, value) for service, characteristic, value in values])
+            self.assertFalse(any(record.flags & DELTA for record in records))
+            # Starting in the middle of a delta chain
+            last = list(reader.headers())[-1][0]
+            self.assertEqual(
+                bytes(next(reader.records(start=last)).data), values[-1][2])
+
+    def test_random_access(self):
+        'Records are decoded from their keyframe'
+        values = list(telemetry(300))
+        path = self.write('delta.bjc', True, values, keyframe_interval=8)
+        with CaptureIndex(path) as index:
+            records = list(index.query('fff4', NOTIFICATION, 100, 120))
+            self.assertEqual(
+                [bytes(record.data) for record in records],
+                [values[i][2] for i in range(100, 120) if i % 3])
+
+    def test_append(self):
+        'Appending with delta encoding to a plain capture'
+        values = list(telemetry(100))
+        path = self.write('capture.bjc', False, values[:50])
+        with CaptureWriter(path, delta=True) as writer:
+            for i, (service, characteristic, value) in enumerate(values[50:]):
+                writer.notification(service, characteristic, value, timestamp=i)
+        with CaptureReader(path) as reader:
+            self.assertEqual(
+                [bytes(record.data) for record in reader],
+                [value for service, characteristic, value in values])
@@ -0,0 +1,69 @@
+import os
+from unittest import TestCase
+
+from btlejuice.capture import (
+    CaptureIndex, CaptureWriter, READ, NOTIFICATION, CONNECT)
+from btlejuice.tests import temporary_directory
+
+
+class TestCaptureIndex(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temporary_directory(self), 'capture.bjc')
+        with CaptureWriter(self.path) as writer:
+            writer.connect('11:22:33:44:55:66', timestamp=0)
+            for i in range(1, 100):
+                writer.notification('fff0', 'fff4', bytes(bytearray([i])), timestamp=i * 10)
+                writer.read('fff0', 'fff1', b'\x00', timestamp=i * 10 + 5)
+                writer.notification('180f', '2a19', b'\x64', timestamp=i * 10 + 5)
+
+    def query(self, index, *args, **kw):
+        return [
+            (record.timestamp, record.operation, record.characteristic)
+            for record in index.query(*args, **kw)]
+
+    def test_query(self):
+        'Records are selected by characteristic, operation and time range'
+        with CaptureIndex(self.path) as index:
+            records = list(index.query('fff4', NOTIFICATION, 200, 250))
+            self.assertEqual(
+                [(record.timestamp, bytes(record.data)) for record in records],
+                [(200, b'\x14'), (210, b'\x15'), (220, b'\x16'), (230, b'\x17'),
+                 (240, b'\x18')])
+            self.assertEqual(self.query(index, start=990), [
+                (990, NOTIFICATION, 'fff4'), (995, READ, 'fff1'),
+                (995, NOTIFICATION, '2a19')])
+            self.assertEqual(self.query(index, operation=CONNECT), [
+                (0, CONNECT, None)])
+            self.assertEqual(len(self.query(index, service='fff0')), 198)
+            self.assertEqual(self.query(index, 'fff4', READ), [])
+
+    def test_update(self):
+        'Appended records are indexed in a new segment'
+        CaptureIndex(self.path).close()
+        with CaptureWriter(self.path, index=True) as writer:
+            writer.notification('fff0', 'fff4', b'\xff', timestamp=2000)
+            writer.notification('fff0', 'fff5', b'\xfe', timestamp=2001)
+        with CaptureIndex(self.path, update=False) as index:
+            self.assertEqual(len(index._segments), 2)
+            self.assertEqual(index.update(), 0)
+            self.assertEqual(self.query(index, start=1000), [
+                (2000, NOTIFICATION, 'fff4'), (2001, NOTIFICATION, 'fff5')])
+            self.assertEqual(len(self.query(index, 'fff4')), 100)
+
+    def test_rebuild(self):
+        'The index is rebuilt when the capture was truncated or replaced'
+        CaptureIndex(self.path).close()
+        os.remove(self.path)
+        with CaptureWriter(self.path) as writer:
+            writer.read('fff0', 'fff1', b'\x01', timestamp=1)
+        with CaptureIndex(self.path) as index:
+            self.assertEqual(self.query(index), [(1, READ, 'fff1')])
+        # Replaced with a larger capture
+        os.remove(self.path)
+        with CaptureWriter(self.path) as writer:
+            for i in range(100):
+                writer.notification('fff0', 'fff4', b'\x02', timestamp=i)
+        with CaptureIndex(self.path) as index:
+            self.assertEqual(len(self.query(index, 'fff4')), 100)
+            self.assertEqual(self.query(index, 'fff1'), [])
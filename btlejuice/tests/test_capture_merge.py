@@ -0,0 +1,46 @@
+import os
+from unittest import TestCase
+
+from btlejuice.capture import (
+    CaptureReader, CaptureWriter, merge_captures, write_merged)
+from btlejuice.tests import temporary_directory
+
+
+class TestCaptureMerge(TestCase):
+
+    def setUp(self):
+        self.directory = temporary_directory(self)
+        self.paths = []
+        for name, timestamps in (('a', (1, 4, 5, 9)), ('b', (2, 3, 5)), ('c', ())):
+            path = os.path.join(self.directory, name + '.bjc')
+            with CaptureWriter(path) as writer:
+                for timestamp in timestamps:
+                    writer.notification(
+                        'fff0', 'fff4', name.encode('ascii'), timestamp=timestamp)
+            self.paths.append(path)
+
+    def test_merge(self):
+        'Records are merged in timestamp order and tagged with their source'
+        merged = [
+            (source, record.timestamp, bytes(record.data))
+            for source, record in merge_captures(self.paths)]
+        self.assertEqual(merged, [
+            ('a', 1, b'a'), ('b', 2, b'b'), ('b', 3, b'b'), ('a', 4, b'a'),
+            ('a', 5, b'a'), ('b', 5, b'b'), ('a', 9, b'a')])
+
+    def test_offsets(self):
+        'Clock offsets are applied to the timestamps of each capture'
+        merged = [
+            (source, record.timestamp) for source, record in
+            merge_captures(self.paths[:2], offsets=[0, 10], sources=['x', 'y'])]
+        self.assertEqual(merged, [
+            ('x', 1), ('x', 4), ('x', 5), ('x', 9), ('y', 12), ('y', 13),
+            ('y', 15)])
+
+    def test_write(self):
+        'Merged records are written to a capture, tagged services on request'
+        output = os.path.join(self.directory, 'merged.bjc')
+        self.assertEqual(write_merged(self.paths, output, tag=True), 7)
+        with CaptureReader(output) as reader:
+            records = [(record.timestamp, record.service) for record in reader]
+        self.assertEqual(records[:3], [(1, 'a/fff0'), (2, 'b/fff0'), (3, 'b/fff0')])
@@ -0,0 +1,96 @@
+import os
+import time
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp
+from btlejuice.capture import CaptureWriter, EmulatorInterface
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.tests import temporary_directory
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+SECOND = 1000000000
+
+
+class TestEmulator(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temporary_directory(self), 'capture.bjc')
+        with CaptureWriter(self.path) as writer:
+            writer.read('180f', '2a19', b'\x64', timestamp=1 * SECOND)
+            writer.read('180f', '2a19', b'\x63', timestamp=2 * SECOND)
+            writer.read('fff0', 'fff1', b'0123456789', timestamp=3 * SECOND)
+            writer.subscribe('fff0', 'fff4', True, timestamp=4 * SECOND)
+            writer.notification('fff0', 'fff4', b'\x01', timestamp=4 * SECOND + 50000000)
+            writer.notification('fff0', 'fff4', b'\x02', timestamp=4 * SECOND + 150000000)
+        self.transport = LoopbackTransport()
+        self.transport.process()
+        self.transport.clear()
+
+    def start(self, **kw):
+        self.interface = EmulatorInterface(
+            'localhost', 8080, TARGET, self.path, **kw)
+        self.app = BtleJuiceApp(self.interface, transports=[self.transport])
+        self.transport.process()
+        self.transport.clear()
+
+    def tearDown(self):
+        self.interface.disconnect()
+        self.app.client.disconnect()
+
+    def request(self, event, *args):
+        self.transport.feed_event(event, *args)
+        self.transport.process()
+        emitted = self.transport.emitted()
+        self.transport.clear()
+        return emitted
+
+    def test_sequence(self):
+        'The nth read returns the nth recorded value, then the last one'
+        self.start()
+        responses = [
+            self.request('proxy_read', '180f', '2a19', 0) for i in range(3)]
+        self.assertEqual(responses, [
+            [('proxy_read_resp', '180f', '2a19', b'\x64')],
+            [('proxy_read_resp', '180f', '2a19', b'\x63')],
+            [('proxy_read_resp', '180f', '2a19', b'\x63')],
+        ])
+        # Long reads continue the value being served
+        self.request('proxy_read', 'fff0', 'fff1', 0)
+        self.assertEqual(
+            self.request('proxy_read', 'fff0', 'fff1', 4),
+            [('proxy_read_resp', 'fff0', 'fff1', b'456789')])
+
+    def test_last_value(self):
+        'Without sequence, reads return the last recorded value'
+        self.start(sequence=False)
+        self.assertEqual(
+            self.request('proxy_read', '180f', '2a19', 0),
+            [('proxy_read_resp', '180f', '2a19', b'\x63')])
+
+    def test_writes(self):
+        'Writes are answered locally and served by reads without recorded values'
+        self.start()
+        self.assertEqual(
+            self.request('proxy_write', 'fff0', 'fff2', b'\x05\x06', 0, False),
+            [('proxy_write_resp', 'fff0', 'fff2', False)])
+        self.assertEqual(
+            self.request('proxy_read', 'fff0', 'fff2', 0),
+            [('proxy_read_resp', 'fff0', 'fff2', b'\x05\x06')])
+
+    def test_notifications(self):
+        'Recorded notifications follow subscriptions on their recorded schedule'
+        self.start()
+        started = time.time()
+        self.assertEqual(
+            self.request('proxy_notify', 'fff0', 'fff4', True),
+            [('proxy_notify_resp', 'fff0', 'fff4')])
+        deadline = time.time() + 5
+        while len(self.transport.emitted()) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        elapsed = time.time() - started
+        self.assertEqual(self.transport.emitted(), [
+            ('proxy_data', 'fff0', 'fff4', b'\x01'),
+            ('proxy_data', 'fff0', 'fff4', b'\x02'),
+        ])
+        self.assertGreaterEqual(elapsed, 0.14)
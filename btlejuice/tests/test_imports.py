@@ -0,0 +1,51 @@
+"""
+Package startup guards.
+
+Importing `btlejuice` must not pull the transport dependencies, and must stay
+within an import-time budget (in milliseconds, override it with the
+BTLEJUICE_IMPORT_BUDGET_MS environment variable).
+"""
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAZY_MODULES = ('requests', 'websocket', 'six', 'ssl')
+IMPORT_BUDGET_MS = float(os.environ.get('BTLEJUICE_IMPORT_BUDGET_MS', 150))
+SCRIPT = '''
+import json, sys, time
+started_at = time.time()
+import btlejuice
+elapsed = (time.time() - started_at) * 1000
+print(json.dumps({
+    'elapsed': elapsed,
+    'loaded': [m for m in %r if m in sys.modules],
+}))
+''' % (LAZY_MODULES,)
+
+
+def measure_import():
+    """
+    Import `btlejuice` in a fresh interpreter and return the import time (ms)
+    and the lazy modules that got loaded.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT], cwd=ROOT)
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return result['elapsed'], result['loaded']
+
+
+class TestImports(TestCase):
+
+    def test_transport_dependencies_are_lazy(self):
+        'Importing btlejuice does not import transport dependencies'
+        elapsed, loaded = measure_import()
+        self.assertEqual(loaded, [])
+
+    def test_import_time_budget(self):
+        'Importing btlejuice stays within the import-time budget'
+        samples = sorted(measure_import()[0] for i in range(5))
+        self.assertLess(samples[len(samples) // 2], IMPORT_BUDGET_MS)
@@ -0,0 +1,43 @@
+import json
+import logging
+from io import StringIO
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.socketIO_client.logs import (
+    LOG, enable_packet_log, disable_packet_log)
+
+
+class TestPacketLog(TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.app = BtleJuiceApp(
+            HookingInterface('localhost', 8080, 'aa:bb:cc:dd:ee:ff'),
+            transports=[self.transport])
+
+    def tearDown(self):
+        self.app.client.disconnect()
+
+    def test_packet_log(self):
+        'Packets are logged as JSON lines without debug messages'
+        stream, messages = StringIO(), StringIO()
+        handler = logging.StreamHandler(messages)
+        LOG.addHandler(handler)
+        packets = enable_packet_log(stream=stream)
+        try:
+            self.transport.feed_event('data', 'fff0', 'fff4', b'\xff\x00')
+            self.transport.process()
+        finally:
+            disable_packet_log(packets)
+            LOG.removeHandler(handler)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        received = [r for r in records if r['direction'] == 'received']
+        sent = [r for r in records if r['direction'] == 'sent']
+        self.assertEqual(received[-1]['data'], '04ff00')
+        self.assertTrue(received[-1]['binary'])
+        self.assertTrue(sent[0]['data'].startswith('2["stop"'))
+        self.assertEqual(messages.getvalue(), '')
+        self.transport.process()
+        self.assertFalse(self.app.client._packet_log_enabled)
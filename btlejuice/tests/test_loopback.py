@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+from btlejuice import (
+    BtleJuiceApp, HookingInterface, HookForceResponse, HookModify)
+from btlejuice.socketIO_client import LoopbackTransport
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+
+
+class Hooks(HookingInterface):
+
+    def __init__(self, host, port, target):
+        HookingInterface.__init__(self, host, port, target)
+        self.ready = False
+
+    def proxy_ready(self):
+        self.ready = True
+
+    def on_before_read(self, service, characteristic, offset):
+        if characteristic == '2a19':
+            raise HookForceResponse(b'\x64')
+
+    def on_before_notification(self, service, characteristic, data):
+        raise HookModify(data[::-1])
+
+
+class TestLoopbackTransport(TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.interface = Hooks('localhost', 8080, TARGET)
+        self.app = BtleJuiceApp(self.interface, transports=[self.transport])
+
+    def tearDown(self):
+        self.app.client.disconnect()
+
+    def test_connect(self):
+        'The interface scans for its target and selects it'
+        transport = self.transport
+        transport.process()
+        self.assertEqual(transport.emitted(), [('stop',), ('scan_devices',)])
+        transport.clear()
+        transport.feed_event('peripheral', '11:22:33:44:55:66', 'other', -70)
+        transport.feed_event('peripheral', TARGET, 'target', -60)
+        transport.process()
+        self.assertEqual(transport.emitted(), [('target', TARGET)])
+        transport.feed_event('ready')
+        transport.process()
+        self.assertTrue(self.interface.ready)
+
+    def test_select_retry(self):
+        'The target is selected on each advertisement until the proxy is ready'
+        transport = self.transport
+        transport.process()
+        transport.clear()
+        transport.feed_event('peripheral', TARGET, 'target', -60)
+        transport.feed_event('peripheral', TARGET, 'target', -60)
+        transport.process()
+        self.assertEqual(transport.emitted(), [('target', TARGET)] * 2)
+        transport.clear()
+        transport.feed_event('ready')
+        transport.feed_event('peripheral', TARGET, 'target', -60)
+        transport.process()
+        self.assertEqual(transport.emitted(), [])
+
+    def test_hooks(self):
+        'Core events go through the hooks and responses are sent back'
+        transport = self.transport
+        transport.process()
+        transport.clear()
+        transport.feed_event('proxy_read', '180f', '2a19', 0)
+        transport.feed_event('proxy_read', 'fff0', 'fff1', 0)
+        transport.feed_event('data', 'fff0', 'fff4', b'\x01\x02\x03')
+        transport.process()
+        self.assertEqual(transport.emitted(), [
+            ('proxy_read_resp', '180f', '2a19', b'\x64'),
+            ('ble_read', 'fff0', 'fff1'),
+            ('proxy_data', 'fff0', 'fff4', b'\x03\x02\x01'),
+        ])
+
+    def test_many_events(self):
+        'Events are processed without any server'
+        transport = self.transport
+        transport.process()
+        transport.clear()
+        for i in range(1000):
+            transport.feed_event('proxy_read', '180f', '2a19', 0)
+        transport.process()
+        self.assertEqual(len(transport.emitted()), 1000)
@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface, HookForceResponse
+from btlejuice.memory import assert_allocations
+from btlejuice.socketIO_client import LoopbackTransport
+
+
+# Objects kept alive by each write to the leaking characteristic
+LEAKED_BLOCKS = 64
+
+
+class Hooks(HookingInterface):
+
+    def __init__(self, host, port, target):
+        HookingInterface.__init__(self, host, port, target)
+        self.kept = []
+
+    def on_before_read(self, service, characteristic, offset):
+        if characteristic == '2a19':
+            raise HookForceResponse(b'\x64')
+
+    def on_before_write(self, service, characteristic, data, offset, withoutResponse):
+        if characteristic == 'fff2':
+            self.kept.extend(object() for i in range(LEAKED_BLOCKS))
+
+
+class TestAllocations(TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.app = BtleJuiceApp(
+            Hooks('localhost', 8080, 'aa:bb:cc:dd:ee:ff'),
+            transports=[self.transport])
+
+    def tearDown(self):
+        self.app.client.disconnect()
+
+    def test_budget(self):
+        'Forwarded events stay within their allocation budget'
+        summary = assert_allocations(
+            self.app, self.transport, 16, 'proxy_read', 'fff0', 'fff1', 0,
+            count=200)
+        self.assertEqual(summary['events'], 200)
+        self.assertRaises(
+            AssertionError, assert_allocations, self.app, self.transport, -1,
+            'data', 'fff0', 'fff4', b'\x01\x02', count=200)
+
+    def test_write_budget(self):
+        'Blocks left allocated by each event are counted against the budget'
+        summary = assert_allocations(
+            self.app, self.transport, 16, 'proxy_write', 'fff0', 'fff1',
+            b'\x01\x02', 0, False, count=200)
+        self.assertEqual(summary['events'], 200)
+        summary = assert_allocations(
+            self.app, self.transport, LEAKED_BLOCKS + 16, 'proxy_write',
+            'fff0', 'fff2', b'\x01\x02', 0, False, count=200)
+        self.assertTrue(summary['blocks_per_event'] >= LEAKED_BLOCKS)
+        self.assertRaises(
+            AssertionError, assert_allocations, self.app, self.transport,
+            LEAKED_BLOCKS - 1, 'proxy_write', 'fff0', 'fff2', b'\x01\x02', 0,
+            False, count=200)
+
+    def test_stages(self):
+        'Allocations are attributed to event types and pipeline stages'
+        tracker = self.app.enable_allocation_tracking()
+        self.transport.feed_event('data', 'fff0', 'fff4', b'\x01\x02')
+        self.transport.feed_event('proxy_read', '180f', '2a19', 0)
+        self.transport.process()
+        stats = self.app.allocation_stats()
+        self.assertEqual(stats['data']['packets'], 2)
+        self.assertEqual(stats['proxy_read']['events'], 1)
+        self.assertTrue('transport' in tracker.stages())
+        self.app.disable_allocation_tracking()
+        self.assertEqual(self.app.allocation_stats(), {})
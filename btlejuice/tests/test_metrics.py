@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface, HookForceResponse
+from btlejuice.socketIO_client import LoopbackTransport
+
+
+class Hooks(HookingInterface):
+
+    def on_before_read(self, service, characteristic, offset):
+        if characteristic == 'fff1':
+            raise ValueError('broken hook')
+        raise HookForceResponse(b'\x64')
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.app = BtleJuiceApp(
+            Hooks('localhost', 8080, 'aa:bb:cc:dd:ee:ff'),
+            transports=[self.transport])
+
+    def tearDown(self):
+        self.app.stop_metrics_server()
+        self.app.client.disconnect()
+
+    def test_counters(self):
+        'Packets, bytes and hook errors are counted per event type and hook'
+        metrics = self.app.enable_metrics()
+        transport = self.transport
+        transport.process()
+        transport.feed_event('data', 'fff0', 'fff4', b'\x01\x02')
+        transport.feed_event('proxy_read', '180f', '2a19', 0)
+        transport.process()
+        transport.feed_event('proxy_read', 'fff0', 'fff1', 0)
+        self.assertRaises(ValueError, transport.process)
+        self.assertEqual(metrics.connections['connect'], 1)
+        self.assertEqual(metrics.packets_received['data'], 2)
+        self.assertEqual(metrics.packets_received['proxy_read'], 2)
+        self.assertEqual(metrics.packets_sent['proxy_data'], 2)
+        self.assertEqual(metrics.bytes_sent['proxy_data'] > 2, True)
+        self.assertEqual(metrics.hook_calls['on_before_read'], 2)
+        self.assertEqual(metrics.hook_errors, {'on_before_read': 1})
+
+    def test_hook_outcome(self):
+        'Hook errors are the exceptions raised by the hooks themselves'
+        metrics = self.app.enable_metrics()
+        try:
+            raise ValueError('handled elsewhere')
+        except ValueError:
+            self.app.interface.on_after_read('fff0', 'fff1', b'\x01')
+        self.assertEqual(metrics.hook_calls['on_after_read'], 1)
+        self.assertEqual(metrics.hook_errors, {})
+
+    def test_reconnects(self):
+        'Repeated socket.io connections are counted as reconnections'
+        metrics = self.app.enable_metrics()
+        transport = self.transport
+        transport.process()
+        transport.feed_packet(4, '0')
+        transport.process()
+        self.assertEqual(metrics.connections, {'connect': 1, 'reconnect': 1})
+        self.assertTrue('btlejuice_reconnects_total 1' in metrics.render())
+
+    def test_endpoint(self):
+        'Metrics are served in the Prometheus text format'
+        from requests import get
+        server = self.app.start_metrics_server(port=0)
+        self.transport.process()
+        self.transport.feed_event('proxy_read', '180f', '2a19', 0)
+        response = get('http://127.0.0.1:%d/metrics' % server.port)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            'btlejuice_dispatch_backlog_bytes ' in response.text)
+        self.transport.process()
+        text = get('http://127.0.0.1:%d/metrics' % server.port).text
+        self.assertTrue(
+            'btlejuice_packets_received_total{event="proxy_read"} 1' in text)
+        self.assertTrue(
+            'btlejuice_packets_sent_total{event="proxy_read_resp"} 2' in text)
+        self.assertEqual(
+            get('http://127.0.0.1:%d/other' % server.port).status_code, 404)
@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import socket
+import threading
+import time
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, SniffingInterface
+from btlejuice.mockcore import MockCore
+from btlejuice.socketIO_client import SocketIO
+from btlejuice.socketIO_client.exceptions import TimeoutError
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+
+
+class Sniffer(SniffingInterface):
+
+    def __init__(self, host, port, target):
+        SniffingInterface.__init__(self, host, port, target)
+        self.ready = False
+        self.notifications = []
+
+    def proxy_ready(self):
+        self.ready = True
+
+    def on_notification_data(self, service, characteristic, data):
+        self.notifications.append((service, characteristic, data))
+
+
+class MockCoreMixin(object):
+
+    transports = None
+
+    def setUp(self):
+        self.core = MockCore(port=0)
+        self.core.start()
+        self.interface = Sniffer('127.0.0.1', self.core.port, TARGET)
+        self.app = BtleJuiceApp(self.interface, transports=self.transports)
+        self.app.daemon = True
+        self.app.start()
+
+    def tearDown(self):
+        self.app.cancel()
+        self.app.join()
+        self.app.client.disconnect()
+        self.core.stop()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_proxy_setup(self):
+        'Target is found and selected'
+        self.assertTrue(self.wait_for(lambda: self.interface.ready))
+        self.assertEqual(self.core.target, TARGET)
+
+
+class Test_WebsocketTransport(MockCoreMixin, TestCase):
+
+    transports = ['websocket']
+
+    def test_notifications(self):
+        'Binary notifications are forwarded back to the core'
+        self.assertTrue(self.wait_for(lambda: self.interface.ready))
+        self.core.start_load({'data': 0}, count=100)
+        self.assertTrue(self.wait_for(
+            lambda: self.core.stats()['received'].get('proxy_data') == 100))
+        self.assertEqual(len(self.interface.notifications), 100)
+
+
+class Test_XHR_PollingTransport(MockCoreMixin, TestCase):
+
+    transports = ['xhr-polling']
+
+
+class SilentCore(threading.Thread):
+    """
+    Accepts a websocket connection and never opens the engine.io session.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.closed = threading.Event()
+
+    def run(self):
+        connection, address = self.server.accept()
+        request = b''
+        while b'\r\n\r\n' not in request:
+            request += connection.recv(4096)
+        for line in request.decode('latin-1').split('\r\n'):
+            if line.lower().startswith('sec-websocket-key:'):
+                key = line.split(':', 1)[1].strip()
+        accept = base64.b64encode(hashlib.sha1(
+            (key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode('ascii')
+        ).digest()).decode('ascii')
+        connection.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: %s\r\n\r\n' % accept).encode('ascii'))
+        while connection.recv(4096):
+            pass
+        connection.close()
+        self.server.close()
+        self.closed.set()
+
+
+class TestWebsocketTimeout(TestCase):
+
+    def test_timeout(self):
+        'A core never opening the session times out and is disconnected'
+        core = SilentCore()
+        core.start()
+        started = time.time()
+        self.assertRaises(
+            TimeoutError, SocketIO, '127.0.0.1', core.port,
+            transports=['websocket'], wait_for_connection=False, timeout=0.2)
+        self.assertTrue(time.time() - started < 5)
+        self.assertTrue(core.closed.wait(5))
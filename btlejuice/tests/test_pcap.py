@@ -0,0 +1,84 @@
+import os
+import struct
+from unittest import TestCase
+
+from btlejuice.capture import CaptureWriter, PcapWriter, export_pcap
+from btlejuice.tests import temporary_directory
+
+
+def read_pcapng(path):
+    # Return (timestamp, direction, packet, comment) of enhanced packet blocks
+    with open(path, 'rb') as pcapng:
+        data = pcapng.read()
+    packets = []
+    position = 0
+    while position < len(data):
+        type, length = struct.unpack_from('<II', data, position)
+        if type == 6:
+            interface, high, low, captured, original = struct.unpack_from(
+                '<IIIII', data, position + 8)
+            start = position + 28
+            packet = data[start:start + captured]
+            option = start + captured + (-captured % 4)
+            code, size = struct.unpack_from('<HH', data, option)
+            comment = data[option + 4:option + 4 + size].decode('utf-8')
+            direction = struct.unpack('>I', packet[:4])[0]
+            packets.append(((high << 32) | low, direction, packet[4:], comment))
+        position += length
+    return packets
+
+
+class TestPcap(TestCase):
+
+    def setUp(self):
+        directory = temporary_directory(self)
+        self.capture = os.path.join(directory, 'capture.bjc')
+        self.pcap = os.path.join(directory, 'capture.pcapng')
+
+    def test_att(self):
+        'GATT operations are written as ATT PDUs in HCI ACL packets'
+        with PcapWriter(self.pcap) as writer:
+            writer.read('fff0', 'fff1', b'\x64', timestamp=5000000001)
+            writer.notification('fff0', 'fff4', b'\x01\x02', timestamp=5000000002)
+            writer.subscribe('fff0', 'fff4', True, timestamp=5000000003)
+            writer.write('fff0', 'fff1', b'\xff', withoutResponse=True, timestamp=5000000004)
+        packets = read_pcapng(self.pcap)
+        self.assertEqual(len(packets), 6)
+        timestamp, direction, packet, comment = packets[0]
+        self.assertEqual(timestamp, 5000000001)
+        self.assertEqual(direction, 1)
+        self.assertEqual(comment, 'fff0:fff1')
+        # H4 ACL, handle 0x40 (start), L2CAP ATT, read request on handle 0x11
+        self.assertEqual(packet, b'\x02\x40\x20\x07\x00\x03\x00\x04\x00\x0a\x11\x00')
+        self.assertEqual(packets[1][1:3], (0, b'\x02\x40\x20\x06\x00\x02\x00\x04\x00\x0b\x64'))
+        # Notification on the second characteristic, CCCD write
+        self.assertEqual(packets[2][2][9:], b'\x1b\x14\x00\x01\x02')
+        self.assertEqual(packets[3][2][9:], b'\x12\x15\x00\x01\x00')
+        self.assertEqual(packets[5][2][9:], b'\x52\x11\x00\xff')
+
+    def test_export(self):
+        'Captures are converted in bulk'
+        with CaptureWriter(self.capture) as writer:
+            writer.connect('11:22:33:44:55:66', timestamp=1)
+            writer.write('fff0', 'fff1', b'\x01', offset=4, timestamp=2)
+            writer.disconnect('11:22:33:44:55:66', timestamp=3)
+        self.assertEqual(export_pcap(self.capture, self.pcap), 4)
+        packets = read_pcapng(self.pcap)
+        self.assertEqual([packet[0] for packet in packets], [1, 2, 2, 3])
+        # LE connection complete with the client address
+        self.assertEqual(packets[0][2][:4], b'\x04\x3e\x13\x01')
+        self.assertEqual(packets[0][2][9:15], b'\x66\x55\x44\x33\x22\x11')
+        # Prepare write request with its offset
+        self.assertEqual(packets[1][2][9:], b'\x16\x11\x00\x04\x00\x01')
+        self.assertEqual(packets[3][2][:3], b'\x04\x05\x04')
+
+    def test_pcap(self):
+        'Classic PCAP files use nanosecond timestamps'
+        path = self.pcap[:-2]
+        with PcapWriter(path, 'pcap') as writer:
+            writer.notification('fff0', 'fff4', b'\x01', timestamp=5000000002)
+        with open(path, 'rb') as pcap:
+            data = pcap.read()
+        self.assertEqual(struct.unpack_from('<I', data)[0], 0xa1b23c4d)
+        self.assertEqual(struct.unpack_from('<I', data, 20)[0], 201)
+        self.assertEqual(struct.unpack_from('<IIII', data, 24), (5, 2, 17, 17))
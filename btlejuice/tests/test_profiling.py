@@ -0,0 +1,49 @@
+import os
+import time
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface, HookForceResponse
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.tests import temporary_directory
+
+
+class Hooks(HookingInterface):
+
+    def on_before_read(self, service, characteristic, offset):
+        raise HookForceResponse(b'\x64')
+
+
+class TestProfiling(TestCase):
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_profile(self):
+        'The dispatch thread is profiled per event type and hook'
+        path = os.path.join(temporary_directory(self), 'dispatch.prof')
+        transport = LoopbackTransport()
+        app = BtleJuiceApp(
+            Hooks('localhost', 8080, 'aa:bb:cc:dd:ee:ff'), transports=[transport])
+        app.daemon = True
+        app.start()
+        try:
+            app.start_profiling(path, seconds=60)
+            self.assertTrue(self.wait_for(lambda: app.profiler is not None))
+            for i in range(100):
+                transport.feed_event('proxy_read', '180f', '2a19', 0)
+            self.assertTrue(self.wait_for(lambda: len(transport.sent) >= 100))
+            app.stop_profiling()
+            self.assertTrue(self.wait_for(lambda: app.last_profile is not None))
+        finally:
+            app.cancel()
+            app.join()
+            app.client.disconnect()
+        self.assertTrue(os.path.exists(path))
+        with open(path + '.txt') as report:
+            report = report.read()
+        self.assertTrue('proxy_read' in report)
+        self.assertTrue('on_before_read' in report)
+        self.assertFalse('on_before_read' in app.interface.__dict__)
@@ -0,0 +1,72 @@
+import json
+import os
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.socketIO_client.exceptions import ConnectionError
+from btlejuice.tests import temporary_directory
+
+
+class TestFlightRecorder(TestCase):
+
+    def setUp(self):
+        self.directory = temporary_directory(self)
+        self.transport = LoopbackTransport()
+        self.app = BtleJuiceApp(
+            HookingInterface('localhost', 8080, 'aa:bb:cc:dd:ee:ff'),
+            transports=[self.transport], flight_recorder_size=8,
+            flight_recorder_directory=self.directory)
+
+    def tearDown(self):
+        self.app.client.disconnect()
+
+    def read_dump(self, path):
+        with open(path) as dump:
+            return [json.loads(line) for line in dump]
+
+    def test_ring_buffer(self):
+        'Only the last frames are kept, in both directions'
+        for i in range(20):
+            self.transport.feed_event('proxy_read', 'fff0', 'fff1', i)
+        self.transport.process()
+        path = self.app.client.dump_flight_recorder(
+            os.path.join(self.directory, 'dump.jsonl'))
+        header, frames = self.read_dump(path)[0], self.read_dump(path)[1:]
+        self.assertEqual(header['frames'], 8)
+        self.assertEqual(len(frames), 8)
+        self.assertEqual(
+            set(frame['direction'] for frame in frames), set(['sent', 'received']))
+        self.assertTrue(frames[-2]['data'].endswith('19]'))
+        times = [frame['monotonic'] for frame in frames]
+        self.assertEqual(times, sorted(times))
+
+    def test_dump_on_packet_error(self):
+        'Frames are dumped when a packet error occurs'
+        self.transport.feed_packet(9, 'garbage')
+        self.transport.process()
+        dumps = os.listdir(self.directory)
+        self.assertEqual(len(dumps), 1)
+        records = self.read_dump(os.path.join(self.directory, dumps[0]))
+        self.assertTrue(records[0]['reason'].startswith('packet error'))
+        self.assertEqual(records[-1]['data'], 'garbage')
+        # No new dump within the dump interval
+        self.transport.feed_packet(9, 'garbage')
+        self.transport.process()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_failed_send(self):
+        'Frames are recorded before they are sent'
+        def send_packet(engineIO_packet_type, engineIO_packet_data=''):
+            raise ConnectionError('disconnected')
+        self.transport.send_packet = send_packet
+        client = self.app.client
+        self.assertRaises(
+            ConnectionError, client._message, '2["failed"]', True)
+        self.assertRaises(ConnectionError, client._noop)
+        path = client.dump_flight_recorder(
+            os.path.join(self.directory, 'dump.jsonl'))
+        frames = self.read_dump(path)[1:]
+        self.assertEqual(
+            [(frame['type'], frame['data']) for frame in frames[-3:]],
+            [(4, '2["failed"]'), (4, '2["failed"]'), (6, '')])
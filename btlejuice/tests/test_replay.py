@@ -0,0 +1,111 @@
+import os
+import time
+from unittest import TestCase
+
+from btlejuice import BtleJuiceApp, HookingInterface
+from btlejuice.capture import CaptureInterface, CaptureReader, CaptureWriter, Replayer
+from btlejuice.mockcore import MockCore
+from btlejuice.socketIO_client import LoopbackTransport
+from btlejuice.tests import temporary_directory
+
+
+TARGET = 'aa:bb:cc:dd:ee:ff'
+
+
+class Hooks(HookingInterface):
+
+    def __init__(self, host, port, target):
+        HookingInterface.__init__(self, host, port, target)
+        self.notifications = []
+
+    def on_before_notification(self, service, characteristic, data):
+        self.notifications.append((service, characteristic, data))
+
+
+class TestReplay(TestCase):
+
+    def setUp(self):
+        directory = temporary_directory(self)
+        self.path = os.path.join(directory, 'capture.bjc')
+        self.replayed = os.path.join(directory, 'replayed.bjc')
+        with CaptureWriter(self.path) as writer:
+            writer.connect('11:22:33:44:55:66', timestamp=1000000000)
+            writer.read('fff0', 'fff1', b'\x01\x02', timestamp=1100000000)
+            writer.write('fff0', 'fff4', b'\xff', 2, True, timestamp=1200000000)
+            writer.write('fff0', 'fff4', b'\x10', timestamp=1250000000)
+            writer.subscribe('fff0', 'fff4', True, timestamp=1300000000)
+            writer.notification('fff0', 'fff4', b'\x03', timestamp=1400000000)
+            writer.disconnect('11:22:33:44:55:66', timestamp=1500000000)
+
+    def read(self, path):
+        with CaptureReader(path) as reader:
+            return [
+                (record.operation, record.service, record.characteristic,
+                 record.flags, bytes(record.data)) for record in reader]
+
+    def test_round_trip(self):
+        'Replaying a capture to a capture interface records the same operations'
+        transport = LoopbackTransport()
+        interface = CaptureInterface('localhost', 8080, TARGET, self.replayed)
+        app = BtleJuiceApp(interface, transports=[transport])
+        try:
+            stats = Replayer(self.path, speed=0).replay(app, transport)
+        finally:
+            app.client.disconnect()
+            interface.close()
+        self.assertEqual(stats['records'], 7)
+        self.assertEqual(self.read(self.replayed), self.read(self.path))
+
+    def test_responses(self):
+        'Interface responses are collected with the replayed record timestamps'
+        transport = LoopbackTransport()
+        interface = Hooks('localhost', 8080, TARGET)
+        app = BtleJuiceApp(interface, transports=[transport])
+        replayer = Replayer(self.path, speed=0, start=1100000000, end=1450000000)
+        try:
+            stats = replayer.replay(app, transport, collect=True)
+        finally:
+            app.client.disconnect()
+        self.assertEqual(stats['records'], 5)
+        self.assertIn(
+            (1100000000, ('proxy_read_resp', 'fff0', 'fff1', b'\x01\x02')),
+            replayer.emitted)
+        self.assertIn(
+            (1400000000, ('proxy_data', 'fff0', 'fff4', b'\x03')),
+            replayer.emitted)
+        self.assertEqual(
+            interface.notifications, [('fff0', 'fff4', b'\x03')])
+
+    def test_speed(self):
+        'Recorded timing is scaled by the replay speed'
+        replayer = Replayer(self.path, speed=2.0)
+        started = time.time()
+        self.assertEqual(len(list(replayer.timed_records())), 7)
+        # 0.5s recorded
+        self.assertGreaterEqual(time.time() - started, 0.24)
+
+    def test_mockcore(self):
+        'The core stand-in sends replayed events with recorded read values'
+        core = MockCore(port=0)
+        core.start()
+        try:
+            interface = Hooks('127.0.0.1', core.port, TARGET)
+            app = BtleJuiceApp(interface, transports=['websocket'])
+            app.daemon = True
+            app.start()
+            try:
+                self.assertTrue(core.wait_for_clients(1, timeout=5))
+                core.start_replay(self.path, speed=0)
+                self.assertTrue(core.wait_load(5))
+                deadline = time.time() + 5
+                while not interface.notifications and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                app.cancel()
+                app.join()
+                app.client.disconnect()
+        finally:
+            core.stop()
+        self.assertEqual(core.profile.read('fff0', 'fff1'), b'\x01\x02')
+        self.assertEqual(
+            interface.notifications, [('fff0', 'fff4', b'\x03')])
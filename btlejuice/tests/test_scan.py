@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from btlejuice.scan import ScanResults
+
+
+class TestScanResults(TestCase):
+
+    def setUp(self):
+        self.results = ScanResults(
+            addresses=['AA:BB:CC:DD:EE:FF'], names=['Thermo*', 'Lock'])
+        self.new_devices = []
+        self.results.subscribe(self.new_devices.append)
+
+    def test_coalesce(self):
+        'Repeated advertisements are coalesced per address'
+        self.results.update('11:22:33:44:55:66', 'x', -60)
+        entry = self.results.update('11:22:33:44:55:66', 'x', -80)
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(entry.count, 2)
+        self.assertEqual(entry.rssi, -65)
+        self.assertEqual(len(self.new_devices), 1)
+
+    def test_match_address(self):
+        'Target addresses are matched case-insensitively'
+        entry = self.results.update('aa:bb:cc:dd:ee:ff', None, -50)
+        self.assertTrue(entry.matched)
+        self.assertTrue('AA:BB:CC:DD:EE:FF' in self.results)
+
+    def test_match_names(self):
+        'Target names and name patterns are matched'
+        self.assertTrue(self.results.update('01', 'Lock', -50).matched)
+        self.assertTrue(self.results.update('02', 'Thermo 2', -50).matched)
+        self.assertFalse(self.results.update('03', 'Bulb', -50).matched)
+        self.assertEqual(len(self.results.matches()), 2)
+
+    def test_late_name(self):
+        'Names received in scan responses are matched'
+        self.assertFalse(self.results.update('01', None, -50).matched)
+        self.assertTrue(self.results.update('01', 'Lock', -50).matched)
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from btlejuice import HookingInterface, HookForceResponse
+from btlejuice.stats import LatencyHistogram
+
+
+class Namespace(object):
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, *args, **kw):
+        self.emitted.append((event,) + args)
+
+
+class TestLatencyHistogram(TestCase):
+
+    def test_percentiles(self):
+        'Percentiles are reported within the histogram precision'
+        histogram = LatencyHistogram()
+        for value in range(1, 100001):
+            histogram.record(value * 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100000)
+        self.assertEqual(summary['max'], 100000000)
+        self.assertAlmostEqual(summary['p50'], 50000000, delta=50000000 / 32)
+        self.assertAlmostEqual(summary['p99'], 99000000, delta=99000000 / 32)
+
+    def test_merge(self):
+        'Histograms can be merged'
+        a, b = LatencyHistogram(), LatencyHistogram()
+        a.record(10)
+        b.record(20000)
+        a.merge(b)
+        self.assertEqual((a.count, a.min, a.max), (2, 10, 20000))
+
+
+class TestHookStats(TestCase):
+
+    def test_hook_stats(self):
+        'Hook execution times are recorded per characteristic'
+        class Hooks(HookingInterface):
+            def on_before_write(self, service, characteristic, data, offset, withoutResponse):
+                raise HookForceResponse()
+        interface = Hooks('localhost', 8080, 'aa:bb:cc:dd:ee:ff')
+        interface.set_namespace(Namespace())
+        self.assertEqual(interface.stats(), {})
+        interface.enable_stats()
+        interface.write_request('180f', '2a19', b'\x00', 0, False)
+        interface.read_request('180f', '2a19', 0)
+        stats = interface.stats()
+        self.assertEqual(stats[('on_before_write', '180f', '2a19')]['count'], 1)
+        self.assertEqual(stats[('on_before_read', '180f', '2a19')]['count'], 1)
+        interface.disable_stats()
+        self.assertFalse('on_before_write' in interface.__dict__)
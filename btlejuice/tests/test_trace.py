@@ -0,0 +1,82 @@
+import json
+import os
+from unittest import TestCase
+
+from btlejuice import HookingInterface, HookForceResponse
+from btlejuice.tests import temporary_directory
+
+
+class Namespace(object):
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, *args, **kw):
+        self.emitted.append((event,) + args)
+
+
+class Hooks(HookingInterface):
+
+    def on_before_read(self, service, characteristic, offset):
+        if service == 'ffff':
+            raise ValueError('hook failure')
+
+    def on_before_notification(self, service, characteristic, data):
+        if data == b'\x00':
+            raise HookForceResponse()
+
+
+class TestTracing(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temporary_directory(self), 'trace.json')
+        self.interface = Hooks('localhost', 8080, 'aa:bb:cc:dd:ee:ff')
+        self.interface.set_namespace(Namespace())
+
+    def events(self):
+        with open(self.path) as trace:
+            return json.load(trace)
+
+    def test_trace(self):
+        'GATT transactions are written in the Trace Event format'
+        interface = self.interface
+        interface.enable_stats()
+        interface.enable_tracing(self.path)
+        interface.read_request('180f', '2a19', 0)
+        interface.read_response('180f', '2a19', b'\x64')
+        interface.write_request('180f', '2a19', b'\x00', 0, True)
+        interface.disable_tracing()
+        spans = dict((e['name'], e) for e in self.events() if e['ph'] == 'X')
+        self.assertTrue('core_rtt_us' in spans['read']['args'])
+        self.assertTrue('on_before_read' in spans)
+        self.assertTrue('on_after_read' in spans)
+        self.assertTrue('write' in spans)
+        self.assertEqual(
+            interface.stats()[('on_before_read', '180f', '2a19')]['count'], 1)
+
+    def test_dropped_notification(self):
+        'Notifications dropped by a hook do not shift the next transactions'
+        interface = self.interface
+        interface.enable_tracing(self.path)
+        interface.update_data('fff0', 'fff4', b'\x00')
+        interface.update_data('fff0', 'fff4', b'\x01')
+        self.assertFalse(any(interface._tracer._pending.values()))
+        interface.disable_tracing()
+        events = [e for e in self.events() if e['ph'] == 'X']
+        notifications = [e for e in events if e['name'] == 'notification']
+        hooks = [e for e in events if e['name'] == 'on_before_notification']
+        self.assertEqual(len(notifications), 2)
+        self.assertTrue(notifications[0]['args']['dropped'])
+        self.assertFalse('dropped' in notifications[1]['args'])
+        self.assertEqual(
+            notifications[1]['args']['hook_us'], hooks[1]['dur'])
+
+    def test_failed_request(self):
+        'Requests failing in a hook are closed'
+        interface = self.interface
+        interface.enable_tracing(self.path)
+        self.assertRaises(ValueError, interface.read_request, 'ffff', '2a19', 0)
+        self.assertFalse(any(interface._tracer._pending.values()))
+        interface.disable_tracing()
+        reads = [e for e in self.events() if e['name'] == 'read']
+        self.assertTrue(reads[0]['args']['dropped'])
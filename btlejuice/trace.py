@@ -0,0 +1,255 @@
+"""
+BtleJuice GATT transaction tracing
+"""
+import json
+import os
+import threading
+from collections import deque
+
+from btlejuice.stats import perf_counter_ns
+
+
+# Interface methods traced for each GATT operation: (method, stage, operation)
+TRACED_STAGES = (
+    ('read_request', 'begin', 'read'),
+    ('device_read', 'forward', 'read'),
+    ('read_response', 'respond', 'read'),
+    ('proxy_read_resp', 'end', 'read'),
+    ('write_request', 'begin', 'write'),
+    ('device_write', 'forward', 'write'),
+    ('write_response', 'respond', 'write'),
+    ('proxy_write_resp', 'end', 'write'),
+    ('notify_request', 'begin', 'subscribe'),
+    ('device_notify', 'forward', 'subscribe'),
+    ('notify_response', 'respond', 'subscribe'),
+    ('proxy_notify_resp', 'end', 'subscribe'),
+    ('update_data', 'begin', 'notification'),
+    ('proxy_notify_data', 'end', 'notification'),
+)
+
+# GATT operation each hook belongs to.
+HOOK_OPERATIONS = {
+    'on_before_read': 'read',
+    'on_after_read': 'read',
+    'on_data_read': 'read',
+    'on_before_write': 'write',
+    'on_data_write': 'write',
+    'on_before_subscribe': 'subscribe',
+    'on_subscribe_notification': 'subscribe',
+    'on_before_notification': 'notification',
+    'on_notification_data': 'notification',
+}
+
+# Maximum number of pending transactions per characteristic and operation.
+MAX_PENDING = 16
+
+
+class GattTransaction(object):
+    """
+    A proxied GATT operation, from the core request to our response.
+    """
+
+    __slots__ = (
+        'operation', 'service', 'characteristic', 'started', 'hooks',
+        'forwarded', 'responded'
+    )
+
+    def __init__(self, operation, service, characteristic, started):
+        self.operation = operation
+        self.service = service
+        self.characteristic = characteristic
+        self.started = started
+        self.hooks = []
+        self.forwarded = None
+        self.responded = None
+
+
+class GattTracer(object):
+    """
+    GATT transaction tracer.
+
+    Each transaction is split into hook time (our callbacks), core round-trip
+    time (from the request forwarded to the device to its response) and an
+    estimated device time (core round-trip minus the transport round-trip
+    returned by `rtt`, in seconds). Transactions are written in the Trace
+    Event format (JSON array), which can be loaded in chrome://tracing or
+    Perfetto. Each characteristic gets its own track.
+    """
+
+    def __init__(self, path, rtt=None):
+        self._file = open(path, 'w')
+        self._file.write('[\n')
+        self._separator = ''
+        self._rtt = rtt
+        self._origin = perf_counter_ns()
+        self._pid = os.getpid()
+        self._pending = {}
+        self._tracks = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, stage, operation, method):
+        """
+        Wrap an interface method to record a transaction stage.
+        """
+        if stage == 'end':
+            def traced(service, characteristic, *args, **kwargs):
+                try:
+                    return method(service, characteristic, *args, **kwargs)
+                finally:
+                    self.end(operation, service, characteristic)
+        elif stage == 'begin':
+            # Transactions not ended by the time a notification is handled
+            # (dropped by a hook) or a request fails are closed here.
+            def traced(service, characteristic, *args, **kwargs):
+                transaction = self.begin(operation, service, characteristic)
+                try:
+                    result = method(service, characteristic, *args, **kwargs)
+                except Exception:
+                    self.drop(transaction)
+                    raise
+                if operation == 'notification':
+                    self.drop(transaction)
+                return result
+        elif stage == 'forward' and operation == 'write':
+            def traced(service, characteristic, *args, **kwargs):
+                self.forward(operation, service, characteristic)
+                result = method(service, characteristic, *args, **kwargs)
+                if kwargs.get('withoutResponse', len(args) > 2 and args[2]):
+                    # No response expected from the device.
+                    self.respond(operation, service, characteristic)
+                    self.end(operation, service, characteristic)
+                return result
+        else:
+            record = getattr(self, stage)
+            def traced(service, characteristic, *args, **kwargs):
+                record(operation, service, characteristic)
+                return method(service, characteristic, *args, **kwargs)
+        return traced
+
+    def begin(self, operation, service, characteristic):
+        transaction = GattTransaction(
+            operation, service, characteristic, perf_counter_ns())
+        key = (operation, service, characteristic)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = deque(maxlen=MAX_PENDING)
+            pending.append(transaction)
+        return transaction
+
+    def hook(self, hook, service, characteristic, started, elapsed,
+             error=None):
+        transaction = self._current(
+            HOOK_OPERATIONS.get(hook), service, characteristic)
+        if transaction is not None:
+            transaction.hooks.append((hook, started, elapsed))
+
+    def forward(self, operation, service, characteristic):
+        transaction = self._current(operation, service, characteristic)
+        if transaction is not None and transaction.forwarded is None:
+            transaction.forwarded = perf_counter_ns()
+
+    def respond(self, operation, service, characteristic):
+        transaction = self._current(operation, service, characteristic)
+        if transaction is not None and transaction.responded is None:
+            transaction.responded = perf_counter_ns()
+
+    def end(self, operation, service, characteristic):
+        ended = perf_counter_ns()
+        with self._lock:
+            pending = self._pending.get((operation, service, characteristic))
+            if not pending:
+                return
+            transaction = pending.popleft()
+            self._write_transaction(transaction, ended)
+
+    def drop(self, transaction):
+        """
+        Close a transaction that did not reach its end stage, if pending.
+        """
+        ended = perf_counter_ns()
+        key = (
+            transaction.operation, transaction.service,
+            transaction.characteristic)
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending or transaction not in pending:
+                return
+            pending.remove(transaction)
+            self._write_transaction(transaction, ended, dropped=True)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write('\n]\n')
+            self._file.close()
+
+    def _current(self, operation, service, characteristic):
+        with self._lock:
+            pending = self._pending.get((operation, service, characteristic))
+            if pending:
+                return pending[0]
+        return None
+
+    def _track(self, service, characteristic):
+        key = (service, characteristic)
+        track = self._tracks.get(key)
+        if track is None:
+            track = self._tracks[key] = len(self._tracks) + 1
+            self._write_event({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': self._pid,
+                'tid': track,
+                'args': {'name': '%s/%s' % (service, characteristic)},
+            })
+        return track
+
+    def _span(self, name, category, track, started, ended, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'pid': self._pid,
+            'tid': track,
+            'ts': (started - self._origin) / 1000.0,
+            'dur': (ended - started) / 1000.0,
+        }
+        if args:
+            event['args'] = args
+        self._write_event(event)
+
+    def _write_transaction(self, transaction, ended, dropped=False):
+        if self._file.closed:
+            return
+        track = self._track(transaction.service, transaction.characteristic)
+        hook_time = sum(elapsed for hook, started, elapsed in transaction.hooks)
+        args = {
+            'service': transaction.service,
+            'characteristic': transaction.characteristic,
+            'hook_us': hook_time / 1000.0,
+            'forwarded': transaction.forwarded is not None,
+        }
+        if dropped:
+            args['dropped'] = True
+        if transaction.forwarded is not None and transaction.responded is not None:
+            core_rtt = transaction.responded - transaction.forwarded
+            args['core_rtt_us'] = core_rtt / 1000.0
+            rtt = self._rtt() if self._rtt is not None else None
+            if rtt is not None:
+                args['transport_rtt_us'] = rtt * 1000000.0
+                args['device_us'] = max(0.0, core_rtt / 1000.0 - rtt * 1000000.0)
+        self._span(
+            transaction.operation, 'gatt', track, transaction.started, ended,
+            args)
+        if transaction.forwarded is not None and transaction.responded is not None:
+            self._span(
+                'core round-trip', 'core', track, transaction.forwarded,
+                transaction.responded)
+        for hook, started, elapsed in transaction.hooks:
+            self._span(hook, 'hook', track, started, started + elapsed)
+
+    def _write_event(self, event):
+        self._file.write(self._separator + json.dumps(event))
+        self._separator = ',\n'
@@ -7,10 +7,9 @@ setup(
     author='Damien Cauquil',
     author_email='damien.cauquil@digitalsecurity.fr',
     license='MIT',
-    packages=['btlejuice','btlejuice.socketIO_client'],
+    packages=['btlejuice','btlejuice.socketIO_client','btlejuice.mockcore','btlejuice.capture'],
     url='https://github.com/DigitalSecurity/btlejuice-python-bindings',
     install_requires=[
-        'six',
         'websocket'
     ]
 )